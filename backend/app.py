@@ -3,22 +3,35 @@ Flask 後端主應用程式
 提供 REST API 端點
 """
 
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+import json
 import requests
 import sys
+import time
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backend.config import BackendConfig
-from backend.models import AccidentModel, DeviceModel
-from backend.auth import admin_required, login
+from backend.models import AccidentModel, DeviceModel, accident_version, db, parse_timestamp
+from backend.auth import admin_required, api_token_required, login, revoke_tokens
+from backend.blob_store import get_blob_store
+from backend.cache import get_cache
+from backend.events import hub, start_change_stream
+from backend.video_relay import MIMETYPE as VIDEO_MIMETYPE, relay_hub, fetch_snapshot
+from backend.device_registry import registry, normalize_stream_url
+from backend.json_codec import FastJSONProvider, dumps, iter_json_object
 
 app = Flask(__name__)
+# jsonify 使用 orjson（未安裝時為標準 json），ObjectId / datetime 在序列化時轉換
+app.json = FastJSONProvider(app)
 config = BackendConfig()
 
 # 設定 CORS
-CORS(app, origins=config.CORS_ORIGINS)
+CORS(app, origins=config.CORS_ORIGINS, expose_headers=['ETag', 'X-Frame-Age'])
+
+# 事件來源為 change stream 時啟動監聽
+start_change_stream(db.db)
 
 # 全域錯誤處理器
 @app.errorhandler(Exception)
@@ -67,11 +80,64 @@ def api_login():
         traceback.print_exc()
         return jsonify({'error': f'登入處理失敗: {str(e)}'}), 500
 
+@app.route('/api/revoke_tokens', methods=['POST'])
+@admin_required
+def api_revoke_tokens():
+    """
+    撤銷所有已發出的管理員 Token（包含本次請求使用的 Token，需重新登入）
+    
+    Returns:
+        {
+            "message": "所有 Token 已撤銷",
+            "token_version": 2
+        }
+    """
+    try:
+        version = revoke_tokens()
+        return jsonify({
+            'message': '所有 Token 已撤銷',
+            'token_version': version
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'撤銷 Token 失敗: {str(e)}'}), 500
+
+def accident_metadata_from_form(values: dict) -> dict:
+    """
+    將表單或查詢字串的事故欄位轉為與 JSON 相同的型別
+    
+    Args:
+        values: 欄位字串
+    
+    Returns:
+        dict: 事故資料
+    
+    Raises:
+        ValueError: 數值欄位無法轉換
+    """
+    data = dict(values)
+    for field in ('latitude', 'longitude', 'timestamp'):
+        if field in data:
+            try:
+                data[field] = float(data[field])
+            except ValueError:
+                raise ValueError(f'{field} 必須是數字')
+    if 'has_injured' in data:
+        data['has_injured'] = str(data['has_injured']).lower() in ('true', '1', 'yes')
+    return data
+
 @app.route('/api/report_accident', methods=['POST'])
+@api_token_required
 def api_report_accident():
     """
     車子上報事故
     
+    支援三種格式：
+    - application/json：影像以 base64 放在 image 欄位（舊版車載端）
+    - multipart/form-data：metadata 欄位為事故 JSON，image 檔案欄位可重複（多張關鍵幀）
+    - image/jpeg 或 image/png：請求本體為單張影像，事故欄位放在查詢字串
+    
+    上傳的影像直接串流寫入影像儲存，不經 base64 與 JSON 解析。
+    
     Request Body:
         {
             "latitude": 25.0330,
@@ -87,7 +153,30 @@ def api_report_accident():
             "message": "事故已記錄"
         }
     """
-    data = request.get_json()
+    images = []
+    try:
+        if request.mimetype == 'multipart/form-data':
+            if 'metadata' in request.form:
+                data = json.loads(request.form['metadata'])
+            else:
+                data = accident_metadata_from_form(request.form.to_dict())
+            uploads = request.files.getlist('image')
+            if len(uploads) > config.ACCIDENT_MAX_IMAGES:
+                return jsonify({'error': f'影像最多 {config.ACCIDENT_MAX_IMAGES} 張'}), 400
+            for upload in uploads:
+                images.append(AccidentModel.store_image_stream(upload.stream, config.ACCIDENT_IMAGE_MAX_BYTES))
+        elif request.mimetype in ('image/jpeg', 'image/png'):
+            data = accident_metadata_from_form(request.args.to_dict())
+            images.append(AccidentModel.store_image_stream(request.stream, config.ACCIDENT_IMAGE_MAX_BYTES))
+        else:
+            data = request.get_json()
+    except json.JSONDecodeError:
+        return jsonify({'error': 'metadata 不是合法的 JSON'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not isinstance(data, dict):
+        return jsonify({'error': '缺少事故資料'}), 400
     
     # 驗證必要欄位
     required_fields = ['latitude', 'longitude']
@@ -96,18 +185,21 @@ def api_report_accident():
             return jsonify({'error': f'缺少必要欄位: {field}'}), 400
     
     try:
-        accident_id = AccidentModel.create(data)
+        accident_id = AccidentModel.create(data, images)
         return jsonify({
             'accident_id': accident_id,
             'message': '事故已記錄'
         }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'建立事故記錄失敗: {str(e)}'}), 500
 
 @app.route('/api/update_device', methods=['POST'])
+@api_token_required
 def api_update_device():
     """
-    更新車輛位置
+    更新車輛位置（單筆或車載端上行佇列的批次）
     
     Request Body:
         {
@@ -115,34 +207,208 @@ def api_update_device():
             "latitude": 25.0330,
             "longitude": 121.5654
         }
+        或批次（依時間排序）
+        {
+            "positions": [
+                {"device_id": "vehicle_001", "latitude": 25.0330, "longitude": 121.5654, "timestamp": 1234567890.5},
+                ...
+            ]
+        }
     
     Returns:
         {
-            "message": "裝置位置已更新"
+            "message": "裝置位置已更新",
+            "count": 1
         }
     """
     data = request.get_json()
     
-    if 'device_id' not in data or 'latitude' not in data or 'longitude' not in data:
-        return jsonify({'error': '缺少必要欄位'}), 400
+    positions = data.get('positions') if isinstance(data, dict) else None
+    if positions is None:
+        positions = [data]
+    if not isinstance(positions, list) or len(positions) > config.DEVICE_BATCH_MAX:
+        return jsonify({'error': f'positions 必須是最多 {config.DEVICE_BATCH_MAX} 筆的陣列'}), 400
+    for position in positions:
+        if not isinstance(position, dict) or 'device_id' not in position \
+                or 'latitude' not in position or 'longitude' not in position:
+            return jsonify({'error': '缺少必要欄位'}), 400
     
     try:
-        DeviceModel.update_position(
-            data['device_id'],
-            data['latitude'],
-            data['longitude']
-        )
-        return jsonify({'message': '裝置位置已更新'}), 200
+        # 全部通過檢查後才寫入，批次中任一筆無效時不會只套用一部分
+        parsed = [
+            DeviceModel.parse_position(
+                position['device_id'],
+                position['latitude'],
+                position['longitude'],
+                position.get('timestamp')
+            )
+            for position in positions
+        ]
+        for device_id, latitude, longitude, timestamp in parsed:
+            DeviceModel.update_position(device_id, latitude, longitude, timestamp)
+        return jsonify({'message': '裝置位置已更新', 'count': len(positions)}), 200
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'無效的位置資料: {str(e)}'}), 400
     except Exception as e:
         return jsonify({'error': f'更新裝置位置失敗: {str(e)}'}), 500
 
+@app.route('/api/device_heartbeat', methods=['POST'])
+@api_token_required
+def api_device_heartbeat():
+    """
+    車載端心跳與影像串流位址註冊
+    
+    Request Body:
+        {
+            "device_id": "vehicle_001",
+            "stream_url": "http://10.0.0.5:8080",
+            "stream_port": 8080
+        }
+        stream_url 與 stream_port 擇一（皆選填）；只提供 stream_port 時以請求來源位址組成 stream_url
+        未設定 API_TOKEN 且未設定 DEVICE_STREAM_NETWORKS 時拒絕註冊位址（403）
+    
+    Returns:
+        {
+            "message": "心跳已記錄",
+            "device_id": "vehicle_001",
+            "stream_url": "http://10.0.0.5:8080",
+            "heartbeat_at": 1234567890.123
+        }
+    """
+    data = request.get_json(silent=True)
+    
+    if not isinstance(data, dict) or not data.get('device_id'):
+        return jsonify({'error': '缺少必要欄位: device_id'}), 400
+    
+    try:
+        stream_url = data.get('stream_url')
+        if not stream_url and data.get('stream_port'):
+            port = int(data['stream_port'])
+            if not 0 < port < 65536:
+                raise ValueError('stream_port 必須介於 1 到 65535')
+            stream_url = f'http://{request.remote_addr}:{port}'
+        if stream_url:
+            stream_url = normalize_stream_url(stream_url)
+            if not registry.stream_url_allowed(stream_url):
+                return jsonify({'error': '不接受此影像串流位址（需設定 API_TOKEN，或位址須在 DEVICE_STREAM_NETWORKS 內）'}), 403
+        
+        heartbeat_at = registry.heartbeat(data['device_id'], stream_url)
+        return jsonify({
+            'message': '心跳已記錄',
+            'device_id': data['device_id'],
+            'stream_url': stream_url,
+            'heartbeat_at': heartbeat_at.timestamp()
+        }), 200
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'記錄心跳失敗: {str(e)}'}), 500
+
+@app.route('/api/devices', methods=['GET'])
+def api_devices():
+    """
+    取得所有裝置的位置、上線狀態與影像轉送狀態（不公開車載端內部位址）
+    
+    Returns:
+        {
+            "devices": [
+                {
+                    "device_id": "vehicle_001",
+                    "latitude": 25.0330,
+                    "longitude": 121.5654,
+                    "heartbeat_at": 1234567890.123,
+                    "online": true,
+                    "streams": {"raw": {"viewers": 2, "frames": 1200, "error": null, ...}}
+                }
+            ]
+        }
+    """
+    try:
+        devices = registry.status(DeviceModel.get_all(), relay_hub.stats())
+        return jsonify({'devices': devices}), 200
+    except Exception as e:
+        return jsonify({'error': f'取得裝置列表失敗: {str(e)}'}), 500
+
+@app.route('/api/device_track/<device_id>', methods=['GET'])
+def api_device_track(device_id):
+    """
+    取得裝置歷史軌跡（伺服器端降採樣）
+    
+    Query Parameters:
+        start: 開始時間 Unix 時間戳 (預設: 一小時前)
+        end: 結束時間 Unix 時間戳 (預設: 現在)
+        method: dp（Douglas-Peucker，預設）或 bucket（固定時間桶）
+        max_points: 最多點數 (預設: 500，上限 TRACK_MAX_POINTS)
+        tolerance: dp 允許偏離距離，公尺 (預設: 5)
+    
+    Returns:
+        {
+            "device_id": "vehicle_001",
+            "method": "dp",
+            "raw_points": 3600,
+            "points": [[1700000000.0, 25.0330, 121.5654], ...]
+        }
+    """
+    try:
+        end = float(request.args.get('end', time.time()))
+        start = float(request.args.get('start', end - 3600))
+        method = request.args.get('method', 'dp')
+        max_points = min(int(request.args.get('max_points', 500)), config.TRACK_MAX_POINTS)
+        tolerance = float(request.args.get('tolerance', 5.0))
+    except ValueError:
+        return jsonify({'error': 'start / end / max_points / tolerance 必須是數字'}), 400
+    
+    try:
+        track = DeviceModel.get_track(
+            device_id,
+            parse_timestamp(start, 'start'),
+            parse_timestamp(end, 'end'),
+            method=method,
+            max_points=max_points,
+            tolerance=tolerance
+        )
+        track['method'] = method
+        return jsonify(track), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'取得裝置軌跡失敗: {str(e)}'}), 500
+    
+def cached_json_response(key: str, producer) -> Response:
+    """
+    讀穿快取產生 JSON 回應
+    
+    Args:
+        key: 快取鍵
+        producer: 未命中時產生 JSON 位元組的函式
+    
+    Returns:
+        Response: 帶 X-Cache: HIT/MISS 的回應
+    """
+    cache = get_cache()
+    body = cache.get(key)
+    hit = body is not None
+    if not hit:
+        body = producer()
+        cache.set(key, body)
+    response = Response(body, mimetype='application/json')
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
 @app.route('/api/get_accidents', methods=['GET'])
 def api_get_accidents():
     """
-    一般使用者取得事故列表
+    一般使用者取得事故列表（游標分頁，由新到舊）或增量變動
+    
+    回應帶有集合版本號 ETag，帶 If-None-Match 且集合未變動時
+    直接回傳 304，不查詢資料庫。
     
     Query Parameters:
         active_only: true/false (預設: true)
+        fields: 以逗號分隔的回傳欄位 (預設: 全部，不含影像)
+        limit: 每頁筆數 (預設: ACCIDENT_PAGE_SIZE，上限 ACCIDENT_PAGE_MAX)
+        cursor: 上一頁回傳的 next_cursor
+        since: 上次回應的 since，提供時只回傳之後的變動
     
     Returns:
         {
@@ -156,17 +422,218 @@ def api_get_accidents():
                     "status": "active"
                 },
                 ...
-            ]
+            ],
+            "next_cursor": "..." 或 null,
+            "since": 1234567890.123
+        }
+        提供 since 時：
+        {
+            "changes": [...],
+            "deleted": ["accident_id", ...],
+            "reset": false,
+            "since": 1234567890.123
         }
     """
+    version = accident_version.current()
+    etag = str(version) if version is not None else None
+    if etag and etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
     active_only = request.args.get('active_only', 'true').lower() == 'true'
+    fields = request.args.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+    cursor = request.args.get('cursor')
     
     try:
-        accidents = AccidentModel.get_all(active_only=active_only)
-        return jsonify({'accidents': accidents}), 200
+        limit = int(request.args.get('limit', config.ACCIDENT_PAGE_SIZE))
+        since = float(request.args['since']) if request.args.get('since') else None
+    except ValueError:
+        return jsonify({'error': 'limit 與 since 必須是數字'}), 400
+    limit = min(limit, config.ACCIDENT_PAGE_MAX)
+    
+    def load_page() -> bytes:
+        query_start = time.time()
+        accidents, next_cursor = AccidentModel.get_page(
+            active_only=active_only,
+            fields=fields,
+            limit=limit,
+            cursor=cursor
+        )
+        body = {'accidents': accidents, 'next_cursor': next_cursor, 'since': query_start}
+        return dumps(body)
+    
+    try:
+        if since is not None:
+            response = jsonify(AccidentModel.get_changes(since, active_only=active_only, fields=fields))
+        elif etag:
+            # 以集合版本號為鍵快取序列化後的列表，寫入後自動失效
+            key = f'accidents:{etag}:list:{active_only}:{",".join(fields or [])}:{limit}:{cursor or ""}'
+            response = cached_json_response(key, load_page)
+        else:
+            response = Response(load_page(), mimetype='application/json')
+        
+        if etag:
+            response.set_etag(etag)
+        return response, 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'取得事故列表失敗: {str(e)}'}), 500
 
+@app.route('/api/get_accidents_in_bbox', methods=['GET'])
+def api_get_accidents_in_bbox():
+    """
+    取得地圖可視範圍內的事故
+    
+    Query Parameters:
+        bbox: 西界經度,南界緯度,東界經度,北界緯度 (必要)
+        zoom: 地圖縮放等級，不大於 GEO_CLUSTER_MAX_ZOOM 時回傳聚合結果
+        active_only: true/false (預設: true)
+        limit: 最多筆數 (預設/上限: GEO_MAX_RESULTS)
+    
+    Returns:
+        {
+            "accidents": [{"_id": ..., "latitude": ..., "longitude": ..., ...}]
+        }
+        或聚合結果
+        {
+            "clusters": [{"latitude": ..., "longitude": ..., "count": 12, "injured": 3, "accident_id": null}]
+        }
+    """
+    active_only = request.args.get('active_only', 'true').lower() == 'true'
+    
+    try:
+        min_lon, min_lat, max_lon, max_lat = [float(v) for v in request.args.get('bbox', '').split(',')]
+        zoom = request.args.get('zoom')
+        zoom = int(zoom) if zoom is not None else None
+        limit = min(int(request.args.get('limit', config.GEO_MAX_RESULTS)), config.GEO_MAX_RESULTS)
+    except ValueError:
+        return jsonify({'error': 'bbox 格式應為 西界經度,南界緯度,東界經度,北界緯度'}), 400
+    
+    try:
+        if zoom is not None and zoom <= config.GEO_CLUSTER_MAX_ZOOM:
+            clusters = AccidentModel.get_clusters(min_lon, min_lat, max_lon, max_lat, zoom, active_only)
+            return jsonify({'clusters': clusters}), 200
+        accidents = AccidentModel.find_in_bbox(min_lon, min_lat, max_lon, max_lat, active_only, limit)
+        return jsonify({'accidents': accidents}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'取得範圍內事故失敗: {str(e)}'}), 500
+
+@app.route('/api/get_nearby_accidents', methods=['GET'])
+def api_get_nearby_accidents():
+    """
+    取得指定位置附近的事故（依距離由近到遠）
+    
+    Query Parameters:
+        latitude: 中心緯度 (必要)
+        longitude: 中心經度 (必要)
+        radius: 半徑公尺 (預設: 1000，上限 GEO_MAX_RADIUS)
+        active_only: true/false (預設: true)
+        limit: 最多筆數 (預設: 100，上限 GEO_MAX_RESULTS)
+    
+    Returns:
+        {
+            "accidents": [{"_id": ..., "latitude": ..., "longitude": ..., ...}]
+        }
+    """
+    active_only = request.args.get('active_only', 'true').lower() == 'true'
+    
+    try:
+        latitude = float(request.args['latitude'])
+        longitude = float(request.args['longitude'])
+        radius = min(float(request.args.get('radius', 1000)), config.GEO_MAX_RADIUS)
+        limit = min(int(request.args.get('limit', 100)), config.GEO_MAX_RESULTS)
+    except (KeyError, ValueError):
+        return jsonify({'error': '缺少或無效的 latitude / longitude / radius'}), 400
+    
+    try:
+        accidents = AccidentModel.find_near(latitude, longitude, radius, active_only, limit)
+        return jsonify({'accidents': accidents}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'取得附近事故失敗: {str(e)}'}), 500
+
+@app.route('/api/get_accident/<accident_id>', methods=['GET'])
+def api_get_accident(accident_id):
+    """
+    取得單筆事故
+    
+    Returns:
+        {
+            "accident": {"_id": ..., "latitude": ..., ...}
+        }
+    """
+    version = accident_version.current()
+    etag = str(version) if version is not None else None
+    if etag and etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
+    try:
+        def load_accident() -> bytes:
+            return dumps(AccidentModel.get_by_id(accident_id))
+        
+        # 不存在的 ID 也會快取為 null，直到下一次寫入
+        if etag:
+            accident = get_cache().get_or_set(f'accidents:{etag}:id:{accident_id}', load_accident)
+        else:
+            accident = load_accident()
+        
+        if accident == b'null':
+            return jsonify({'error': '事故不存在'}), 404
+        response = Response(b'{"accident": ' + accident + b'}', mimetype='application/json')
+        if etag:
+            response.set_etag(etag)
+        return response, 200
+    except Exception as e:
+        return jsonify({'error': f'取得事故失敗: {str(e)}'}), 500
+
+@app.route('/api/accident_image/<accident_id>', methods=['GET'])
+def api_accident_image(accident_id):
+    """
+    取得事故影像
+    
+    影像以內容雜湊作為強 ETag，內容永不變動，可長期快取；
+    帶 If-None-Match 的請求在讀取影像前即回傳 304。
+    
+    Query Parameters:
+        index: 第幾張關鍵幀 (預設: 0)
+    
+    Returns:
+        影像位元組（image/jpeg）
+    """
+    try:
+        index = int(request.args.get('index', 0))
+    except ValueError:
+        return jsonify({'error': 'index 必須是整數'}), 400
+    
+    try:
+        meta = AccidentModel.get_image_meta(accident_id, max(index, 0))
+        if not meta:
+            return jsonify({'error': '事故影像不存在'}), 404
+        
+        cache_headers = {'Cache-Control': 'public, max-age=31536000, immutable'}
+        if meta['image_hash'] in request.if_none_match:
+            response = Response(status=304, headers=cache_headers)
+            response.set_etag(meta['image_hash'])
+            return response
+        
+        data = get_blob_store().get(meta['image_hash'])
+        if data is None:
+            return jsonify({'error': '事故影像不存在'}), 404
+        
+        response = Response(data, mimetype=meta['image_type'], headers=cache_headers)
+        response.set_etag(meta['image_hash'])
+        return response
+    except Exception as e:
+        return jsonify({'error': f'取得事故影像失敗: {str(e)}'}), 500
+
 @app.route('/api/delete_accident/<accident_id>', methods=['DELETE'])
 @admin_required
 def api_delete_accident(accident_id):
@@ -209,6 +676,103 @@ def api_clear_accidents():
     except Exception as e:
         return jsonify({'error': f'清除事故列表失敗: {str(e)}'}), 500
 
+@app.route('/api/bulk_accidents', methods=['POST'])
+@admin_required
+def api_bulk_accidents():
+    """
+    管理員批次處理事故（依 ID 列表或篩選條件，一次 update_many / delete_many）
+    
+    Request Body:
+        {
+            "action": "resolve",
+            "ids": ["...", "..."],
+            "filter": {
+                "status": "active",
+                "start": 1234560000,
+                "end": 1234567890,
+                "device_id": "vehicle_001",
+                "bbox": [121.5, 25.0, 121.6, 25.1]
+            },
+            "dry_run": false
+        }
+        action: resolve（標記為已解決）、reopen（改回 active）、delete（刪除）、
+                archive（將已解決的事故搬到封存集合）
+        ids 與 filter 至少提供一項，同時提供時取交集
+    
+    Returns:
+        {
+            "action": "resolve",
+            "matched": 120,
+            "affected": 118,
+            "message": "批次處理完成"
+        }
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': '缺少批次處理資料'}), 400
+    
+    action = data.get('action')
+    if action not in ('resolve', 'reopen', 'delete', 'archive'):
+        return jsonify({'error': 'action 必須是 resolve、reopen、delete 或 archive'}), 400
+    ids = data.get('ids')
+    if isinstance(ids, list) and len(ids) > config.BULK_MAX_IDS:
+        return jsonify({'error': f'ids 最多 {config.BULK_MAX_IDS} 筆'}), 400
+    
+    try:
+        query = AccidentModel.bulk_query(ids, data.get('filter'))
+        # 封存只處理已解決的事故
+        matched = AccidentModel.count({'$and': [query, {'status': 'resolved'}]} if action == 'archive' else query)
+        if data.get('dry_run'):
+            return jsonify({'action': action, 'matched': matched, 'affected': 0, 'dry_run': True}), 200
+        
+        if action == 'resolve':
+            affected = AccidentModel.bulk_set_status(query, 'resolved', config.BULK_BATCH_SIZE)
+        elif action == 'reopen':
+            affected = AccidentModel.bulk_set_status(query, 'active', config.BULK_BATCH_SIZE)
+        elif action == 'delete':
+            affected = AccidentModel.bulk_delete(query, config.BULK_BATCH_SIZE)
+        else:
+            affected = AccidentModel.archive(query, config.BULK_BATCH_SIZE)
+        
+        return jsonify({
+            'action': action,
+            'matched': matched,
+            'affected': affected,
+            'message': '批次處理完成'
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'批次處理事故失敗: {str(e)}'}), 500
+
+@app.route('/api/export_accidents', methods=['GET'])
+@admin_required
+def api_export_accidents():
+    """
+    管理員匯出全部事故（分段串流的 JSON，不在記憶體中組出完整列表）
+    
+    Query Parameters:
+        active_only: true/false (預設: false)
+        archived: true 時匯出封存集合 accidents_archive (預設: false)
+    
+    Returns:
+        {
+            "exported_at": 1234567890.123,
+            "archived": false,
+            "accidents": [{"_id": "...", "latitude": 25.0330, ...}, ...]
+        }
+    """
+    active_only = request.args.get('active_only', 'false').lower() == 'true'
+    archived = request.args.get('archived', 'false').lower() == 'true'
+    
+    try:
+        accidents = AccidentModel.iter_all(active_only=active_only, archived=archived,
+                                           batch_size=config.BULK_BATCH_SIZE)
+        head = {'exported_at': time.time(), 'archived': archived}
+        return Response(iter_json_object(head, 'accidents', accidents), mimetype='application/json')
+    except Exception as e:
+        return jsonify({'error': f'匯出事故失敗: {str(e)}'}), 500
+
 @app.route('/api/video/<device_id>', methods=['GET'])
 def api_video(device_id):
     """
@@ -222,23 +786,112 @@ def api_video(device_id):
     """
     overlay = request.args.get('overlay', 'false').lower() == 'true'
     
-    # 從車載端取得影像串流
-    vehicle_url = f'http://{config.VEHICLE_HOST}:{config.VEHICLE_PORT}/video_stream?overlay={str(overlay).lower()}'
-    
     try:
-        # 代理影像串流
-        response = requests.get(vehicle_url, stream=True, timeout=5)
-        
-        return Response(
-            response.iter_content(chunk_size=1024),
-            mimetype='multipart/x-mixed-replace; boundary=frame',
-            headers={
-                'Cache-Control': 'no-cache',
-                'Connection': 'keep-alive'
-            }
-        )
+        base_url = registry.endpoint(device_id)
     except Exception as e:
-        return jsonify({'error': f'無法取得影像串流: {str(e)}'}), 500
+        return jsonify({'error': f'無法取得裝置位址: {str(e)}'}), 500
+    if base_url is None:
+        return jsonify({'error': '裝置尚未註冊影像串流'}), 404
+    
+    # 從車載端取得影像串流（同一台車、同一模式的觀看者共用一條上游連線）
+    vehicle_url = f'{base_url}/video_stream?overlay={str(overlay).lower()}'
+    relay = relay_hub.get(device_id, overlay, vehicle_url, session=registry.session(device_id, base_url))
+    
+    if not relay.wait_first_frame(config.VIDEO_RELAY_CONNECT_TIMEOUT):
+        relay.detach()
+        return jsonify({'error': f'無法取得影像串流: {relay.error or "車載端沒有回應"}'}), 500
+    
+    return Response(
+        stream_with_context(relay.frames()),
+        mimetype=VIDEO_MIMETYPE,
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@app.route('/api/snapshot/<device_id>', methods=['GET'])
+def api_snapshot(device_id):
+    """
+    取得車輛最新一幀快照（地圖彈出視窗等縮圖用）
+    
+    有人觀看即時影像時直接使用轉送中的最新幀，不另外連線車載端；
+    否則向車載端取得一張並在 SNAPSHOT_MAX_AGE 秒內共用。
+    以內容雜湊作為 ETag，畫面未變時帶 If-None-Match 的請求回傳 304。
+    
+    Query Parameters:
+        overlay: true/false - 是否顯示偵測框
+    
+    Returns:
+        影像位元組（image/jpeg），X-Frame-Age 為畫面距今秒數
+    """
+    overlay = request.args.get('overlay', 'false').lower() == 'true'
+    key = (device_id, overlay)
+    
+    frame = relay_hub.keyframes.get(key, config.SNAPSHOT_MAX_AGE)
+    if frame is None:
+        try:
+            base_url = registry.endpoint(device_id)
+        except Exception as e:
+            return jsonify({'error': f'無法取得裝置位址: {str(e)}'}), 500
+        if base_url is None:
+            return jsonify({'error': '裝置尚未註冊影像串流'}), 404
+        
+        session = registry.session(device_id, base_url)
+        timeout = (config.VIDEO_RELAY_CONNECT_TIMEOUT, config.VIDEO_RELAY_READ_TIMEOUT)
+        try:
+            frame = relay_hub.keyframes.get_or_fetch(
+                key, config.SNAPSHOT_MAX_AGE,
+                lambda: fetch_snapshot(base_url, overlay, session, timeout),
+                stale_max=config.SNAPSHOT_STALE_MAX
+            )
+        except Exception as e:
+            return jsonify({'error': f'無法取得快照: {str(e)}'}), 500
+    
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Frame-Age': f'{frame.age:.3f}'
+    }
+    if frame.etag in request.if_none_match:
+        response = Response(status=304, headers=headers)
+    else:
+        response = Response(frame.jpeg, mimetype='image/jpeg', headers=headers)
+    response.set_etag(frame.etag)
+    return response
+
+@app.route('/api/events', methods=['GET'])
+def api_events():
+    """
+    事件推播（Server-Sent Events）
+    
+    事件類型：
+        accident.created   新事故（內容同事故列表的單筆）
+        accident.updated   事故狀態變更 {"_id", "status", "updated_at"}
+        accident.deleted   事故刪除 {"_id"}
+        accidents.cleared  全部清除 {}
+        accidents.bulk     批次處理 {"action", "count", "ids"}（ids 最多 100 筆）
+        device.position    裝置位置 {"device_id", "latitude", "longitude", "updated_at"}
+        resync             事件遺失，客戶端應重新載入列表
+    
+    斷線重連時瀏覽器會帶 Last-Event-ID，伺服器重播之後的事件。
+    
+    Returns:
+        text/event-stream
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    return Response(
+        stream_with_context(hub.stream(last_event_id, heartbeat=config.EVENTS_HEARTBEAT)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
 @app.route('/api/health', methods=['GET'])
 def api_health():
@@ -267,11 +920,23 @@ def index():
         'endpoints': {
             'health': '/api/health',
             'login': '/api/login',
+            'revoke_tokens': '/api/revoke_tokens',
             'report_accident': '/api/report_accident',
             'get_accidents': '/api/get_accidents',
+            'get_accident': '/api/get_accident/<id>',
+            'accident_image': '/api/accident_image/<id>',
+            'accidents_in_bbox': '/api/get_accidents_in_bbox',
+            'nearby_accidents': '/api/get_nearby_accidents',
             'delete_accident': '/api/delete_accident/<id>',
+            'bulk_accidents': '/api/bulk_accidents',
+            'export_accidents': '/api/export_accidents',
             'video_stream': '/api/video/<device_id>',
-            'update_device': '/api/update_device'
+            'snapshot': '/api/snapshot/<device_id>',
+            'events': '/api/events',
+            'update_device': '/api/update_device',
+            'device_heartbeat': '/api/device_heartbeat',
+            'devices': '/api/devices',
+            'device_track': '/api/device_track/<device_id>'
         },
         'documentation': '/docs/api.md',
         'message': '請使用 /api/* 端點訪問 API 功能'
@@ -1,9 +1,20 @@
 """
 管理員驗證模組
 使用 Token-based 驗證
+
+驗證結果快取在程序內的 LRU（以 Token 的 SHA-256 摘要為鍵，保存到 Token 的 exp），
+同一個 Token 的後續請求只需一次字典查詢，不重新解析與計算 HMAC。
+Token 內含 ver（Token 版本），/api/revoke_tokens 遞增版本後所有舊 Token 失效，
+其他 worker 在 AUTH_VERSION_SYNC 秒內同步。
+
+車載端請求以 API_TOKEN（Authorization: Bearer <API_TOKEN>）驗證，
+設定值的摘要在啟動時預先計算；未設定 API_TOKEN 時不驗證（相容舊部署）。
 """
 
+import hashlib
+import threading
 import time
+from collections import OrderedDict
 from functools import wraps
 from typing import Optional
 from flask import request, jsonify
@@ -11,32 +22,120 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# 確保導入正確的 PyJWT
-# 先嘗試直接導入 PyJWT，避免與其他 jwt 模組衝突
 try:
-    # 方法 1: 直接導入 PyJWT（推薦）
-    from jwt import encode as jwt_encode, decode as jwt_decode, ExpiredSignatureError, InvalidTokenError
-    # 建立一個模擬物件以保持相容性
-    class PyJWTWrapper:
-        encode = staticmethod(jwt_encode)
-        decode = staticmethod(jwt_decode)
-        ExpiredSignatureError = ExpiredSignatureError
-        InvalidTokenError = InvalidTokenError
-    pyjwt = PyJWTWrapper()
+    import jwt as pyjwt
+    from jwt import ExpiredSignatureError, InvalidTokenError
 except ImportError:
-    try:
-        # 方法 2: 使用別名導入
-        import jwt as pyjwt
-        # 驗證是否為正確的 PyJWT
-        if not hasattr(pyjwt, 'encode'):
-            raise ImportError('導入的 jwt 模組不是 PyJWT')
-    except (ImportError, AttributeError):
-        raise ImportError('請安裝 PyJWT: pip install PyJWT')
+    raise ImportError('請安裝 PyJWT: pip install PyJWT')
 
 from backend.config import BackendConfig
+from backend.models import CollectionVersion
 
 config = BackendConfig()
 
+# Token 版本號（存在 meta 集合，多個 worker 共用）
+token_version = CollectionVersion('auth_tokens', sync_interval=config.AUTH_VERSION_SYNC)
+
+# 車載端 API_TOKEN 的摘要（可用逗號分隔多個，每台車各自一組）
+API_TOKEN_DIGESTS = frozenset(
+    hashlib.sha256(token.strip().encode('utf-8')).digest()
+    for token in config.API_TOKEN.split(',') if token.strip()
+)
+if not API_TOKEN_DIGESTS:
+    print('未設定 API_TOKEN，車載端請求不驗證')
+
+
+class TokenCache:
+    """已驗證 Token 的 LRU 快取（摘要 -> (payload, 到期時間)）"""
+    
+    def __init__(self, max_size: int = 1024):
+        """
+        Args:
+            max_size: 最多保存的 Token 數
+        """
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, digest: bytes) -> Optional[dict]:
+        """
+        取得已驗證的 payload
+        
+        Args:
+            digest: Token 的 SHA-256 摘要
+        
+        Returns:
+            Optional[dict]: payload，未快取或已過期時為 None
+        """
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] <= time.time():
+                del self.entries[digest]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, digest: bytes, payload: dict):
+        """
+        保存驗證結果直到 Token 的 exp
+        
+        Args:
+            digest: Token 的 SHA-256 摘要
+            payload: 解碼後的內容
+        """
+        with self.lock:
+            self.entries[digest] = (payload, payload.get('exp', 0))
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+    
+    def clear(self):
+        """清除所有快取（撤銷 Token 時）"""
+        with self.lock:
+            self.entries.clear()
+    
+    def stats(self) -> dict:
+        """快取統計"""
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# 全域 Token 快取
+token_cache = TokenCache(config.AUTH_CACHE_SIZE)
+
+
+def bearer_token(auth_header: Optional[str]) -> Optional[str]:
+    """
+    由 Authorization 標頭取得 Token
+    
+    Args:
+        auth_header: 例如 'Bearer <token>'
+    
+    Returns:
+        Optional[str]: Token，格式不符時為 None
+    """
+    if not auth_header:
+        return None
+    scheme, _, token = auth_header.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    return token.strip()
+
+
+def current_token_version() -> int:
+    """目前的 Token 版本（資料庫無法連線時使用最後已知的值）"""
+    version = token_version.current()
+    if version is None:
+        version = token_version.value
+    return version or 0
+
 def generate_token(username: str) -> str:
     """
     產生 JWT Token
@@ -50,6 +149,7 @@ def generate_token(username: str) -> str:
     try:
         payload = {
             'username': username,
+            'ver': current_token_version(),
             'exp': int(time.time()) + config.JWT_EXPIRATION
         }
         token = pyjwt.encode(payload, config.JWT_SECRET, algorithm=config.JWT_ALGORITHM)
@@ -61,23 +161,39 @@ def generate_token(username: str) -> str:
         print(f'產生 Token 錯誤: {e}')
         raise
 
-def verify_token(token: str) -> dict:
+def verify_token(token: str) -> Optional[dict]:
     """
-    驗證 JWT Token
+    驗證 JWT Token（先查快取，未命中才解碼並驗證簽章）
     
     Args:
         token: JWT Token
     
     Returns:
-        dict: Token 內容或 None
+        Optional[dict]: Token 內容，無效、過期或已撤銷時為 None
     """
-    try:
-        payload = pyjwt.decode(token, config.JWT_SECRET, algorithms=[config.JWT_ALGORITHM])
-        return payload
-    except ExpiredSignatureError:
-        return None
-    except InvalidTokenError:
+    digest = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = token_cache.get(digest)
+    if payload is None:
+        try:
+            payload = pyjwt.decode(token, config.JWT_SECRET, algorithms=[config.JWT_ALGORITHM])
+        except (ExpiredSignatureError, InvalidTokenError):
+            return None
+        token_cache.put(digest, payload)
+    # 已撤銷的版本（快取中的 Token 也會在版本同步後失效）
+    if payload.get('ver', 0) != current_token_version():
         return None
+    return payload
+
+def revoke_tokens() -> int:
+    """
+    撤銷目前所有已發出的 Token（遞增 Token 版本）
+    
+    Returns:
+        int: 新的 Token 版本
+    """
+    version = token_version.bump()
+    token_cache.clear()
+    return version
 
 def admin_required(f):
     """
@@ -102,9 +218,8 @@ def admin_required(f):
             return jsonify({'error': '缺少授權標頭'}), 401
         
         # 解析 Token (格式: Bearer <token>)
-        try:
-            token = auth_header.split(' ')[1]
-        except IndexError:
+        token = bearer_token(auth_header)
+        if token is None:
             return jsonify({'error': '無效的授權格式'}), 401
         
         # 驗證 Token
@@ -123,6 +238,28 @@ def admin_required(f):
     
     return decorated_function
 
+def api_token_required(f):
+    """
+    車載端驗證裝飾器（Authorization: Bearer <API_TOKEN>）
+    
+    比對預先計算的 API_TOKEN 摘要，每個請求只需一次雜湊與集合查詢；
+    未設定 API_TOKEN 時不驗證。
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method == 'OPTIONS' or not API_TOKEN_DIGESTS:
+            return f(*args, **kwargs)
+        
+        token = bearer_token(request.headers.get('Authorization'))
+        if token is None:
+            return jsonify({'error': '缺少授權標頭'}), 401
+        if hashlib.sha256(token.encode('utf-8')).digest() not in API_TOKEN_DIGESTS:
+            return jsonify({'error': '無效的 API Token'}), 401
+        
+        return f(*args, **kwargs)
+    
+    return decorated_function
+
 def login(username: str, password: str) -> Optional[str]:
     """
     管理員登入
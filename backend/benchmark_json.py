@@ -0,0 +1,139 @@
+"""
+JSON 序列化微基準測試
+以 10k 筆模擬事故 / 裝置文件比較：
+- legacy：逐筆 serialize_doc（複製並轉換 ObjectId / datetime）後以 Flask 預設 JSON provider 序列化
+- stdlib：json_codec 的標準函式庫路徑（default 處理器，不修改文件）
+- orjson：json_codec 的 orjson 路徑（需 pip install orjson）
+- stream：iter_json_object 分段輸出（回傳第一段前只序列化 CHUNK_ITEMS 筆）
+
+使用方式：
+    python benchmark_json.py
+    python benchmark_json.py --docs 50000 --repeat 10
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import json_codec
+from backend.models import serialize_doc
+
+
+def make_accidents(count: int) -> list:
+    """產生與 get_page 回傳格式相同的事故文件"""
+    now = datetime.now()
+    docs = []
+    for i in range(count):
+        created_at = now - timedelta(seconds=i * 37)
+        docs.append({
+            '_id': ObjectId(),
+            'latitude': 25.0330 + random.uniform(-0.5, 0.5),
+            'longitude': 121.5654 + random.uniform(-0.5, 0.5),
+            'timestamp': created_at.timestamp(),
+            'device_id': f'vehicle_{i % 200:03d}',
+            'has_injured': i % 7 == 0,
+            'status': 'active' if i % 3 else 'resolved',
+            'created_at': created_at,
+            'updated_at': created_at,
+            'image_hash': f'{i:064x}',
+            'image_type': 'image/jpeg',
+            'image_width': 1280,
+            'image_height': 720,
+            'image_size': 180000 + i,
+            'image_count': 1,
+        })
+    return docs
+
+
+def make_devices(count: int) -> list:
+    """產生與 DeviceModel.get_all 回傳格式相同的裝置文件"""
+    now = datetime.now()
+    return [{
+        '_id': ObjectId(),
+        'device_id': f'vehicle_{i:05d}',
+        'latitude': 25.0330 + random.uniform(-0.5, 0.5),
+        'longitude': 121.5654 + random.uniform(-0.5, 0.5),
+        'stream_url': f'http://10.0.{i // 256}.{i % 256}:8080',
+        'created_at': now,
+        'updated_at': now,
+        'heartbeat_at': now,
+    } for i in range(count)]
+
+
+def measure(function, docs: list, repeat: int, copy: bool = False) -> tuple:
+    """
+    執行 repeat 次取最佳時間
+
+    Args:
+        function: 接受文件列表並回傳 JSON 位元組的函式
+        docs: 文件列表
+        repeat: 次數
+        copy: 每次先複製文件（legacy 會原地修改文件，複製不計入時間）
+
+    Returns:
+        tuple: (最佳毫秒數, 輸出位元組數)
+    """
+    best = float('inf')
+    size = 0
+    for _ in range(repeat):
+        data = [dict(doc) for doc in docs] if copy else docs
+        started = time.perf_counter()
+        size = len(function(data))
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, size
+
+
+def run(name: str, key: str, docs: list, repeat: int):
+    """比較各序列化路徑並輸出結果"""
+    provider = DefaultJSONProvider(Flask(__name__))
+
+    def legacy(data):
+        return provider.dumps({key: [serialize_doc(doc) for doc in data]}).encode('utf-8')
+
+    def stream(data):
+        chunks = json_codec.iter_json_object({}, key, data)
+        first = time.perf_counter()
+        body = next(chunks) + next(chunks) + next(chunks)
+        stream.first_ms = (time.perf_counter() - first) * 1000
+        return body + b''.join(chunks)
+
+    cases = [('legacy', legacy, True), ('stdlib', lambda data: json_codec.dumps_stdlib({key: data}), False)]
+    if json_codec.orjson is not None:
+        cases.append(('orjson', lambda data: json_codec.dumps({key: data}), False))
+    cases.append((f'stream/{json_codec.ENGINE}', stream, False))
+
+    print(f'\n{name}: {len(docs)} 筆，取 {repeat} 次最佳')
+    baseline = None
+    for label, function, copy in cases:
+        elapsed, size = measure(function, docs, repeat, copy)
+        baseline = baseline or elapsed
+        line = f'  {label:<14} {elapsed:>8.2f} ms  {size / 1024 / 1024:>6.2f} MB  x{baseline / elapsed:>5.1f}'
+        if function is stream:
+            line += f'  第一段 {stream.first_ms:.2f} ms'
+        print(line)
+
+
+def main(argv=None) -> int:
+    """主函式"""
+    parser = argparse.ArgumentParser(description='比較 JSON 序列化路徑')
+    parser.add_argument('--docs', type=int, default=10000, help='文件數')
+    parser.add_argument('--repeat', type=int, default=5, help='每種路徑執行次數（取最佳）')
+    args = parser.parse_args(argv)
+
+    random.seed(0)
+    if json_codec.orjson is None:
+        print('未安裝 orjson，只比較標準函式庫路徑')
+    run('事故列表', 'accidents', make_accidents(args.docs), args.repeat)
+    run('裝置列表', 'devices', make_devices(args.docs), args.repeat)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
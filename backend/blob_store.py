@@ -0,0 +1,396 @@
+"""
+事故影像內容定址儲存
+影像以 SHA-256 雜湊為鍵只寫入一次（相同影像自動去重），
+事故文件僅保留雜湊與尺寸，影像位元組由 /api/accident_image/<id> 提供。
+
+支援兩種後端：
+- filesystem：本機目錄（預設），以雜湊前兩碼分層
+- gridfs：存放在 MongoDB GridFS（多台後端共用時使用）
+"""
+
+import base64
+import binascii
+import hashlib
+import os
+import struct
+import tempfile
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterator, Optional, Tuple
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.config import BackendConfig
+
+# 串流寫入時每次讀取的位元組數，也是 image_info 需要的檔頭長度
+CHUNK_SIZE = 64 * 1024
+
+
+def read_limited(stream: BinaryIO, max_size: int) -> bytes:
+    """
+    讀取串流全部內容（超過上限時停止）
+
+    Args:
+        stream: 可讀取的串流
+        max_size: 位元組上限
+
+    Returns:
+        bytes: 內容
+
+    Raises:
+        ValueError: 超過上限或內容為空
+    """
+    data = stream.read(max_size + 1)
+    if len(data) > max_size:
+        raise ValueError(f'影像超過 {max_size} 位元組上限')
+    if not data:
+        raise ValueError('影像內容為空')
+    return data
+
+
+def decode_image(value: str) -> bytes:
+    """
+    解碼 base64 影像字串（可含 data URL 前綴）
+
+    Args:
+        value: base64 字串
+
+    Returns:
+        bytes: 影像位元組
+
+    Raises:
+        ValueError: 非合法的 base64
+    """
+    if value.startswith('data:'):
+        value = value.split(',', 1)[-1]
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f'影像不是合法的 base64: {e}')
+
+
+def image_info(data: bytes) -> Tuple[str, Optional[int], Optional[int]]:
+    """
+    由檔頭判斷影像格式與尺寸（不需完整解碼）
+
+    Args:
+        data: 影像位元組
+
+    Returns:
+        Tuple[str, Optional[int], Optional[int]]: (MIME 類型, 寬, 高)
+    """
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return 'image/png', width, height
+
+    if data[:2] != b'\xff\xd8':
+        return 'application/octet-stream', None, None
+
+    # 逐段掃描 JPEG 標記直到 SOFn
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            i += 1 if marker == 0xFF else 2
+            continue
+        length = struct.unpack('>H', data[i + 2:i + 4])[0]
+        if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                      0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return 'image/jpeg', width, height
+        i += 2 + length
+    return 'image/jpeg', None, None
+
+
+class BlobStore:
+    """內容定址儲存介面"""
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        """計算內容雜湊（SHA-256 十六進位）"""
+        return hashlib.sha256(data).hexdigest()
+
+    def put(self, data: bytes) -> str:
+        """
+        寫入影像（已存在則略過）
+
+        Args:
+            data: 影像位元組
+
+        Returns:
+            str: 內容雜湊
+        """
+        raise NotImplementedError
+
+    def put_stream(self, stream: BinaryIO, max_size: int) -> Tuple[str, int, bytes]:
+        """
+        由串流寫入影像（預設讀入記憶體後呼叫 put）
+
+        Args:
+            stream: 可讀取的串流（上傳檔案或請求本體）
+            max_size: 位元組上限
+
+        Returns:
+            Tuple[str, int, bytes]: (內容雜湊, 位元組數, 檔頭供 image_info 使用)
+
+        Raises:
+            ValueError: 超過上限或內容為空
+        """
+        data = read_limited(stream, max_size)
+        return self.put(data), len(data), data[:CHUNK_SIZE]
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """
+        讀取影像
+
+        Args:
+            digest: 內容雜湊
+
+        Returns:
+            Optional[bytes]: 影像位元組，不存在則為 None
+        """
+        raise NotImplementedError
+
+    def exists(self, digest: str) -> bool:
+        """影像是否存在"""
+        raise NotImplementedError
+
+    def delete(self, digest: str, older_than: Optional[float] = None) -> bool:
+        """
+        刪除影像
+
+        Args:
+            digest: 內容雜湊
+            older_than: 指定時只在最後寫入時間早於此 Unix 時間戳時刪除
+                        （回收工作列出影像後又被重新寫入的影像不刪除）
+
+        Returns:
+            bool: 是否已刪除
+        """
+        raise NotImplementedError
+
+    def iter_blobs(self) -> Iterator[Tuple[str, int, float]]:
+        """
+        列出所有影像（供 retention.py 回收未被引用的影像）
+
+        Returns:
+            Iterator[Tuple[str, int, float]]: (內容雜湊, 位元組數, 最後寫入的 Unix 時間戳)
+        """
+        raise NotImplementedError
+
+
+class FileSystemBlobStore(BlobStore):
+    """本機目錄儲存：<root>/ab/abcdef...（原子寫入）"""
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root: 儲存根目錄
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        if len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+            raise ValueError(f'無效的影像雜湊: {digest}')
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        digest = self.digest(data)
+        path = self._path(digest)
+        if os.path.exists(path):
+            # 更新修改時間，避免回收工作刪除剛被重新引用的影像
+            os.utime(path)
+            return digest
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # 同一雜湊同時寫入時內容相同，後寫者覆蓋無妨
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest
+
+    def put_stream(self, stream: BinaryIO, max_size: int) -> Tuple[str, int, bytes]:
+        # 邊讀邊寫入暫存檔並計算雜湊，記憶體只保留一個區塊與檔頭
+        hasher = hashlib.sha256()
+        head = b''
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ValueError(f'影像超過 {max_size} 位元組上限')
+                    if len(head) < CHUNK_SIZE:
+                        head += chunk[:CHUNK_SIZE - len(head)]
+                    hasher.update(chunk)
+                    f.write(chunk)
+            if size == 0:
+                raise ValueError('影像內容為空')
+
+            digest = hasher.hexdigest()
+            path = self._path(digest)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return digest, size, head
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(self._path(digest), 'rb') as f:
+                return f.read()
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def exists(self, digest: str) -> bool:
+        try:
+            return os.path.exists(self._path(digest))
+        except ValueError:
+            return False
+
+    def delete(self, digest: str, older_than: Optional[float] = None) -> bool:
+        try:
+            path = self._path(digest)
+            if older_than is not None and os.path.getmtime(path) > older_than:
+                return False
+            os.remove(path)
+            return True
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def iter_blobs(self) -> Iterator[Tuple[str, int, float]]:
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir() or len(prefix.name) != 2:
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name.startswith('.tmp-') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                yield entry.name, stat.st_size, stat.st_mtime
+
+
+class GridFSBlobStore(BlobStore):
+    """
+    MongoDB GridFS 儲存，以雜湊作為檔案 _id
+
+    去重命中時在 <bucket>.files 文件記錄 last_referenced，
+    iter_blobs 回報 uploadDate 與 last_referenced 較晚者，與檔案系統儲存更新修改時間相同。
+    """
+
+    def __init__(self, database, collection: str = 'accident_images'):
+        """
+        Args:
+            database: pymongo Database
+            collection: GridFS bucket 名稱
+        """
+        import gridfs
+        self.fs = gridfs.GridFS(database, collection=collection)
+        self.files = database[f'{collection}.files']
+
+    def _touch(self, digest: str) -> bool:
+        """更新已存在影像的 last_referenced，回傳影像是否存在"""
+        result = self.files.update_one({'_id': digest}, {'$set': {'last_referenced': datetime.now(timezone.utc)}})
+        return result.matched_count > 0
+
+    @staticmethod
+    def _written_at(doc: dict) -> float:
+        """files 文件的最後寫入時間（GridFS 的日期為不含時區的 UTC）"""
+        written = max(doc['uploadDate'], doc.get('last_referenced') or doc['uploadDate'])
+        return written.replace(tzinfo=timezone.utc).timestamp()
+
+    def put(self, data: bytes) -> str:
+        import gridfs
+        digest = self.digest(data)
+        # 去重命中時更新時間，避免回收工作刪除剛被重新引用的影像
+        if self._touch(digest):
+            return digest
+        content_type, _, _ = image_info(data)
+        try:
+            self.fs.put(data, _id=digest, content_type=content_type)
+        except gridfs.errors.FileExists:
+            self._touch(digest)
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        import gridfs
+        try:
+            return self.fs.get(digest).read()
+        except gridfs.errors.NoFile:
+            return None
+
+    def exists(self, digest: str) -> bool:
+        return self.fs.exists(digest)
+
+    def delete(self, digest: str, older_than: Optional[float] = None) -> bool:
+        doc = self.files.find_one({'_id': digest}, {'uploadDate': 1, 'last_referenced': 1})
+        if doc is None:
+            return False
+        if older_than is not None and self._written_at(doc) > older_than:
+            return False
+        self.fs.delete(digest)
+        return True
+
+    def iter_blobs(self) -> Iterator[Tuple[str, int, float]]:
+        for doc in self.files.find({}, {'length': 1, 'uploadDate': 1, 'last_referenced': 1}):
+            yield doc['_id'], doc['length'], self._written_at(doc)
+
+
+_blob_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    """
+    取得全域影像儲存（依 BLOB_STORE 設定建立）
+
+    Returns:
+        BlobStore: 儲存實例
+    """
+    global _blob_store
+    if _blob_store is None:
+        config = BackendConfig()
+        if config.BLOB_STORE == 'gridfs':
+            from backend.models import db
+            if db.db is None:
+                raise Exception('MongoDB 未連接')
+            _blob_store = GridFSBlobStore(db.db)
+        else:
+            _blob_store = FileSystemBlobStore(config.BLOB_STORE_DIR)
+    return _blob_store
+
+
+def set_blob_store(store: Optional[BlobStore]):
+    """替換全域影像儲存（None 則下次依設定重建）"""
+    global _blob_store
+    _blob_store = store
+
+
+__all__ = [
+    'BlobStore',
+    'FileSystemBlobStore',
+    'GridFSBlobStore',
+    'decode_image',
+    'image_info',
+    'read_limited',
+    'get_blob_store',
+    'set_blob_store',
+]
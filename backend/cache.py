@@ -0,0 +1,211 @@
+"""
+讀取快取模組
+快取已序列化的 JSON 位元組（事故列表與單筆事故），命中時不查詢資料庫也不重新序列化。
+
+快取鍵包含集合版本號，寫入後版本號遞增即讓舊資料失效；
+記憶體快取另外在寫入時主動清除該命名空間以釋放空間。
+
+支援的後端（CACHE_BACKEND）：
+- memory：程序內 LRU（預設），有筆數、位元組與 TTL 上限
+- redis：Redis 相容伺服器（需安裝 redis 套件），多個 worker 共用；容量上限由伺服器 maxmemory 設定
+- none：停用
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.config import BackendConfig
+
+
+class Cache:
+    """快取介面"""
+
+    def get(self, key: str) -> Optional[bytes]:
+        """取得快取值，不存在或過期則為 None"""
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        """寫入快取值"""
+        raise NotImplementedError
+
+    def invalidate(self, namespace: str):
+        """清除命名空間（鍵以 '<namespace>:' 開頭）"""
+        raise NotImplementedError
+
+    def get_or_set(self, key: str, producer: Callable[[], bytes], ttl: Optional[float] = None) -> bytes:
+        """
+        讀穿快取：未命中時呼叫 producer 產生並寫入
+
+        Args:
+            key: 快取鍵
+            producer: 產生值的函式
+            ttl: 存活秒數（None 使用預設值）
+
+        Returns:
+            bytes: 快取值
+        """
+        value = self.get(key)
+        if value is None:
+            value = producer()
+            self.set(key, value, ttl)
+        return value
+
+    def stats(self) -> dict:
+        """快取統計"""
+        return {}
+
+
+class NullCache(Cache):
+    """停用快取"""
+
+    def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        pass
+
+    def invalidate(self, namespace: str):
+        pass
+
+
+class MemoryCache(Cache):
+    """程序內 LRU 快取"""
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            ttl: 預設存活秒數
+            max_entries: 最多筆數
+            max_bytes: 最多位元組
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        if len(value) > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, expires_at)
+            self.size += len(value)
+            # 超過上限時淘汰最久未使用的項目
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate(self, namespace: str):
+        prefix = f'{namespace}:'
+        with self.lock:
+            for key in [k for k in self.entries if k.startswith(prefix)]:
+                self._remove(key)
+
+    def _remove(self, key: str):
+        value, _ = self.entries.pop(key)
+        self.size -= len(value)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'backend': 'memory',
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class RedisCache(Cache):
+    """Redis 相容伺服器快取"""
+
+    def __init__(self, url: str, ttl: float = 30.0, prefix: str = 'safety:'):
+        """
+        Args:
+            url: 連線 URL（例如 redis://localhost:6379/0）
+            ttl: 預設存活秒數
+            prefix: 所有鍵的前綴
+        """
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.client.get(self.prefix + key)
+        except Exception as e:
+            print(f'Redis 讀取失敗: {e}')
+            return None
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        try:
+            self.client.set(self.prefix + key, value, px=int((ttl if ttl is not None else self.ttl) * 1000))
+        except Exception as e:
+            print(f'Redis 寫入失敗: {e}')
+
+    def invalidate(self, namespace: str):
+        # 鍵包含集合版本號，舊鍵不會再被讀取，交由 TTL 到期清除
+        pass
+
+    def stats(self) -> dict:
+        return {'backend': 'redis'}
+
+
+_cache: Optional[Cache] = None
+
+
+def get_cache() -> Cache:
+    """
+    取得全域快取（依 CACHE_BACKEND 設定建立）
+
+    Returns:
+        Cache: 快取實例
+    """
+    global _cache
+    if _cache is None:
+        config = BackendConfig()
+        if config.CACHE_BACKEND == 'redis':
+            try:
+                _cache = RedisCache(config.REDIS_URL, ttl=config.CACHE_TTL)
+            except ImportError:
+                print('未安裝 redis 套件，改用記憶體快取')
+        elif config.CACHE_BACKEND == 'none':
+            _cache = NullCache()
+        if _cache is None:
+            _cache = MemoryCache(config.CACHE_TTL, config.CACHE_MAX_ENTRIES, config.CACHE_MAX_BYTES)
+    return _cache
+
+
+def set_cache(cache: Optional[Cache]):
+    """替換全域快取（None 則下次依設定重建）"""
+    global _cache
+    _cache = cache
+
+
+__all__ = ['Cache', 'NullCache', 'MemoryCache', 'RedisCache', 'get_cache', 'set_cache']
@@ -16,14 +16,83 @@ class BackendConfig:
     FLASK_DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-change-this')
     
+    # 正式環境伺服器配置（serve.py，gunicorn）
+    SERVER_WORKER_CLASS = os.getenv('SERVER_WORKER_CLASS', 'gthread').lower()  # gthread 或 gevent
+    SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', '0'))  # 0 表示自動（EVENTS_SOURCE=local 時為 1）
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', '64'))  # gthread：每個 worker 的執行緒數（每條串流佔一個）
+    SERVER_WORKER_CONNECTIONS = int(os.getenv('SERVER_WORKER_CONNECTIONS', '1000'))  # gevent：每個 worker 的連線上限
+    SERVER_TIMEOUT = int(os.getenv('SERVER_TIMEOUT', '30'))  # worker 無回應多久後重啟（秒，不限制串流長度）
+    SERVER_GRACEFUL_TIMEOUT = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', '10'))  # 關閉時等待處理中請求的秒數
+    SERVER_KEEPALIVE = int(os.getenv('SERVER_KEEPALIVE', '5'))  # HTTP keep-alive 秒數
+    
     # MongoDB 配置
     MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
     MONGODB_DB_NAME = os.getenv('MONGODB_DB_NAME', 'safety_db')
     
+    # 事故影像儲存配置（filesystem 或 gridfs）
+    BLOB_STORE = os.getenv('BLOB_STORE', 'filesystem').lower()
+    BLOB_STORE_DIR = os.getenv('BLOB_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blobs'))
+    ACCIDENT_IMAGE_MAX_BYTES = int(os.getenv('ACCIDENT_IMAGE_MAX_BYTES', str(5 * 1024 * 1024)))  # 單張影像上限
+    ACCIDENT_MAX_IMAGES = int(os.getenv('ACCIDENT_MAX_IMAGES', '8'))  # 單次上報的關鍵幀上限
+    
+    # 事故列表分頁配置
+    ACCIDENT_PAGE_SIZE = int(os.getenv('ACCIDENT_PAGE_SIZE', '100'))
+    ACCIDENT_PAGE_MAX = int(os.getenv('ACCIDENT_PAGE_MAX', '1000'))
+    
+    # 事故批次操作配置
+    BULK_MAX_IDS = int(os.getenv('BULK_MAX_IDS', '10000'))  # 單次請求的 ID 上限
+    BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '1000'))  # 每次 update_many / delete_many 的筆數
+    
+    # 事故保存政策（retention.py，天數為 0 表示停用該步驟）
+    RETENTION_ARCHIVE_DAYS = float(os.getenv('RETENTION_ARCHIVE_DAYS', '30'))  # 已解決多久後搬到 accidents_archive
+    RETENTION_THUMBNAIL_DAYS = float(os.getenv('RETENTION_THUMBNAIL_DAYS', '90'))  # 建立多久後將封存影像重新壓縮為縮圖
+    RETENTION_PURGE_DAYS = float(os.getenv('RETENTION_PURGE_DAYS', '0'))  # 法定保存期限，封存事故超過即由 TTL 索引刪除
+    THUMBNAIL_MAX_SIDE = int(os.getenv('THUMBNAIL_MAX_SIDE', '320'))  # 縮圖長邊像素
+    THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', '70'))  # 縮圖 JPEG 品質
+    BLOB_GC_GRACE = float(os.getenv('BLOB_GC_GRACE', '3600'))  # 未被引用的影像寫入超過此秒數才刪除
+    
+    # 事故增量查詢配置
+    CHANGE_FEED_OVERLAP = float(os.getenv('CHANGE_FEED_OVERLAP', '2'))  # 秒
+    CHANGE_FEED_MAX = int(os.getenv('CHANGE_FEED_MAX', '1000'))  # 超過則要求重新載入
+    TOMBSTONE_TTL = int(os.getenv('TOMBSTONE_TTL', str(7 * 86400)))  # 刪除紀錄保存秒數
+    
+    # 事件推播配置（local 或 change_stream）
+    EVENTS_SOURCE = os.getenv('EVENTS_SOURCE', 'local').lower()
+    EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', '15'))  # 秒
+    
+    # 讀取快取配置（memory、redis 或 none）
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory').lower()
+    CACHE_TTL = float(os.getenv('CACHE_TTL', '30'))  # 秒
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1024'))
+    CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    
+    # 裝置位置寫入配置
+    DEVICE_WRITE_BEHIND = os.getenv('DEVICE_WRITE_BEHIND', 'true').lower() == 'true'
+    DEVICE_FLUSH_INTERVAL = float(os.getenv('DEVICE_FLUSH_INTERVAL', '0.5'))  # 秒
+    DEVICE_FLUSH_SIZE = int(os.getenv('DEVICE_FLUSH_SIZE', '500'))  # 待寫入裝置數上限
+    DEVICE_BATCH_MAX = int(os.getenv('DEVICE_BATCH_MAX', '500'))  # 單次批次回報的位置筆數上限
+    DEVICE_HISTORY = os.getenv('DEVICE_HISTORY', 'true').lower() == 'true'  # 保存歷史軌跡
+    DEVICE_HISTORY_TTL = int(os.getenv('DEVICE_HISTORY_TTL', str(30 * 86400)))  # 歷史保存秒數
+    DEVICE_HISTORY_MIN_INTERVAL = float(os.getenv('DEVICE_HISTORY_MIN_INTERVAL', '1'))  # 秒
+    DEVICE_HISTORY_MIN_DISTANCE = float(os.getenv('DEVICE_HISTORY_MIN_DISTANCE', '2'))  # 公尺
+    DEVICE_HISTORY_MAX_GAP = float(os.getenv('DEVICE_HISTORY_MAX_GAP', '60'))  # 靜止時的記錄間隔（秒）
+    TRACK_MAX_POINTS = int(os.getenv('TRACK_MAX_POINTS', '2000'))  # 軌跡回傳點數上限
+    
+    # 地理查詢配置
+    GEO_MAX_RESULTS = int(os.getenv('GEO_MAX_RESULTS', '500'))
+    GEO_MAX_RADIUS = float(os.getenv('GEO_MAX_RADIUS', '50000'))  # 公尺
+    GEO_CLUSTER_MAX_ZOOM = int(os.getenv('GEO_CLUSTER_MAX_ZOOM', '13'))  # 此縮放等級以下回傳聚合結果
+    
     # JWT 配置
     JWT_SECRET = os.getenv('JWT_SECRET', 'your-jwt-secret-change-this')
     JWT_ALGORITHM = 'HS256'
     JWT_EXPIRATION = 86400  # 24 小時
+    AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', '1024'))  # 已驗證 Token 快取數
+    AUTH_VERSION_SYNC = float(os.getenv('AUTH_VERSION_SYNC', '5'))  # 撤銷 Token 同步到其他 worker 的秒數
+    
+    # 車載端驗證（Authorization: Bearer <API_TOKEN>，可用逗號分隔多個；空白表示不驗證）
+    API_TOKEN = os.getenv('API_TOKEN', '')
     
     # 管理員配置
     ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')
@@ -40,4 +109,20 @@ class BackendConfig:
     # 車載端配置（影像串流）
     VEHICLE_HOST = os.getenv('VEHICLE_HOST', 'localhost')
     VEHICLE_PORT = int(os.getenv('VEHICLE_PORT', '8080'))
+    VIDEO_RELAY_IDLE_TIMEOUT = float(os.getenv('VIDEO_RELAY_IDLE_TIMEOUT', '10'))  # 無觀看者後保留上游秒數
+    VIDEO_RELAY_CONNECT_TIMEOUT = float(os.getenv('VIDEO_RELAY_CONNECT_TIMEOUT', '5'))
+    VIDEO_RELAY_READ_TIMEOUT = float(os.getenv('VIDEO_RELAY_READ_TIMEOUT', '10'))  # 上游無資料視為中斷
+    
+    # 快照（/api/snapshot）
+    SNAPSHOT_MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', '2'))  # 快取幀超過此秒數才向車載端重新取得
+    SNAPSHOT_STALE_MAX = float(os.getenv('SNAPSHOT_STALE_MAX', '60'))  # 車載端無法連線時仍可回傳的舊幀秒數
+    SNAPSHOT_FAILURE_TTL = float(os.getenv('SNAPSHOT_FAILURE_TTL', '2'))  # 抓取失敗後暫停重試的秒數
+    
+    # 裝置註冊（多車影像路由）
+    DEVICE_HEARTBEAT_TIMEOUT = float(os.getenv('DEVICE_HEARTBEAT_TIMEOUT', '90'))  # 超過此秒數無心跳視為離線
+    DEVICE_ENDPOINT_CACHE_TTL = float(os.getenv('DEVICE_ENDPOINT_CACHE_TTL', '5'))  # 串流位址本機快取秒數
+    VEHICLE_STREAM_FALLBACK = os.getenv('VEHICLE_STREAM_FALLBACK', 'true').lower() == 'true'  # 未註冊時使用 VEHICLE_HOST
+    VEHICLE_POOL_SIZE = int(os.getenv('VEHICLE_POOL_SIZE', '4'))  # 每台車的連線池大小
+    # 允許註冊的影像串流網段（逗號分隔 CIDR，例如 10.0.0.0/8）；留空時只在設定 API_TOKEN 後接受註冊
+    DEVICE_STREAM_NETWORKS = os.getenv('DEVICE_STREAM_NETWORKS', '')
 
@@ -0,0 +1,200 @@
+"""
+裝置註冊模組
+車載端定期以 /api/device_heartbeat 回報影像串流位址，影像轉送依 device_id 查詢位址，
+每台車使用各自的 requests.Session 連線池，並彙整心跳與串流狀態供 /api/devices 顯示。
+
+查詢結果在本機快取 DEVICE_ENDPOINT_CACHE_TTL 秒；本程序收到的心跳會立即更新快取。
+串流位址會被後端主動連線，只在設定 API_TOKEN（心跳須驗證）時接受註冊，
+設定 DEVICE_STREAM_NETWORKS 時位址還必須位於允許的網段內。
+尚未註冊的裝置在 VEHICLE_STREAM_FALLBACK=true 時使用 VEHICLE_HOST:VEHICLE_PORT（單車部署）。
+"""
+
+import ipaddress
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.config import BackendConfig
+from backend.models import DeviceModel
+
+
+def normalize_stream_url(url: str) -> str:
+    """
+    檢查並正規化車載端位址
+
+    Args:
+        url: 例如 http://10.0.0.5:8080 或 http://10.0.0.5:8080/
+
+    Returns:
+        str: 不含結尾斜線的位址
+
+    Raises:
+        ValueError: 不是 http(s) 位址
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError('stream_url 必須是 http:// 或 https:// 位址')
+    return url.rstrip('/')
+
+
+def parse_networks(value: str) -> list:
+    """
+    解析逗號分隔的 CIDR 網段
+
+    Raises:
+        ValueError: 網段格式錯誤
+    """
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in value.split(',') if item.strip()]
+
+
+class DeviceRegistry:
+    """裝置影像串流位址與連線池"""
+
+    def __init__(self, config: Optional[BackendConfig] = None):
+        """
+        Args:
+            config: 後端配置
+        """
+        self.config = config or BackendConfig()
+        self.networks = parse_networks(self.config.DEVICE_STREAM_NETWORKS)
+        self.endpoints: Dict[str, Tuple[Optional[str], float]] = {}
+        self.sessions: Dict[str, Tuple[str, requests.Session]] = {}
+        self.lock = threading.Lock()
+
+    def heartbeat(self, device_id: str, stream_url: Optional[str]) -> datetime:
+        """
+        記錄心跳並更新本機快取
+
+        Args:
+            device_id: 裝置 ID
+            stream_url: 車載端位址（None 表示不變更）
+
+        Returns:
+            datetime: 心跳時間
+        """
+        if stream_url:
+            stream_url = normalize_stream_url(stream_url)
+        heartbeat_at = DeviceModel.heartbeat(device_id, stream_url)
+        if stream_url:
+            with self.lock:
+                self.endpoints[device_id] = (stream_url, time.monotonic())
+        return heartbeat_at
+
+    def endpoint(self, device_id: str) -> Optional[str]:
+        """
+        取得裝置的車載端位址
+
+        Args:
+            device_id: 裝置 ID
+
+        Returns:
+            Optional[str]: 位址，未註冊且未啟用預設位址時為 None
+        """
+        with self.lock:
+            cached = self.endpoints.get(device_id)
+        if cached is None or time.monotonic() - cached[1] > self.config.DEVICE_ENDPOINT_CACHE_TTL:
+            registered = DeviceModel.get_endpoint(device_id)
+            url = registered['stream_url'] if registered else None
+            with self.lock:
+                self.endpoints[device_id] = (url, time.monotonic())
+        else:
+            url = cached[0]
+
+        if url is None and self.config.VEHICLE_STREAM_FALLBACK:
+            url = f'http://{self.config.VEHICLE_HOST}:{self.config.VEHICLE_PORT}'
+        return url
+
+    def session(self, device_id: str, url: str) -> requests.Session:
+        """
+        取得裝置專用的連線池（位址變更時重建）
+
+        Args:
+            device_id: 裝置 ID
+            url: 目前的車載端位址
+
+        Returns:
+            requests.Session: 連線池
+        """
+        with self.lock:
+            entry = self.sessions.get(device_id)
+            if entry is not None and entry[0] == url:
+                return entry[1]
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.config.VEHICLE_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.sessions[device_id] = (url, session)
+        if entry is not None:
+            entry[1].close()
+        return session
+
+    def stream_url_allowed(self, url: str) -> bool:
+        """
+        是否接受註冊此串流位址（避免未驗證的請求把影像轉送導向任意主機）
+
+        Args:
+            url: normalize_stream_url 的結果
+
+        Returns:
+            bool: 設定 DEVICE_STREAM_NETWORKS 時須所有解析位址都在網段內，否則須已設定 API_TOKEN
+        """
+        if not self.networks:
+            return bool(self.config.API_TOKEN)
+        try:
+            addresses = {info[4][0] for info in socket.getaddrinfo(urlparse(url).hostname, None)}
+        except (socket.gaierror, UnicodeError):
+            return False
+        # IPv6 位址可能帶有 %scope
+        return bool(addresses) and all(
+            any(ipaddress.ip_address(address.split('%')[0]) in network for network in self.networks)
+            for address in addresses
+        )
+
+    def is_online(self, heartbeat_at) -> bool:
+        """
+        心跳是否在 DEVICE_HEARTBEAT_TIMEOUT 秒內
+
+        Args:
+            heartbeat_at: 心跳時間（datetime 或 Unix 時間戳）
+        """
+        if heartbeat_at is None:
+            return False
+        if isinstance(heartbeat_at, datetime):
+            heartbeat_at = heartbeat_at.timestamp()
+        return time.time() - heartbeat_at <= self.config.DEVICE_HEARTBEAT_TIMEOUT
+
+    def status(self, devices: List[dict], streams: Dict[str, dict]) -> List[dict]:
+        """
+        合併裝置列表、心跳與影像轉送狀態
+
+        Args:
+            devices: DeviceModel.get_all() 的結果
+            streams: VideoRelayHub.stats() 的結果
+
+        Returns:
+            List[dict]: 每台裝置加上 online 與 streams 欄位（不含車載端內部位址）
+        """
+        by_device: Dict[str, dict] = {}
+        for key, stats in streams.items():
+            device_id, _, mode = key.rpartition(':')
+            by_device.setdefault(device_id, {})[mode] = {k: v for k, v in stats.items() if k != 'url'}
+        for device in devices:
+            device.pop('stream_url', None)
+            device['online'] = self.is_online(device.get('heartbeat_at'))
+            device['streams'] = by_device.get(device.get('device_id'), {})
+        return devices
+
+
+# 全域裝置註冊
+registry = DeviceRegistry()
+
+
+__all__ = ['DeviceRegistry', 'registry', 'normalize_stream_url', 'parse_networks']
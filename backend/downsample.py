@@ -0,0 +1,144 @@
+"""
+軌跡降採樣
+將長時間的裝置軌跡縮減到數百個點供地圖繪製。
+
+點的格式為 (時間戳, 緯度, 經度)。
+"""
+
+import math
+from typing import List, Sequence, Tuple
+
+Point = Tuple[float, float, float]
+
+EARTH_RADIUS = 6371000.0  # 公尺
+
+
+def _project(points: Sequence[Point]) -> List[Tuple[float, float]]:
+    """以軌跡中心為原點的等距圓柱投影（公尺），短軌跡足夠精確"""
+    lat0 = math.radians(sum(p[1] for p in points) / len(points))
+    scale = math.cos(lat0)
+    return [
+        (math.radians(p[2]) * EARTH_RADIUS * scale, math.radians(p[1]) * EARTH_RADIUS)
+        for p in points
+    ]
+
+
+def distance_meters(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """兩點間的近似距離（公尺）"""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * EARTH_RADIUS
+
+
+def douglas_peucker(points: Sequence[Point], tolerance: float) -> List[Point]:
+    """
+    Douglas-Peucker 線段簡化（非遞迴）
+
+    Args:
+        points: 依時間排序的點
+        tolerance: 允許偏離的距離（公尺）
+
+    Returns:
+        List[Point]: 保留的點（含首尾）
+    """
+    n = len(points)
+    if n <= 2:
+        return list(points)
+
+    xy = _project(points)
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+
+    while stack:
+        first, last = stack.pop()
+        x1, y1 = xy[first]
+        x2, y2 = xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+
+        max_distance = -1.0
+        index = first
+        for i in range(first + 1, last):
+            px, py = xy[i]
+            if length == 0:
+                d = math.hypot(px - x1, py - y1)
+            else:
+                d = abs(dy * px - dx * py + x2 * y1 - y2 * x1) / length
+            if d > max_distance:
+                max_distance = d
+                index = i
+
+        if max_distance > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [p for p, k in zip(points, keep) if k]
+
+
+def time_buckets(points: Sequence[Point], max_points: int) -> List[Point]:
+    """
+    固定時間桶降採樣：每個桶取平均位置（保留首尾點）
+
+    Args:
+        points: 依時間排序的點
+        max_points: 最多點數
+
+    Returns:
+        List[Point]: 降採樣後的點
+    """
+    n = len(points)
+    if n <= max_points or max_points < 3:
+        return list(points)
+
+    start, end = points[0][0], points[-1][0]
+    buckets = max_points - 2
+    width = (end - start) / buckets if end > start else 1.0
+
+    result = [points[0]]
+    current = None
+    sums = [0.0, 0.0, 0.0, 0]
+    for t, lat, lon in points[1:-1]:
+        bucket = min(int((t - start) / width), buckets - 1)
+        if bucket != current and sums[3]:
+            count = sums[3]
+            result.append((sums[0] / count, sums[1] / count, sums[2] / count))
+            sums = [0.0, 0.0, 0.0, 0]
+        current = bucket
+        sums[0] += t
+        sums[1] += lat
+        sums[2] += lon
+        sums[3] += 1
+    if sums[3]:
+        count = sums[3]
+        result.append((sums[0] / count, sums[1] / count, sums[2] / count))
+    result.append(points[-1])
+    return result
+
+
+def downsample(points: Sequence[Point], method: str = 'dp', max_points: int = 500,
+               tolerance: float = 5.0) -> List[Point]:
+    """
+    降採樣軌跡
+
+    Args:
+        points: 依時間排序的點
+        method: 'dp'（Douglas-Peucker）或 'bucket'（固定時間桶）
+        max_points: 最多點數（dp 結果仍過多時再以時間桶縮減）
+        tolerance: dp 允許偏離距離（公尺）
+
+    Returns:
+        List[Point]: 降採樣後的點
+
+    Raises:
+        ValueError: 不支援的方法
+    """
+    if method == 'dp':
+        points = douglas_peucker(points, tolerance)
+    elif method != 'bucket':
+        raise ValueError(f'不支援的降採樣方法: {method}')
+    return time_buckets(points, max_points)
+
+
+__all__ = ['douglas_peucker', 'time_buckets', 'downsample', 'distance_meters']
@@ -0,0 +1,270 @@
+"""
+事件推播模組
+程序內的發佈/訂閱中心，供 /api/events 以 Server-Sent Events 推送
+新事故、事故狀態變更、刪除與裝置位置。
+
+事件來源有兩種（EVENTS_SOURCE）：
+- local：由 AccidentModel / DeviceModel 寫入後直接發佈（單一程序）
+- change_stream：由 MongoDB change stream 發佈（需 replica set，多個 worker 都能收到所有寫入）
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import Iterator, List, Optional
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.config import BackendConfig
+from backend.json_codec import dumps
+
+
+class Subscription:
+    """單一訂閱者的事件佇列"""
+
+    def __init__(self, maxsize: int):
+        """
+        Args:
+            maxsize: 佇列上限，慢速客戶端超過時丟棄最舊事件並要求重新同步
+        """
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def put(self, message: bytes):
+        """放入事件（佇列滿時丟棄最舊的一筆）"""
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                self.overflowed = True
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float) -> Optional[bytes]:
+        """取出事件，逾時回傳 None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventHub:
+    """程序內發佈/訂閱中心"""
+
+    def __init__(self, history: int = 256, queue_size: int = 100):
+        """
+        Args:
+            history: 保留最近幾筆事件供 Last-Event-ID 重播
+            queue_size: 每個訂閱者的佇列上限
+        """
+        self.queue_size = queue_size
+        self.subscribers: List[Subscription] = []
+        self.history = deque(maxlen=history)
+        self.sequence = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def format(event_id: int, event_type: str, data: dict) -> bytes:
+        """編碼為 SSE 訊息"""
+        return f'id: {event_id}\nevent: {event_type}\ndata: '.encode('utf-8') + dumps(data) + b'\n\n'
+
+    def publish(self, event_type: str, data: dict) -> int:
+        """
+        發佈事件（只編碼一次，所有訂閱者共用）
+
+        Args:
+            event_type: 事件類型
+            data: 事件資料（可 JSON 序列化）
+
+        Returns:
+            int: 事件序號
+        """
+        with self.lock:
+            self.sequence += 1
+            event_id = self.sequence
+            message = self.format(event_id, event_type, data)
+            self.history.append((event_id, message))
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.put(message)
+        return event_id
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Subscription:
+        """
+        訂閱事件
+
+        Args:
+            last_event_id: 客戶端重新連線時帶的 Last-Event-ID，會重播之後的事件
+
+        Returns:
+            Subscription: 訂閱
+        """
+        subscription = Subscription(self.queue_size)
+        with self.lock:
+            if last_event_id is not None and last_event_id < self.sequence:
+                oldest = self.history[0][0] if self.history else self.sequence + 1
+                if last_event_id + 1 < oldest:
+                    # 中間的事件已不在歷史中
+                    subscription.overflowed = True
+                for event_id, message in self.history:
+                    if event_id > last_event_id:
+                        subscription.put(message)
+            self.subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """取消訂閱"""
+        with self.lock:
+            if subscription in self.subscribers:
+                self.subscribers.remove(subscription)
+
+    def close(self):
+        """結束所有訂閱者的串流（伺服器關閉時呼叫，客戶端會自動重新連線到其他 worker）"""
+        with self.lock:
+            self.closed = True
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.put(b'')
+
+    def stream(self, last_event_id: Optional[int] = None, heartbeat: float = 15.0) -> Iterator[bytes]:
+        """
+        產生 SSE 串流（供 Flask Response 使用）
+
+        溢位時送出 resync 事件，客戶端應重新載入列表。
+
+        Args:
+            last_event_id: Last-Event-ID
+            heartbeat: 無事件時送出註解行的間隔（秒），避免代理中斷連線
+        """
+        subscription = self.subscribe(last_event_id)
+        try:
+            yield b'retry: 3000\n\n'
+            while not self.closed:
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    yield self.format(self.sequence, 'resync', {})
+                message = subscription.get(heartbeat)
+                if self.closed:
+                    return
+                yield message if message is not None else b': ping\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+
+# 全域事件中心
+hub = EventHub()
+_config = BackendConfig()
+
+
+def publish(event_type: str, data: dict):
+    """
+    模型寫入後發佈事件（事件來源為 change stream 時由監聽執行緒發佈，此處略過）
+
+    Args:
+        event_type: 事件類型
+        data: 事件資料
+    """
+    if _config.EVENTS_SOURCE == 'local':
+        hub.publish(event_type, data)
+
+
+class ChangeStreamFeeder:
+    """以 MongoDB change stream 餵入事件中心（需 replica set）"""
+
+    def __init__(self, database, event_hub: EventHub = hub):
+        """
+        Args:
+            database: pymongo Database
+            event_hub: 事件中心
+        """
+        self.database = database
+        self.hub = event_hub
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """啟動監聽執行緒"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='change-stream', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """停止監聽"""
+        self.running = False
+
+    def _run(self):
+        from pymongo.errors import PyMongoError
+        from backend.models import serialize_doc
+
+        pipeline = [{'$match': {'ns.coll': {'$in': ['accidents', 'devices', 'accident_tombstones']}}}]
+        resume_token = None
+        while self.running:
+            try:
+                with self.database.watch(pipeline, full_document='updateLookup',
+                                         resume_after=resume_token, max_await_time_ms=1000) as stream:
+                    while self.running and stream.alive:
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        resume_token = stream.resume_token
+                        self._dispatch(change, serialize_doc)
+            except PyMongoError as e:
+                print(f'Change stream 中斷，5 秒後重試: {e}')
+                time.sleep(5)
+
+    def _dispatch(self, change: dict, serialize_doc):
+        collection = change['ns']['coll']
+        operation = change['operationType']
+        document = change.get('fullDocument')
+        if document:
+            document.pop('image', None)
+            serialize_doc(document)
+
+        if collection == 'accidents':
+            if operation == 'insert' and document:
+                self.hub.publish('accident.created', document)
+            elif operation in ('update', 'replace') and document:
+                self.hub.publish('accident.updated', {
+                    '_id': document['_id'],
+                    'status': document.get('status'),
+                    'updated_at': document.get('updated_at')
+                })
+            elif operation == 'delete':
+                self.hub.publish('accident.deleted', {'_id': str(change['documentKey']['_id'])})
+        elif collection == 'accident_tombstones':
+            if operation == 'insert' and document and document.get('cleared'):
+                self.hub.publish('accidents.cleared', {})
+        elif collection == 'devices' and document:
+            self.hub.publish('device.position', {
+                'device_id': document.get('device_id'),
+                'latitude': document.get('latitude'),
+                'longitude': document.get('longitude'),
+                'updated_at': document.get('updated_at')
+            })
+
+
+def start_change_stream(database) -> Optional[ChangeStreamFeeder]:
+    """
+    EVENTS_SOURCE=change_stream 時啟動監聽
+
+    Args:
+        database: pymongo Database（None 表示未連線）
+
+    Returns:
+        Optional[ChangeStreamFeeder]: 監聽器，未啟用時為 None
+    """
+    if _config.EVENTS_SOURCE != 'change_stream' or database is None:
+        return None
+    feeder = ChangeStreamFeeder(database)
+    feeder.start()
+    print('已啟用 MongoDB change stream 事件來源')
+    return feeder
+
+
+__all__ = ['EventHub', 'Subscription', 'ChangeStreamFeeder', 'hub', 'publish', 'start_change_stream']
@@ -0,0 +1,312 @@
+"""
+MongoDB 索引管理與查詢計畫檢查
+啟動時以 ensure_indexes 建立索引（可重複執行），
+並可用 explain 確認熱路徑查詢沒有退化成 COLLSCAN。
+
+使用方式：
+    python indexes.py              # 對 MONGODB_URI 建立索引並以 explain 檢查查詢計畫
+    python indexes.py --mongomock  # 不需 mongod：mongomock 不支援 explain，改以索引前綴靜態檢查
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+from pymongo.errors import OperationFailure
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.config import BackendConfig
+from backend import queries
+
+# 各集合的索引定義
+INDEXES: Dict[str, List[IndexModel]] = {
+    'accidents': [
+        # 事故列表：status 篩選 + created_at/_id 游標分頁
+        IndexModel([('status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+                   name='status_created_at'),
+        # 不限狀態的列表
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)], name='created_at'),
+        # 增量查詢
+        IndexModel([('updated_at', ASCENDING)], name='updated_at'),
+        # 地理查詢（GeoJSON Point）
+        IndexModel([('location', GEOSPHERE)], name='location_2dsphere'),
+        # 車載端重送去除重複（舊資料沒有 report_id）
+        IndexModel([('report_id', ASCENDING)], name='report_id_unique', unique=True, sparse=True),
+        # retention.py 刪除影像前確認沒有事故引用
+        IndexModel([('image_hash', ASCENDING)], name='image_hash', sparse=True),
+        IndexModel([('images.hash', ASCENDING)], name='images_hash', sparse=True),
+    ],
+    'accidents_archive': [
+        # 封存事故依建立時間 / 封存時間查詢
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)], name='created_at'),
+        IndexModel([('archived_at', ASCENDING)], name='archived_at'),
+        IndexModel([('image_hash', ASCENDING)], name='image_hash', sparse=True),
+        IndexModel([('images.hash', ASCENDING)], name='images_hash', sparse=True),
+    ],
+    'accident_tombstones': [
+        # 刪除紀錄到期自動清除
+        IndexModel([('deleted_at', ASCENDING)], name='deleted_at_ttl',
+                   expireAfterSeconds=BackendConfig.TOMBSTONE_TTL),
+    ],
+    'devices': [
+        # update_position 以 device_id upsert
+        IndexModel([('device_id', ASCENDING)], name='device_id_unique', unique=True),
+    ],
+    'device_positions': [
+        # 單一裝置的軌跡查詢
+        IndexModel([('device_id', ASCENDING), ('timestamp', ASCENDING)], name='device_id_timestamp'),
+    ],
+    'device_position_buckets': [
+        # 軌跡查詢與寫入時尋找最新的分桶
+        IndexModel([('device_id', ASCENDING), ('first', ASCENDING)], name='device_id_first'),
+        # 歷史到期自動清除
+        IndexModel([('last', ASCENDING)], name='last_ttl', expireAfterSeconds=BackendConfig.DEVICE_HISTORY_TTL),
+    ],
+}
+
+# 法定保存期限：封存事故依建立時間到期自動刪除（影像由 retention.py 回收）
+if BackendConfig.RETENTION_PURGE_DAYS > 0:
+    INDEXES['accidents_archive'].append(
+        IndexModel([('created_at', ASCENDING)], name='created_at_ttl',
+                   expireAfterSeconds=int(BackendConfig.RETENTION_PURGE_DAYS * 86400))
+    )
+
+# 熱路徑查詢的範例參數
+SAMPLE_DEVICE_ID = 'vehicle_001'
+SAMPLE_TIME = datetime(2000, 1, 1)
+
+
+def hot_queries() -> List[Tuple[str, str, dict, Optional[list]]]:
+    """
+    熱路徑查詢：以模型實際使用的查詢建構函式（queries.py）產生，模型改寫查詢時檢查會一併更新
+
+    Returns:
+        List[Tuple[str, str, dict, Optional[list]]]: (名稱, 集合, 篩選條件, 排序)
+    """
+    cursor = queries.encode_cursor(SAMPLE_TIME, ObjectId('0' * 24))
+    hot = [
+        ('accidents.active_page', 'accidents') + queries.page_query(True),
+        ('accidents.active_page_cursor', 'accidents') + queries.page_query(True, cursor),
+        ('accidents.all_page', 'accidents') + queries.page_query(False),
+        ('accidents.bbox', 'accidents', queries.bbox_query(121.5, 25.0, 121.6, 25.1), None),
+        ('accidents.near', 'accidents', queries.near_query(25.0330, 121.5654, 1000), None),
+        ('accidents.changes_since', 'accidents') + queries.changes_query(SAMPLE_TIME),
+        ('accident_tombstones.since', 'accident_tombstones', queries.tombstones_query(SAMPLE_TIME), None),
+        # DeviceModel.update_position 以 device_id upsert
+        ('devices.by_device_id', 'devices', {'device_id': SAMPLE_DEVICE_ID}, None),
+    ]
+    for mode in ('timeseries', 'buckets'):
+        collection_name, query, sort = queries.track_query(
+            mode, SAMPLE_DEVICE_ID, SAMPLE_TIME, SAMPLE_TIME + timedelta(days=1))
+        hot.append((f'{collection_name}.track', collection_name, query, sort))
+    return hot
+
+
+def ensure_collections(database):
+    """
+    建立需要特殊選項的集合（已存在則略過）
+
+    device_positions 為時間序列集合（MongoDB 5.0+），不支援時由 history_mode 改用分桶文件。
+
+    Args:
+        database: pymongo Database
+    """
+    existing = set(database.list_collection_names())
+    if 'device_positions' not in existing:
+        try:
+            database.create_collection(
+                'device_positions',
+                timeseries={'timeField': 'timestamp', 'metaField': 'device_id', 'granularity': 'seconds'},
+                expireAfterSeconds=BackendConfig.DEVICE_HISTORY_TTL
+            )
+        except (OperationFailure, NotImplementedError) as e:
+            print(f'無法建立時間序列集合 device_positions，改用分桶文件 device_position_buckets: {e}')
+
+
+def history_mode(database) -> str:
+    """
+    判斷裝置歷史軌跡的儲存方式
+
+    Args:
+        database: pymongo Database
+
+    Returns:
+        str: 'timeseries'（device_positions 為時間序列集合）或 'buckets'（device_position_buckets 分桶文件）
+    """
+    try:
+        for info in database.list_collections(filter={'name': 'device_positions'}):
+            if info.get('type') == 'timeseries':
+                return 'timeseries'
+    except (OperationFailure, NotImplementedError):
+        pass
+    return 'buckets'
+
+
+def ensure_indexes(database) -> List[str]:
+    """
+    建立所有索引（已存在則略過，可在每次啟動時執行）
+
+    Args:
+        database: pymongo Database
+
+    Returns:
+        List[str]: 已確認存在的索引名稱
+    """
+    ensure_collections(database)
+    
+    created = []
+    for collection_name, indexes in INDEXES.items():
+        collection = database[collection_name]
+        for index in indexes:
+            try:
+                created.extend(collection.create_indexes([index]))
+            except OperationFailure as e:
+                # 例如既有資料違反唯一性或同名索引選項不同，不阻擋啟動
+                print(f'建立索引 {collection_name}.{index.document["name"]} 失敗: {e}')
+    return created
+
+
+def _plan_stages(plan: dict) -> List[str]:
+    """攤平查詢計畫樹中的所有 stage"""
+    stages = []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if 'stage' in node:
+            stages.append(node['stage'])
+        if 'inputStage' in node:
+            stack.append(node['inputStage'])
+        stack.extend(node.get('inputStages', []))
+        # SBE 引擎的計畫包在 queryPlan 中
+        if 'queryPlan' in node:
+            stack.append(node['queryPlan'])
+    return stages
+
+
+def _query_fields(query: dict) -> set:
+    """篩選條件用到的欄位（含 $or / $and 分支）"""
+    fields = set()
+    for key, value in query.items():
+        if key in ('$or', '$and'):
+            for branch in value:
+                fields |= _query_fields(branch)
+        elif not key.startswith('$'):
+            fields.add(key)
+    return fields
+
+
+def static_stages(collection, query: dict, sort: Optional[list] = None) -> List[str]:
+    """
+    不支援 explain 時（mongomock）以已建立的索引靜態判斷查詢計畫
+
+    索引第一個欄位出現在篩選條件中（或為第一個排序欄位）時視為 IXSCAN；
+    排序欄位需緊接在索引的篩選欄位前綴之後，否則另需記憶體內 SORT。
+
+    Args:
+        collection: pymongo / mongomock Collection
+        query: 篩選條件
+        sort: 排序
+
+    Returns:
+        List[str]: 推定的 stage（由上而下）
+    """
+    fields = _query_fields(query)
+    sort_fields = [field for field, _ in sort or []]
+    best = None
+    for name, info in sorted(collection.index_information().items()):
+        keys = [field for field, _ in info['key']]
+        if keys[0] not in fields and keys[0] != (sort_fields[0] if sort_fields else None):
+            continue
+        prefix = 0
+        while prefix < len(keys) and keys[prefix] in fields and keys[prefix] not in sort_fields:
+            prefix += 1
+        sorted_by_index = not sort_fields or keys[prefix:prefix + len(sort_fields)] == sort_fields
+        # 優先選不需 SORT 的索引，其次是篩選欄位前綴較長的索引
+        score = (sorted_by_index, prefix)
+        if best is None or score > best[1]:
+            best = (name, score)
+    if best is None:
+        return ['SORT', 'COLLSCAN'] if sort_fields else ['COLLSCAN']
+    stages = ['FETCH', f'IXSCAN {best[0]}']
+    return stages if best[1][0] else ['SORT'] + stages
+
+
+def explain_stages(collection, query: dict, sort: Optional[list] = None) -> Optional[List[str]]:
+    """
+    取得查詢計畫的 stage 列表
+
+    Args:
+        collection: pymongo Collection
+        query: 篩選條件
+        sort: 排序
+
+    Returns:
+        Optional[List[str]]: 勝出計畫的 stage（由上而下）；不支援 explain（mongomock）時為 None
+    """
+    cursor = collection.find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    if not hasattr(cursor, 'explain'):
+        return None
+    explain = cursor.explain()
+    return _plan_stages(explain['queryPlanner']['winningPlan'])
+
+
+def check_hot_queries(database) -> List[Tuple[str, List[str], bool]]:
+    """
+    檢查熱路徑查詢是否使用索引（不支援 explain 時改用 static_stages）
+
+    Args:
+        database: pymongo Database
+
+    Returns:
+        List[Tuple[str, List[str], bool]]: (查詢名稱, stage 列表, 是否通過)
+    """
+    results = []
+    for name, collection_name, query, sort in hot_queries():
+        collection = database[collection_name]
+        stages = explain_stages(collection, query, sort)
+        if stages is None:
+            stages = static_stages(collection, query, sort)
+        results.append((name, stages, 'COLLSCAN' not in stages))
+    return results
+
+
+def main(argv=None) -> int:
+    """主函式：建立索引並檢查查詢計畫，有 COLLSCAN 時回傳 1"""
+    parser = argparse.ArgumentParser(description='建立索引並檢查熱路徑查詢計畫')
+    parser.add_argument('--mongomock', action='store_true', help='使用 mongomock 而非 MONGODB_URI')
+    args = parser.parse_args(argv)
+
+    if args.mongomock:
+        import mongomock
+        database = mongomock.MongoClient()['safety_db']
+    else:
+        from pymongo import MongoClient
+        config = BackendConfig()
+        client = MongoClient(config.MONGODB_URI, serverSelectionTimeoutMS=5000)
+        database = client[config.MONGODB_DB_NAME]
+
+    names = ensure_indexes(database)
+    print(f'索引已就緒: {", ".join(names)}')
+
+    if args.mongomock:
+        print('mongomock 不支援 explain，改以已建立的索引靜態檢查（實際計畫請對 MongoDB 執行）')
+
+    failed = 0
+    for name, stages, ok in check_hot_queries(database):
+        print(f'{"OK  " if ok else "FAIL"} {name:<32} {" > ".join(stages)}')
+        if not ok:
+            failed += 1
+    return 1 if failed else 0
+
+
+__all__ = ['INDEXES', 'hot_queries', 'ensure_indexes', 'history_mode', 'explain_stages', 'static_stages',
+           'check_hot_queries']
+
+
+if __name__ == '__main__':
+    sys.exit(main())
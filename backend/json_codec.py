@@ -0,0 +1,123 @@
+"""
+API 回應 JSON 序列化
+有安裝 orjson 時使用 orjson（以 C 實作，直接輸出 UTF-8 位元組），否則退回標準函式庫 json。
+ObjectId 與 datetime 在序列化時才轉為字串與 Unix 時間戳，模型不必先複製或修改查詢結果。
+
+大型陣列可用 iter_json_object 分段輸出，搭配 Flask 串流回應以 chunked 傳輸，
+伺服器不需在記憶體中組出完整的回應本體。
+"""
+
+import json
+from datetime import datetime
+from itertools import islice
+from typing import Any, Iterable, Iterator
+from bson import ObjectId
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 目前使用的序列化實作
+ENGINE = 'orjson' if orjson is not None else 'json'
+
+# 分段輸出時每段的元素數
+CHUNK_ITEMS = 500
+
+
+def default(value: Any) -> Any:
+    """序列化 JSON 原生不支援的型別：datetime 轉 Unix 時間戳、ObjectId 轉字串"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f'無法序列化 {type(value).__name__}')
+
+
+def dumps_stdlib(obj: Any) -> bytes:
+    """以標準函式庫 json 序列化為 UTF-8 位元組"""
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+if orjson is not None:
+    # datetime 交給 default 轉為時間戳（orjson 預設輸出 RFC 3339 字串），與既有 API 格式一致
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        """序列化為 UTF-8 位元組"""
+        return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+else:
+    dumps = dumps_stdlib
+    loads = json.loads
+
+
+def iter_json_array(items: Iterable, chunk_items: int = CHUNK_ITEMS) -> Iterator[bytes]:
+    """
+    分段輸出 JSON 陣列（每段 chunk_items 個元素，只序列化一次）
+
+    Args:
+        items: 元素（可為 MongoDB cursor 等迭代器）
+        chunk_items: 每段元素數
+
+    Returns:
+        Iterator[bytes]: 依序串接即為完整陣列
+    """
+    iterator = iter(items)
+    yield b'['
+    separator = b''
+    while True:
+        chunk = list(islice(iterator, chunk_items))
+        if not chunk:
+            break
+        # 去掉外層方括號後以逗號接到前一段
+        yield separator + dumps(chunk)[1:-1]
+        separator = b','
+    yield b']'
+
+
+def iter_json_object(head: dict, key: str, items: Iterable, chunk_items: int = CHUNK_ITEMS) -> Iterator[bytes]:
+    """
+    分段輸出 {...head, key: [items]}，陣列放在最後
+
+    Args:
+        head: 其他欄位
+        key: 陣列欄位名稱
+        items: 陣列元素
+        chunk_items: 每段元素數
+
+    Returns:
+        Iterator[bytes]: 依序串接即為完整物件
+    """
+    prefix = dumps(head)[:-1]
+    yield prefix + (b',' if head else b'') + dumps(key) + b':'
+    yield from iter_json_array(items, chunk_items)
+    yield b'}'
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider：jsonify 與 app.json 改用 dumps / loads"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        return loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype='application/json')
+
+
+__all__ = [
+    'ENGINE',
+    'FastJSONProvider',
+    'default',
+    'dumps',
+    'dumps_stdlib',
+    'loads',
+    'iter_json_array',
+    'iter_json_object',
+]
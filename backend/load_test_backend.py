@@ -0,0 +1,488 @@
+"""
+後端整體壓力測試
+在本程序啟動後端（本機 mongod 或 mongomock）與假的車載端 MJPEG 來源，同時模擬：
+    N 台車輛定期 /api/update_device，並以 multipart 上報事故（/api/report_accident）
+    M 個儀表板以 ETag 輪詢 /api/get_accidents
+    V 位觀看者經由 /api/video 觀看假車載端的即時影像
+輸出各操作的吞吐量與延遲百分位數；可儲存為基準並在之後比較，退化超過容許範圍時回傳 1。
+
+使用方式：
+    python load_test_backend.py --mongomock
+    python load_test_backend.py --vehicles 200 --dashboards 50 --viewers 20 --duration 30
+    python load_test_backend.py --mongomock --save baseline.json
+    python load_test_backend.py --mongomock --baseline baseline.json --tolerance 0.2
+    python load_test_backend.py --url http://localhost:5000 --camera-host 10.0.0.2   # 測試已在執行的伺服器（例如 serve.py）
+
+使用 MONGODB_URI 時寫入 MONGODB_DB_NAME=safety_loadtest（可用 --db-name 指定），事故影像寫入暫存目錄。
+"""
+
+import argparse
+import json
+import random
+import struct
+import tempfile
+import threading
+import time
+from typing import Optional
+import requests
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.load_test_server import free_port, percentile
+
+
+def fake_jpeg(width: int, height: int, size: int, rng: random.Random) -> bytes:
+    """
+    產生檔頭合法、內容隨機的 JPEG（不需 OpenCV，每張雜湊不同）
+
+    Args:
+        width: 寬
+        height: 高
+        size: 約略位元組數
+        rng: 亂數產生器
+
+    Returns:
+        bytes: SOI + SOF0 + 填充用 COM 區段 + EOI
+    """
+    parts = [b'\xff\xd8', b'\xff\xc0' + struct.pack('>HBHHB', 17, 8, height, width, 3) + bytes(9)]
+    remaining = max(size - 25, 0)
+    while remaining > 0:
+        chunk = min(remaining, 65000)
+        parts.append(b'\xff\xfe' + struct.pack('>H', chunk + 2) + rng.getrandbits(chunk * 8).to_bytes(chunk, 'little'))
+        remaining -= chunk
+    parts.append(b'\xff\xd9')
+    return b''.join(parts)
+
+
+class Recorder:
+    """各操作的延遲與錯誤統計（執行緒安全）"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def record(self, operation: str, seconds: float, ok: bool):
+        """記錄一次操作"""
+        with self.lock:
+            if ok:
+                self.latencies.setdefault(operation, []).append(seconds)
+            else:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def timed(self, operation: str, call, ok_status=(200,)) -> Optional[requests.Response]:
+        """
+        執行並記錄一次 HTTP 請求
+
+        Args:
+            operation: 操作名稱
+            call: 送出請求的函式
+            ok_status: 視為成功的狀態碼
+
+        Returns:
+            Optional[requests.Response]: 回應，連線失敗時為 None
+        """
+        started = time.perf_counter()
+        try:
+            response = call()
+        except requests.RequestException:
+            self.record(operation, 0.0, False)
+            return None
+        self.record(operation, time.perf_counter() - started, response.status_code in ok_status)
+        return response
+
+    def summary(self, elapsed: float) -> dict:
+        """
+        Returns:
+            dict: {操作: {count, errors, error_rate, rps, p50_ms, p95_ms, p99_ms, max_ms}}
+        """
+        with self.lock:
+            operations = set(self.latencies) | set(self.errors)
+            result = {}
+            for operation in sorted(operations):
+                values = sorted(self.latencies.get(operation, []))
+                errors = self.errors.get(operation, 0)
+                total = len(values) + errors
+                result[operation] = {
+                    'count': len(values),
+                    'errors': errors,
+                    'error_rate': errors / total if total else 0.0,
+                    'rps': len(values) / elapsed,
+                    'p50_ms': percentile(values, 0.50) * 1000,
+                    'p95_ms': percentile(values, 0.95) * 1000,
+                    'p99_ms': percentile(values, 0.99) * 1000,
+                    'max_ms': (values[-1] if values else 0.0) * 1000,
+                }
+            return result
+
+
+def start_fake_camera(port: int, fps: float, frame_bytes: int) -> object:
+    """
+    啟動假的車載端（/video_stream 與 /snapshot.jpg）
+
+    Args:
+        port: 埠號
+        fps: 每秒幀數
+        frame_bytes: 每幀約略位元組數
+
+    Returns:
+        werkzeug 伺服器（呼叫 shutdown() 停止）
+    """
+    from flask import Flask, Response
+    from werkzeug.serving import make_server
+
+    camera = Flask(f'fake_camera_{port}')
+    rng = random.Random(port)
+    frames = [fake_jpeg(640, 480, frame_bytes, rng) for _ in range(8)]
+
+    @camera.route('/video_stream')
+    def video_stream():
+        def generate():
+            index = 0
+            interval = 1.0 / fps
+            next_at = time.monotonic()
+            while True:
+                frame = frames[index % len(frames)]
+                index += 1
+                yield b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame + b'\r\n'
+                next_at += interval
+                time.sleep(max(next_at - time.monotonic(), 0))
+        return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+    @camera.route('/snapshot.jpg')
+    def snapshot():
+        return Response(frames[int(time.monotonic() * fps) % len(frames)], mimetype='image/jpeg')
+
+    server = make_server('0.0.0.0', port, camera, threaded=True)
+    threading.Thread(target=server.serve_forever, name=f'fake-camera-{port}', daemon=True).start()
+    return server
+
+
+def start_backend(port: int) -> object:
+    """
+    在本程序以多執行緒伺服器啟動後端
+
+    Returns:
+        werkzeug 伺服器（呼叫 shutdown() 停止）
+    """
+    from werkzeug.serving import make_server
+    from backend.app import app
+
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='backend', daemon=True).start()
+    return server
+
+
+def paced(interval: float, end: float, stop: threading.Event):
+    """
+    以固定間隔產生迭代（interval 為 0 時不間斷），排程落後時不補送
+
+    Args:
+        interval: 間隔秒數
+        end: 結束時間（time.perf_counter）
+        stop: 提前結束事件
+    """
+    next_at = time.perf_counter()
+    while not stop.is_set() and time.perf_counter() < end:
+        yield
+        if interval > 0:
+            next_at = max(next_at + interval, time.perf_counter() - interval)
+            stop.wait(max(next_at - time.perf_counter(), 0))
+
+
+def vehicle_session(args) -> requests.Session:
+    """車載端請求使用的 Session（帶 API_TOKEN）"""
+    session = requests.Session()
+    if args.api_token:
+        session.headers['Authorization'] = f'Bearer {args.api_token}'
+    return session
+
+
+def vehicle_worker(base_url: str, index: int, args, end: float, stop: threading.Event, recorder: Recorder):
+    """一台車：定期回報位置"""
+    session = vehicle_session(args)
+    rng = random.Random(index)
+    device_id = f'loadtest_{index:04d}'
+    lat, lon = 25.0 + rng.random() * 0.1, 121.5 + rng.random() * 0.1
+    for _ in paced(args.position_interval, end, stop):
+        lat += rng.uniform(-0.0002, 0.0002)
+        lon += rng.uniform(-0.0002, 0.0002)
+        recorder.timed('update_device', lambda: session.post(f'{base_url}/api/update_device', json={
+            'device_id': device_id, 'latitude': lat, 'longitude': lon, 'timestamp': time.time()
+        }, timeout=10))
+
+
+def accident_worker(base_url: str, args, end: float, stop: threading.Event, recorder: Recorder):
+    """車隊事故上報：依 accidents_per_min 以 multipart 上傳事故與關鍵幀"""
+    session = vehicle_session(args)
+    rng = random.Random(-1)
+    interval = 60.0 / args.accidents_per_min
+    for _ in paced(interval, end, stop):
+        metadata = {
+            'device_id': f'loadtest_{rng.randrange(max(args.vehicles, 1)):04d}',
+            'latitude': 25.0 + rng.random() * 0.1,
+            'longitude': 121.5 + rng.random() * 0.1,
+            'timestamp': time.time(),
+            'has_injured': rng.random() < 0.2,
+            'report_id': f'loadtest-{rng.getrandbits(64):016x}'
+        }
+        files = [('image', (f'keyframe_{i}.jpg', fake_jpeg(640, 480, args.frame_bytes, rng), 'image/jpeg'))
+                 for i in range(args.keyframes)]
+        recorder.timed('report_accident', lambda: session.post(
+            f'{base_url}/api/report_accident', data={'metadata': json.dumps(metadata)}, files=files, timeout=30))
+
+
+def dashboard_worker(base_url: str, index: int, args, end: float, stop: threading.Event, recorder: Recorder):
+    """一個儀表板：帶 ETag 輪詢事故列表"""
+    session = requests.Session()
+    etag = None
+    # 錯開各儀表板的起始時間
+    stop.wait(random.Random(index).random() * args.poll_interval)
+    for _ in paced(args.poll_interval, end, stop):
+        headers = {'If-None-Match': etag} if etag else {}
+        response = recorder.timed('get_accidents', lambda: session.get(
+            f'{base_url}/api/get_accidents', params={'limit': 100}, headers=headers, timeout=10), ok_status=(200, 304))
+        if response is not None and response.headers.get('ETag'):
+            etag = response.headers['ETag']
+
+
+def viewer_worker(base_url: str, device_id: str, end: float, stop: threading.Event, recorder: Recorder,
+                  frame_rates: list):
+    """一位觀看者：經由後端轉送觀看影像，記錄第一幀延遲與第一幀之後的幀率"""
+    from backend.video_relay import MJPEGParser, parse_boundary
+
+    started = time.perf_counter()
+    first_at = None
+    frames = 0
+    try:
+        with requests.get(f'{base_url}/api/video/{device_id}', stream=True, timeout=(5, 15)) as response:
+            if response.status_code != 200:
+                recorder.record('video_first_frame', 0.0, False)
+                return
+            parser = MJPEGParser(parse_boundary(response.headers.get('Content-Type', '')))
+            for chunk in response.iter_content(chunk_size=None):
+                count = len(parser.feed(chunk))
+                if count and first_at is None:
+                    first_at = time.perf_counter()
+                    recorder.record('video_first_frame', first_at - started, True)
+                    count -= 1
+                frames += count
+                if stop.is_set() or time.perf_counter() >= end:
+                    break
+    except requests.RequestException:
+        if first_at is None:
+            recorder.record('video_first_frame', 0.0, False)
+    finally:
+        watched = time.perf_counter() - first_at if first_at is not None else 0.0
+        frame_rates.append(frames / watched if watched > 0 else 0.0)
+
+
+def run(base_url: str, args) -> dict:
+    """
+    執行壓力測試
+
+    Args:
+        base_url: 後端位址
+        args: 命令列參數
+
+    Returns:
+        dict: {'operations': {...}, 'video': {...}, 'elapsed': 秒數}
+
+    Raises:
+        RuntimeError: 假車載端無法向後端登記串流位址
+    """
+    recorder = Recorder()
+    stop = threading.Event()
+
+    # 假車載端向後端登記串流位址
+    cameras = []
+    for i in range(args.cameras if args.viewers else 0):
+        port = free_port()
+        cameras.append((f'loadtest_cam_{i}', port, start_fake_camera(port, args.fps, args.frame_bytes)))
+        try:
+            response = vehicle_session(args).post(f'{base_url}/api/device_heartbeat', json={
+                'device_id': f'loadtest_cam_{i}', 'stream_url': f'http://{args.camera_host}:{port}'
+            }, timeout=10)
+        except requests.RequestException as e:
+            raise RuntimeError(f'假車載端心跳失敗: {e}')
+        if response.status_code != 200:
+            raise RuntimeError(f'假車載端心跳失敗（HTTP {response.status_code}）: {response.text.strip()}\n'
+                               '後端須設定 API_TOKEN（並以 --api-token 帶入）或讓 DEVICE_STREAM_NETWORKS 涵蓋 '
+                               f'{args.camera_host}；不需影像時可用 --viewers 0')
+
+    started = time.perf_counter()
+    end = started + args.duration
+    threads = []
+    for i in range(args.vehicles):
+        threads.append(threading.Thread(target=vehicle_worker, args=(base_url, i, args, end, stop, recorder)))
+    if args.accidents_per_min > 0:
+        threads.append(threading.Thread(target=accident_worker, args=(base_url, args, end, stop, recorder)))
+    for i in range(args.dashboards):
+        threads.append(threading.Thread(target=dashboard_worker, args=(base_url, i, args, end, stop, recorder)))
+    frame_rates = []
+    for i in range(args.viewers):
+        device_id = cameras[i % len(cameras)][0]
+        threads.append(threading.Thread(target=viewer_worker,
+                                        args=(base_url, device_id, end, stop, recorder, frame_rates)))
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join(max(end - time.perf_counter(), 0) + 15)
+    except KeyboardInterrupt:
+        stop.set()
+    stop.set()
+    elapsed = time.perf_counter() - started
+
+    for _, _, server in cameras:
+        server.shutdown()
+
+    fps = sorted(frame_rates)
+    return {
+        'elapsed': elapsed,
+        'operations': recorder.summary(elapsed),
+        'video': {
+            'viewers': len(fps),
+            'source_fps': args.fps if fps else 0.0,
+            'mean_fps': sum(fps) / len(fps) if fps else 0.0,
+            'min_fps': fps[0] if fps else 0.0,
+        }
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """
+    與基準比較
+
+    吞吐量下降、p95 延遲上升超過 tolerance（且至少 5 ms）、錯誤率上升超過 1%，
+    或觀看者平均幀率下降超過 tolerance 時視為退化。
+
+    Args:
+        result: 本次結果
+        baseline: 基準結果
+        tolerance: 容許比例（例如 0.2 為 20%）
+
+    Returns:
+        list: 退化說明（空列表表示通過）
+    """
+    problems = []
+    for operation, current in result['operations'].items():
+        base = baseline.get('operations', {}).get(operation)
+        if base is None:
+            continue
+        if current['rps'] < base['rps'] * (1 - tolerance):
+            problems.append(f"{operation} 吞吐量 {current['rps']:.1f}/s 低於基準 {base['rps']:.1f}/s")
+        if current['p95_ms'] > base['p95_ms'] * (1 + tolerance) and current['p95_ms'] - base['p95_ms'] > 5:
+            problems.append(f"{operation} p95 {current['p95_ms']:.1f} ms 高於基準 {base['p95_ms']:.1f} ms")
+        if current['error_rate'] > base['error_rate'] + 0.01:
+            problems.append(f"{operation} 錯誤率 {current['error_rate']:.1%} 高於基準 {base['error_rate']:.1%}")
+    base_video = baseline.get('video', {})
+    if base_video.get('mean_fps') and result['video']['mean_fps'] < base_video['mean_fps'] * (1 - tolerance):
+        problems.append(f"影像平均 {result['video']['mean_fps']:.1f} fps 低於基準 {base_video['mean_fps']:.1f} fps")
+    return problems
+
+
+def print_report(result: dict):
+    """輸出結果表格"""
+    print(f"{'操作':<18}{'次數':>8}{'錯誤':>7}{'次/秒':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for operation, stats in result['operations'].items():
+        print(f"{operation:<18}{stats['count']:>8}{stats['errors']:>7}{stats['rps']:>9.1f}"
+              f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}")
+    video = result['video']
+    if video['viewers']:
+        print(f"影像 {video['viewers']} 位觀看者：來源 {video['source_fps']:.0f} fps，"
+              f"平均 {video['mean_fps']:.1f} fps，最低 {video['min_fps']:.1f} fps")
+
+
+def main(argv=None) -> int:
+    """主函式"""
+    parser = argparse.ArgumentParser(description='後端整體壓力測試（車輛、儀表板、影像觀看者）')
+    parser.add_argument('--mongomock', action='store_true', help='使用 mongomock 而非 MONGODB_URI')
+    parser.add_argument('--db-name', default='safety_loadtest', help='使用 MONGODB_URI 時的資料庫名稱')
+    parser.add_argument('--url', help='測試已在執行的後端（不在本程序啟動）')
+    parser.add_argument('--api-token', default=os.getenv('API_TOKEN', '').split(',')[0].strip(),
+                        help='車載端請求帶的 API_TOKEN（預設取環境變數 API_TOKEN 的第一組）')
+    parser.add_argument('--camera-host', default='127.0.0.1', help='後端連到本機假車載端的位址')
+    parser.add_argument('--vehicles', type=int, default=50, help='車輛數')
+    parser.add_argument('--position-interval', type=float, default=1.0, help='每台車回報位置的間隔（秒，0 為不間斷）')
+    parser.add_argument('--accidents-per-min', type=float, default=30.0, help='車隊每分鐘上報事故數（0 為不上報）')
+    parser.add_argument('--keyframes', type=int, default=3, help='每次事故的關鍵幀數')
+    parser.add_argument('--dashboards', type=int, default=20, help='輪詢事故列表的儀表板數')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='儀表板輪詢間隔（秒，0 為不間斷）')
+    parser.add_argument('--viewers', type=int, default=10, help='影像觀看者數')
+    parser.add_argument('--cameras', type=int, default=2, help='假車載端數（觀看者平均分配）')
+    parser.add_argument('--fps', type=float, default=15.0, help='假車載端每秒幀數')
+    parser.add_argument('--frame-bytes', type=int, default=40 * 1024, help='每幀與關鍵幀的約略大小')
+    parser.add_argument('--duration', type=float, default=20.0, help='測試秒數')
+    parser.add_argument('--save', help='將結果儲存為基準 JSON')
+    parser.add_argument('--baseline', help='與基準 JSON 比較，退化時回傳 1')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='與基準比較的容許比例')
+    args = parser.parse_args(argv)
+
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        # 後端模組在載入時讀取設定，須先設定環境變數
+        os.environ['BLOB_STORE'] = 'filesystem'
+        os.environ['BLOB_STORE_DIR'] = tempfile.mkdtemp(prefix='safety_loadtest_blobs_')
+        os.environ['VEHICLE_STREAM_FALLBACK'] = 'false'
+        # 假車載端在本機，未設定 API_TOKEN 時仍須接受其串流位址
+        os.environ.setdefault('DEVICE_STREAM_NETWORKS', '127.0.0.0/8')
+        if args.mongomock:
+            # 不嘗試連線真正的 MongoDB
+            os.environ['MONGODB_URI'] = 'mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=10'
+        else:
+            os.environ['MONGODB_DB_NAME'] = args.db_name
+
+        from backend import models
+        from backend.indexes import ensure_indexes
+        if args.mongomock:
+            import mongomock
+            models.db.db = mongomock.MongoClient()['safety_db']
+            ensure_indexes(models.db.db)
+        if models.db.db is None:
+            print('MongoDB 未連接，請設定 MONGODB_URI 或使用 --mongomock')
+            return 1
+        for name in ('accidents', 'devices', 'device_positions', 'device_position_buckets'):
+            models.db.get_collection(name).delete_many({'device_id': {'$regex': '^loadtest_'}})
+
+        port = free_port()
+        start_backend(port)
+        base_url = f'http://127.0.0.1:{port}'
+
+    print(f"車輛 {args.vehicles}（每 {args.position_interval:g} 秒回報位置，每分鐘 {args.accidents_per_min:g} 件事故）、"
+          f"儀表板 {args.dashboards}（每 {args.poll_interval:g} 秒輪詢）、觀看者 {args.viewers}，"
+          f"{args.duration:g} 秒：{base_url}")
+    try:
+        result = run(base_url, args)
+    except RuntimeError as e:
+        print(e)
+        return 1
+    finally:
+        if not args.url:
+            from backend.models import position_buffer
+            position_buffer.stop()
+    print_report(result)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f'結果已寫入 {args.save}')
+
+    failed = any(stats['error_rate'] > 0.01 for stats in result['operations'].values())
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(result, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f'退化: {problem}')
+        if not problems:
+            print(f'與基準 {args.baseline} 相比沒有超過 {args.tolerance:.0%} 的退化')
+        failed = failed or bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+裝置位置寫入壓力測試
+以多個執行緒模擬車隊持續呼叫 /api/update_device，比較直接寫入與 write-behind 緩衝的持續寫入速率。
+
+使用方式：
+    python load_test_devices.py --mongomock                  # 不需 mongod
+    python load_test_devices.py --devices 500 --duration 20  # 對 MONGODB_URI 測試
+    python load_test_devices.py --mongomock --mode buffered --history
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run_load(client, devices: int, threads: int, duration: float) -> dict:
+    """
+    以 threads 個執行緒在 duration 秒內盡可能送出位置更新
+
+    Args:
+        client: Flask 測試客戶端
+        devices: 模擬裝置數
+        threads: 執行緒數
+        duration: 測試秒數
+
+    Returns:
+        dict: 請求數、錯誤數、每秒請求數與最後送出的位置
+    """
+    from backend.config import BackendConfig
+    # 後端設定 API_TOKEN 時帶第一組 Token
+    api_token = BackendConfig.API_TOKEN.split(',')[0].strip()
+    headers = {'Authorization': f'Bearer {api_token}'} if api_token else {}
+
+    deadline = time.perf_counter() + duration
+    counts = [0] * threads
+    errors = [0] * threads
+    # 每台裝置只由一個執行緒送出，最後位置可確定
+    latest = [{} for _ in range(threads)]
+
+    def worker(index: int):
+        rng = random.Random(index)
+        owned = [f'vehicle_{i:04d}' for i in range(index, devices, threads)]
+        if not owned:
+            return
+        while time.perf_counter() < deadline:
+            device_id = rng.choice(owned)
+            lat = 25.0 + rng.random() * 0.1
+            lon = 121.5 + rng.random() * 0.1
+            response = client.post('/api/update_device', json={
+                'device_id': device_id,
+                'latitude': lat,
+                'longitude': lon
+            }, headers=headers)
+            if response.status_code == 200:
+                latest[index][device_id] = (lat, lon)
+                counts[index] += 1
+            else:
+                errors[index] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'requests': sum(counts),
+        'errors': sum(errors),
+        'seconds': elapsed,
+        'requests_per_second': sum(counts) / elapsed,
+        'latest': {k: v for part in latest for k, v in part.items()}
+    }
+
+
+def verify(latest: dict) -> int:
+    """
+    確認資料庫中每台裝置都是最後送出的位置
+
+    Returns:
+        int: 不一致的裝置數
+    """
+    from backend.models import db
+
+    mismatched = 0
+    stored = {d['device_id']: (d['latitude'], d['longitude']) for d in db.get_collection('devices').find()}
+    for device_id, position in latest.items():
+        if stored.get(device_id) != position:
+            mismatched += 1
+    return mismatched
+
+
+def main(argv=None) -> int:
+    """主函式"""
+    parser = argparse.ArgumentParser(description='裝置位置寫入壓力測試')
+    parser.add_argument('--mongomock', action='store_true', help='使用 mongomock 而非 MONGODB_URI')
+    parser.add_argument('--mode', choices=['direct', 'buffered', 'both'], default='both')
+    parser.add_argument('--devices', type=int, default=200, help='模擬裝置數')
+    parser.add_argument('--threads', type=int, default=8, help='送出請求的執行緒數')
+    parser.add_argument('--duration', type=float, default=10.0, help='每種模式的測試秒數')
+    parser.add_argument('--history', action='store_true', help='同時寫入歷史軌跡')
+    parser.add_argument('--output', default=None, help='結果 JSON 輸出路徑')
+    args = parser.parse_args(argv)
+
+    from backend import models
+    if args.mongomock:
+        import mongomock
+        models.db.db = mongomock.MongoClient()['safety_db']
+        from backend.indexes import ensure_indexes
+        ensure_indexes(models.db.db)
+    if models.db.db is None:
+        print('MongoDB 未連接，請設定 MONGODB_URI 或使用 --mongomock')
+        return 1
+
+    from backend.app import app
+    client = app.test_client()
+    models._position_config.DEVICE_HISTORY = args.history
+    models.position_buffer.history = args.history
+
+    modes = ['direct', 'buffered'] if args.mode == 'both' else [args.mode]
+    results = {}
+    for mode in modes:
+        models.db.get_collection('devices').delete_many({})
+        models.db.get_collection('device_positions').delete_many({})
+        models.db.get_collection('device_position_buckets').delete_many({})
+        models.device_history.last_recorded.clear()
+        models._position_config.DEVICE_WRITE_BEHIND = mode == 'buffered'
+
+        before = models.position_buffer.stats()
+        result = run_load(client, args.devices, args.threads, args.duration)
+        flush_start = time.perf_counter()
+        models.position_buffer.flush()
+        result['final_flush_ms'] = (time.perf_counter() - flush_start) * 1000
+        after = models.position_buffer.stats()
+
+        if mode == 'buffered':
+            result['bulk_writes'] = after['flushes'] - before['flushes']
+            result['device_writes'] = after['written'] - before['written']
+        else:
+            result['bulk_writes'] = 0
+            result['device_writes'] = result['requests']
+        result['mismatched_devices'] = verify(result.pop('latest'))
+        result['history_samples'] = models.db.get_collection('device_positions').count_documents({}) + sum(
+            b['count'] for b in models.db.get_collection('device_position_buckets').find({}, {'count': 1}))
+        results[mode] = result
+
+        print(f"{mode:<9} {result['requests_per_second']:>9.0f} 次/秒  "
+              f"請求 {result['requests']}  資料庫寫入 {result['device_writes']}"
+              f"（bulk {result['bulk_writes']} 次）  歷史 {result['history_samples']}  "
+              f"不一致 {result['mismatched_devices']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'結果已寫入 {args.output}')
+
+    models.position_buffer.stop()
+    return 1 if any(r['mismatched_devices'] or r['errors'] for r in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+伺服器模式壓力測試
+在儀表板輪詢的同時維持多條 SSE / MJPEG 長連線，比較開發伺服器（app.run）與 gunicorn 的吞吐量與延遲。
+自行啟動的伺服器在測試後以 SIGTERM 關閉，並記錄關閉所需時間（串流仍連線中）。
+
+使用方式：
+    python load_test_server.py --spawn dev --spawn gthread           # 依序啟動並比較
+    python load_test_server.py --spawn gevent --streams 500          # 需 pip install gevent
+    python load_test_server.py --url http://localhost:5000           # 測試已在執行的伺服器
+    python load_test_server.py --spawn dev --path /api/health        # 不需 MongoDB
+"""
+
+import argparse
+import signal
+import socket
+import subprocess
+import threading
+import time
+import requests
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATHS = ['/api/health', '/api/get_accidents?limit=20']
+
+
+def free_port() -> int:
+    """取得一個未使用的埠號"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(mode: str, port: int, workers: int = 0, threads: int = 0) -> subprocess.Popen:
+    """
+    啟動後端伺服器子程序
+
+    Args:
+        mode: dev（app.py 開發伺服器）、gthread 或 gevent（serve.py）
+        port: 埠號
+        workers: gunicorn worker 數（0 表示 SERVER_WORKERS）
+        threads: gthread 執行緒數（0 表示 SERVER_THREADS）
+
+    Returns:
+        subprocess.Popen: 伺服器程序
+    """
+    env = dict(os.environ, FLASK_HOST='127.0.0.1', FLASK_PORT=str(port), FLASK_DEBUG='false')
+    if mode == 'dev':
+        command = [sys.executable, 'app.py']
+    else:
+        command = [sys.executable, 'serve.py', '--worker-class', mode]
+        if workers:
+            command += ['--workers', str(workers)]
+        if threads and mode == 'gthread':
+            command += ['--threads', str(threads)]
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(base_url: str, timeout: float = 30.0) -> bool:
+    """等待 /api/health 回應"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{base_url}/api/health', timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """已排序數列的百分位數"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * q), len(sorted_values) - 1)]
+
+
+def hold_stream(base_url: str, path: str, stop: threading.Event, counters: dict, lock: threading.Lock):
+    """
+    維持一條長連線並持續讀取（模擬 SSE / MJPEG 觀看者）
+
+    Args:
+        base_url: 伺服器位址
+        path: 串流路徑
+        stop: 結束事件
+        counters: 共用統計（connected、bytes、failed）
+        lock: 統計鎖
+    """
+    try:
+        with requests.get(f'{base_url}{path}', stream=True, timeout=(5, 30)) as response:
+            response.raise_for_status()
+            with lock:
+                counters['connected'] += 1
+            for chunk in response.iter_content(chunk_size=None):
+                with lock:
+                    counters['bytes'] += len(chunk)
+                if stop.is_set():
+                    break
+    except requests.RequestException:
+        if not stop.is_set():
+            with lock:
+                counters['failed'] += 1
+
+
+def run_load(base_url: str, paths: list, clients: int, streams: int, stream_path: str,
+             duration: float) -> dict:
+    """
+    先建立 streams 條長連線，再以 clients 個執行緒在 duration 秒內輪詢 paths
+
+    Args:
+        base_url: 伺服器位址
+        paths: 輪詢路徑（依序輪流）
+        clients: 輪詢執行緒數
+        streams: 長連線數
+        stream_path: 長連線路徑
+        duration: 測試秒數
+
+    Returns:
+        dict: 請求數、錯誤數、每秒請求數、延遲百分位數與長連線統計
+    """
+    stop = threading.Event()
+    lock = threading.Lock()
+    stream_counters = {'connected': 0, 'bytes': 0, 'failed': 0}
+    stream_threads = [
+        threading.Thread(target=hold_stream, args=(base_url, stream_path, stop, stream_counters, lock), daemon=True)
+        for _ in range(streams)
+    ]
+    for thread in stream_threads:
+        thread.start()
+    # 等待長連線建立（最多 10 秒）
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        with lock:
+            if stream_counters['connected'] + stream_counters['failed'] >= streams:
+                break
+        time.sleep(0.1)
+
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+    end = time.perf_counter() + duration
+
+    def worker(index: int):
+        session = requests.Session()
+        etags = {}
+        i = index
+        while time.perf_counter() < end:
+            path = paths[i % len(paths)]
+            i += 1
+            headers = {'If-None-Match': etags[path]} if path in etags else {}
+            started = time.perf_counter()
+            try:
+                response = session.get(f'{base_url}{path}', headers=headers, timeout=10)
+                if response.status_code in (200, 304):
+                    latencies[index].append(time.perf_counter() - started)
+                    if 'ETag' in response.headers:
+                        etags[path] = response.headers['ETag']
+                else:
+                    errors[index] += 1
+            except requests.RequestException:
+                errors[index] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    merged = sorted(value for values in latencies for value in values)
+    return {
+        'requests': len(merged),
+        'errors': sum(errors),
+        'rps': len(merged) / elapsed,
+        'p50_ms': percentile(merged, 0.50) * 1000,
+        'p95_ms': percentile(merged, 0.95) * 1000,
+        'p99_ms': percentile(merged, 0.99) * 1000,
+        'streams_connected': stream_counters['connected'],
+        'streams_failed': stream_counters['failed'],
+        'stream_bytes': stream_counters['bytes'],
+    }
+
+
+def terminate(process: subprocess.Popen, timeout: float = 30.0) -> float:
+    """
+    以 SIGTERM 關閉伺服器
+
+    Returns:
+        float: 程序結束所需秒數（逾時後強制結束）
+    """
+    started = time.perf_counter()
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    return time.perf_counter() - started
+
+
+def print_result(label: str, result: dict):
+    """輸出單一伺服器的結果"""
+    line = (f"{label:<10} {result['rps']:>9.0f} req/s  p50 {result['p50_ms']:>7.1f} ms  "
+            f"p95 {result['p95_ms']:>7.1f} ms  p99 {result['p99_ms']:>7.1f} ms  "
+            f"錯誤 {result['errors']:>5}  串流 {result['streams_connected']}/{result['streams_connected'] + result['streams_failed']}")
+    if 'shutdown_s' in result:
+        line += f"  關閉 {result['shutdown_s']:.1f} s"
+    print(line)
+
+
+def main(argv=None) -> int:
+    """主函式"""
+    parser = argparse.ArgumentParser(description='比較開發伺服器與 gunicorn 的吞吐量')
+    parser.add_argument('--spawn', action='append', choices=['dev', 'gthread', 'gevent'],
+                        help='自行啟動的伺服器模式（可重複指定）')
+    parser.add_argument('--url', help='測試已在執行的伺服器（與 --spawn 擇一）')
+    parser.add_argument('--path', action='append', help=f'輪詢路徑（可重複，預設 {" ".join(DEFAULT_PATHS)}）')
+    parser.add_argument('--clients', type=int, default=32, help='輪詢執行緒數')
+    parser.add_argument('--streams', type=int, default=50, help='同時維持的長連線數')
+    parser.add_argument('--stream-path', default='/api/events', help='長連線路徑（例如 /api/video/vehicle_001）')
+    parser.add_argument('--duration', type=float, default=10.0, help='每個伺服器的測試秒數')
+    parser.add_argument('--workers', type=int, default=0, help='gunicorn worker 數（0 表示 SERVER_WORKERS）')
+    parser.add_argument('--threads', type=int, default=0, help='gthread 執行緒數（0 表示 SERVER_THREADS）')
+    args = parser.parse_args(argv)
+
+    if not args.spawn and not args.url:
+        parser.error('請指定 --spawn 或 --url')
+    paths = args.path or DEFAULT_PATHS
+
+    print(f"輪詢 {args.clients} 個執行緒（{', '.join(paths)}），"
+          f"長連線 {args.streams} 條（{args.stream_path}），每個伺服器 {args.duration:.0f} 秒")
+
+    if args.url:
+        print_result('url', run_load(args.url.rstrip('/'), paths, args.clients, args.streams,
+                                     args.stream_path, args.duration))
+        return 0
+
+    for mode in args.spawn:
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        process = spawn_server(mode, port, args.workers, args.threads)
+        try:
+            if not wait_ready(base_url):
+                print(f'{mode:<10} 伺服器未能啟動')
+                continue
+            result = run_load(base_url, paths, args.clients, args.streams, args.stream_path, args.duration)
+        finally:
+            shutdown = terminate(process)
+        result['shutdown_s'] = shutdown
+        print_result(mode, result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
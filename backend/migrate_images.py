@@ -0,0 +1,26 @@
+"""
+舊資料搬移腳本
+將事故文件內嵌的 base64 影像搬移到內容定址影像儲存，
+並為只有經緯度欄位的事故補上 GeoJSON location
+
+使用方式：
+    python migrate_images.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.models import AccidentModel
+
+
+def main():
+    """主函式"""
+    migrated = AccidentModel.migrate_inline_images()
+    print(f'已搬移 {migrated} 筆事故影像')
+    located = AccidentModel.backfill_locations()
+    print(f'已補上 {located} 筆事故座標')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,15 +2,26 @@
 MongoDB 資料模型
 """
 
-from datetime import datetime
-from typing import Optional
-from pymongo import MongoClient
+import atexit
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+from pymongo import MongoClient, ReplaceOne, ReturnDocument
 from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backend.config import BackendConfig
+from backend.blob_store import decode_image, get_blob_store, image_info
+from backend.indexes import ensure_indexes, history_mode
+from backend.queries import geo_point, parse_timestamp
+from backend import queries
+from backend.downsample import distance_meters, downsample
+from backend.cache import get_cache
+from backend import events
 
 class Database:
     """資料庫連接類別"""
@@ -24,6 +35,8 @@ class Database:
             self.client.server_info()
             self.db = self.client[self.config.MONGODB_DB_NAME]
             print(f'MongoDB 連接成功: {self.config.MONGODB_DB_NAME}')
+            # 建立索引（已存在則略過）
+            ensure_indexes(self.db)
         except Exception as e:
             print(f'MongoDB 連接失敗: {e}')
             print('將使用空資料庫模式（資料不會被保存）')
@@ -48,27 +61,120 @@ class Database:
 # 全域資料庫實例
 db = Database()
 
+def serialize_doc(doc: dict) -> dict:
+    """
+    將文件轉為可 JSON 序列化的格式（ObjectId 轉字串、datetime 轉時間戳）
+    
+    Args:
+        doc: MongoDB 文件（原地修改）
+    
+    Returns:
+        dict: 同一份文件
+    """
+    from bson import ObjectId
+    
+    for key, value in doc.items():
+        if isinstance(value, datetime):
+            doc[key] = value.timestamp()
+        elif isinstance(value, ObjectId):
+            doc[key] = str(value)
+    return doc
+
+class CollectionVersion:
+    """
+    集合版本號（每次寫入遞增，作為列表 ETag）
+    
+    版本號存在 meta 集合中供多個 worker 共用；讀取時在本機快取
+    sync_interval 秒，未變動的輪詢可直接回 304 而不查詢資料庫。
+    本程序的寫入會立即更新本機值。
+    """
+    
+    def __init__(self, name: str, sync_interval: float = 1.0):
+        """
+        Args:
+            name: 集合名稱（同時作為快取命名空間）
+            sync_interval: 重新讀取共用版本號的間隔（秒）
+        """
+        self.name = name
+        self.key = f'version:{name}'
+        self.sync_interval = sync_interval
+        self.value = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+    
+    def bump(self) -> int:
+        """
+        寫入後遞增版本號並清除該集合的讀取快取
+        
+        Returns:
+            int: 新版本號
+        """
+        doc = db.get_collection('meta').find_one_and_update(
+            {'_id': self.key},
+            {'$inc': {'value': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        with self.lock:
+            self.value = doc['value']
+            self.checked_at = time.monotonic()
+        get_cache().invalidate(self.name)
+        return self.value
+    
+    def current(self) -> Optional[int]:
+        """
+        取得目前版本號
+        
+        Returns:
+            Optional[int]: 版本號，資料庫無法連線時為 None
+        """
+        now = time.monotonic()
+        if self.value is not None and now - self.checked_at < self.sync_interval:
+            return self.value
+        try:
+            doc = db.get_collection('meta').find_one({'_id': self.key})
+        except Exception:
+            return None
+        with self.lock:
+            self.value = doc['value'] if doc else 0
+            self.checked_at = now
+        return self.value
+
+
+# 事故集合版本號
+accident_version = CollectionVersion('accidents')
+
 class AccidentModel:
     """事故資料模型"""
     
     @staticmethod
-    def create(accident_data: dict) -> str:
+    def create(accident_data: dict, images: Optional[List[dict]] = None) -> str:
         """
         建立事故記錄
         
+        車載端重送時帶相同的 report_id，已建立過則直接回傳原本的事故 ID。
+        
         Args:
             accident_data: 事故資料
+            images: 已寫入影像儲存的關鍵幀（store_image / store_image_stream 的結果，依順序）
         
         Returns:
             str: 事故 ID
         """
         collection = db.get_collection('accidents')
         
+        report_id = accident_data.get('report_id')
+        if report_id:
+            existing = collection.find_one({'report_id': report_id}, {'_id': 1})
+            if existing:
+                return str(existing['_id'])
+        
         accident_doc = {
             'latitude': accident_data['latitude'],
             'longitude': accident_data['longitude'],
+            # 地理查詢用（2dsphere 索引）
+            'location': geo_point(accident_data['latitude'], accident_data['longitude']),
             'timestamp': datetime.fromtimestamp(accident_data.get('timestamp', datetime.now().timestamp())),
-            'image': accident_data.get('image', ''),
             'device_id': accident_data.get('device_id', ''),
             # 是否有民眾受傷（布林值）
             'has_injured': accident_data.get('has_injured', False),
@@ -77,9 +183,402 @@ class AccidentModel:
             'updated_at': datetime.now()
         }
         
-        result = collection.insert_one(accident_doc)
+        # 影像寫入內容定址儲存，文件只保留雜湊與尺寸；第一張關鍵幀同時存於 image_* 欄位
+        images = list(images or [])
+        if accident_data.get('image'):
+            images.insert(0, AccidentModel.store_image(decode_image(accident_data['image'])))
+        if images:
+            accident_doc.update(images[0])
+            accident_doc['image_count'] = len(images)
+            accident_doc['images'] = [
+                {key[len('image_'):]: value for key, value in image.items()} for image in images
+            ]
+        if report_id:
+            accident_doc['report_id'] = report_id
+        
+        try:
+            result = collection.insert_one(accident_doc)
+        except DuplicateKeyError:
+            # 同一份上報的兩次重送同時抵達
+            return str(collection.find_one({'report_id': report_id}, {'_id': 1})['_id'])
+        accident_version.bump()
+        events.publish('accident.created', serialize_doc(dict(accident_doc)))
         return str(result.inserted_id)
     
+    @staticmethod
+    def store_image(data: bytes) -> dict:
+        """
+        將影像寫入影像儲存
+        
+        Args:
+            data: 影像位元組
+        
+        Returns:
+            dict: 要存入事故文件的影像欄位
+        """
+        content_type, width, height = image_info(data)
+        return {
+            'image_hash': get_blob_store().put(data),
+            'image_type': content_type,
+            'image_width': width,
+            'image_height': height,
+            'image_size': len(data)
+        }
+    
+    @staticmethod
+    def store_image_stream(stream: BinaryIO, max_size: int) -> dict:
+        """
+        將上傳串流直接寫入影像儲存（不整個讀入記憶體）
+        
+        Args:
+            stream: 上傳檔案或請求本體串流
+            max_size: 位元組上限
+        
+        Returns:
+            dict: 要存入事故文件的影像欄位
+        
+        Raises:
+            ValueError: 超過上限、內容為空或不是影像
+        """
+        digest, size, head = get_blob_store().put_stream(stream, max_size)
+        content_type, width, height = image_info(head)
+        if content_type == 'application/octet-stream':
+            get_blob_store().delete(digest)
+            raise ValueError('上傳內容不是 JPEG 或 PNG 影像')
+        return {
+            'image_hash': digest,
+            'image_type': content_type,
+            'image_width': width,
+            'image_height': height,
+            'image_size': size
+        }
+    
+    @staticmethod
+    def get_image_meta(accident_id: str, index: int = 0) -> Optional[dict]:
+        """
+        取得事故影像的雜湊與格式（不讀取影像本體）
+        
+        舊版文件內嵌的 base64 影像會在此時搬移到影像儲存。
+        
+        Args:
+            accident_id: 事故 ID
+            index: 第幾張關鍵幀（0 為第一張）
+        
+        Returns:
+            Optional[dict]: {'image_hash': ..., 'image_type': ...}，沒有影像則為 None
+        """
+        from bson import ObjectId
+        
+        collection = db.get_collection('accidents')
+        
+        try:
+            accident = collection.find_one(
+                {'_id': ObjectId(accident_id)},
+                {'image_hash': 1, 'image_type': 1, 'image': 1} if index == 0 else {'images': 1}
+            )
+        except Exception:
+            return None
+        
+        if not accident:
+            return None
+        if index > 0:
+            images = accident.get('images') or []
+            if index >= len(images):
+                return None
+            return {'image_hash': images[index]['hash'], 'image_type': images[index].get('type', 'image/jpeg')}
+        if accident.get('image_hash'):
+            return {'image_hash': accident['image_hash'], 'image_type': accident.get('image_type', 'image/jpeg')}
+        if accident.get('image'):
+            return AccidentModel._migrate_image(collection, accident)
+        return None
+    
+    @staticmethod
+    def _migrate_image(collection: Collection, accident: dict) -> Optional[dict]:
+        """將單筆舊版內嵌影像搬移到影像儲存"""
+        try:
+            fields = AccidentModel.store_image(decode_image(accident['image']))
+        except ValueError as e:
+            print(f'事故 {accident["_id"]} 影像無法解碼: {e}')
+            return None
+        collection.update_one(
+            {'_id': accident['_id']},
+            {'$set': fields, '$unset': {'image': ''}}
+        )
+        return {'image_hash': fields['image_hash'], 'image_type': fields['image_type']}
+    
+    @staticmethod
+    def migrate_inline_images(collection_name: str = 'accidents') -> int:
+        """
+        將所有舊版內嵌 base64 影像搬移到影像儲存
+        
+        Args:
+            collection_name: accidents 或封存集合 accidents_archive
+        
+        Returns:
+            int: 搬移的筆數
+        """
+        collection = db.get_collection(collection_name)
+        migrated = 0
+        for accident in collection.find({'image': {'$exists': True}}, {'image': 1}):
+            if accident.get('image') and AccidentModel._migrate_image(collection, accident):
+                migrated += 1
+            elif not accident.get('image'):
+                collection.update_one({'_id': accident['_id']}, {'$unset': {'image': ''}})
+        return migrated
+    
+    # 列表可投影的欄位（不含舊版內嵌影像）
+    LIST_FIELDS = (
+        'latitude', 'longitude', 'timestamp', 'device_id', 'has_injured', 'status',
+        'created_at', 'updated_at',
+        'image_hash', 'image_type', 'image_width', 'image_height', 'image_size', 'image_count'
+    )
+    
+    @staticmethod
+    def get_page(active_only: bool = True, fields: Optional[Iterable[str]] = None,
+                 limit: int = 100, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        分頁取得事故記錄（依 created_at、_id 由新到舊）
+        
+        以 (created_at, _id) 作為鍵集分頁，不使用 skip，
+        每頁只從資料庫取 limit + 1 筆；ObjectId 與 datetime 留給 json_codec 在序列化時轉換。
+        
+        Args:
+            active_only: 是否只取得活動中的事故
+            fields: 要回傳的欄位（None 為 LIST_FIELDS 全部，_id 一律回傳）
+            limit: 每頁筆數
+            cursor: 上一頁回傳的 next_cursor
+        
+        Returns:
+            Tuple[List[dict], Optional[str]]: (事故記錄列表, 下一頁游標或 None)
+        
+        Raises:
+            ValueError: 欄位或游標無效
+        """
+        fields = list(fields) if fields is not None else list(AccidentModel.LIST_FIELDS)
+        unknown = [f for f in fields if f not in AccidentModel.LIST_FIELDS]
+        if unknown:
+            raise ValueError(f'不支援的欄位: {", ".join(unknown)}')
+        if limit <= 0:
+            raise ValueError('limit 必須大於 0')
+        
+        query, sort = queries.page_query(active_only, cursor)
+        
+        # created_at 用於產生游標，未要求時不回傳
+        projection = {field: 1 for field in fields}
+        projection['created_at'] = 1
+        strip_created_at = 'created_at' not in fields
+        
+        try:
+            collection = db.get_collection('accidents')
+            docs = collection.find(query, projection).sort(sort).limit(limit + 1)
+            
+            accidents = []
+            last = None
+            for doc in docs:
+                if len(accidents) == limit:
+                    return accidents, queries.encode_cursor(last['created_at'], last['_id'])
+                last = {'created_at': doc.get('created_at'), '_id': doc['_id']}
+                if strip_created_at:
+                    doc.pop('created_at', None)
+                accidents.append(doc)
+            return accidents, None
+        except Exception as e:
+            print(f'MongoDB 查詢錯誤: {e}')
+            # 如果 MongoDB 連接失敗，返回空列表而不是拋出異常
+            return [], None
+    
+    @staticmethod
+    def get_changes(since: float, active_only: bool = True,
+                    fields: Optional[Iterable[str]] = None) -> dict:
+        """
+        取得 since 之後新增、更新或刪除的事故
+        
+        查詢範圍往前多取 CHANGE_FEED_OVERLAP 秒，避免寫入時間早於查詢
+        但較晚提交的資料被漏掉；客戶端以 _id 合併，重複的資料不影響結果。
+        
+        Args:
+            since: 上次回應的 since（Unix 時間）
+            active_only: 是否只追蹤活動中的事故（轉為非活動視為刪除）
+            fields: 要回傳的欄位（None 為 LIST_FIELDS 全部）
+        
+        Returns:
+            dict: {
+                'changes': [...],     新增或更新的事故
+                'deleted': [...],     已刪除的事故 ID
+                'reset': bool,        True 表示需重新載入完整列表
+                'since': float        下次查詢使用的 since
+            }
+        
+        Raises:
+            ValueError: 欄位或 since 無效
+        """
+        config = BackendConfig()
+        fields = list(fields) if fields is not None else list(AccidentModel.LIST_FIELDS)
+        unknown = [f for f in fields if f not in AccidentModel.LIST_FIELDS]
+        if unknown:
+            raise ValueError(f'不支援的欄位: {", ".join(unknown)}')
+        
+        query_start = datetime.now()
+        result = {'changes': [], 'deleted': [], 'reset': False, 'since': query_start.timestamp()}
+        since_dt = parse_timestamp(since - config.CHANGE_FEED_OVERLAP, 'since')
+        
+        # 超過刪除紀錄保存期限，無法得知期間的刪除
+        if since_dt < query_start - timedelta(seconds=config.TOMBSTONE_TTL):
+            result['reset'] = True
+            return result
+        
+        tombstones = db.get_collection('accident_tombstones')
+        for tombstone in tombstones.find(queries.tombstones_query(since_dt)):
+            if tombstone.get('cleared'):
+                return {'changes': [], 'deleted': [], 'reset': True, 'since': result['since']}
+            result['deleted'].append(tombstone['accident_id'])
+        
+        projection = {field: 1 for field in fields}
+        projection['status'] = 1
+        collection = db.get_collection('accidents')
+        query, sort = queries.changes_query(since_dt)
+        docs = collection.find(query, projection).sort(sort).limit(config.CHANGE_FEED_MAX + 1)
+        
+        for doc in docs:
+            if len(result['changes']) + len(result['deleted']) >= config.CHANGE_FEED_MAX:
+                # 變動太多時重新載入比逐筆套用更省
+                return {'changes': [], 'deleted': [], 'reset': True, 'since': result['since']}
+            if active_only and doc.get('status') != 'active':
+                result['deleted'].append(str(doc['_id']))
+                continue
+            if 'status' not in fields:
+                doc.pop('status', None)
+            result['changes'].append(doc)
+        return result
+    
+    # 地圖查詢回傳的輕量欄位
+    GEO_FIELDS = ('latitude', 'longitude', 'timestamp', 'device_id', 'has_injured', 'status')
+    
+    @staticmethod
+    def backfill_locations() -> int:
+        """
+        為舊版只有經緯度欄位的事故補上 GeoJSON location
+        
+        Returns:
+            int: 補上的筆數
+        """
+        collection = db.get_collection('accidents')
+        updated = 0
+        for accident in collection.find({'location': {'$exists': False}}, {'latitude': 1, 'longitude': 1}):
+            try:
+                location = geo_point(accident.get('latitude'), accident.get('longitude'))
+            except ValueError as e:
+                print(f'事故 {accident["_id"]} 座標無效: {e}')
+                continue
+            collection.update_one({'_id': accident['_id']}, {'$set': {'location': location}})
+            updated += 1
+        return updated
+    
+    @staticmethod
+    def find_in_bbox(min_lon: float, min_lat: float, max_lon: float, max_lat: float,
+                     active_only: bool = True, limit: int = 500) -> list:
+        """
+        取得矩形範圍內的事故（輕量欄位）
+        
+        Args:
+            min_lon: 西界經度
+            min_lat: 南界緯度
+            max_lon: 東界經度
+            max_lat: 北界緯度
+            active_only: 是否只取得活動中的事故
+            limit: 最多筆數
+        
+        Returns:
+            list: 事故記錄列表
+        
+        Raises:
+            ValueError: bbox 無效
+        """
+        collection = db.get_collection('accidents')
+        query = queries.bbox_query(min_lon, min_lat, max_lon, max_lat, active_only)
+        projection = {field: 1 for field in AccidentModel.GEO_FIELDS}
+        return list(collection.find(query, projection).limit(limit))
+    
+    @staticmethod
+    def find_near(latitude: float, longitude: float, radius: float,
+                  active_only: bool = True, limit: int = 100) -> list:
+        """
+        取得指定半徑內的事故（依距離由近到遠）
+        
+        Args:
+            latitude: 中心緯度
+            longitude: 中心經度
+            radius: 半徑（公尺）
+            active_only: 是否只取得活動中的事故
+            limit: 最多筆數
+        
+        Returns:
+            list: 事故記錄列表
+        
+        Raises:
+            ValueError: 座標或半徑無效
+        """
+        collection = db.get_collection('accidents')
+        query = queries.near_query(latitude, longitude, radius, active_only)
+        projection = {field: 1 for field in AccidentModel.GEO_FIELDS}
+        return list(collection.find(query, projection).limit(limit))
+    
+    @staticmethod
+    def get_clusters(min_lon: float, min_lat: float, max_lon: float, max_lat: float,
+                     zoom: int, active_only: bool = True) -> list:
+        """
+        以網格在資料庫端聚合矩形範圍內的事故（地圖縮小時使用）
+        
+        網格大小約為地圖圖磚的 1/4（zoom 每加 1 網格邊長減半），
+        只回傳每格的數量與中心點，不傳輸個別事故。
+        
+        Args:
+            min_lon: 西界經度
+            min_lat: 南界緯度
+            max_lon: 東界經度
+            max_lat: 北界緯度
+            zoom: 地圖縮放等級（0-22）
+            active_only: 是否只取得活動中的事故
+        
+        Returns:
+            list: [{'latitude', 'longitude', 'count', 'injured', 'accident_id'}, ...]
+                  accident_id 僅在 count 為 1 時提供
+        
+        Raises:
+            ValueError: bbox 或 zoom 無效
+        """
+        if not 0 <= zoom <= 22:
+            raise ValueError('zoom 必須介於 0 到 22')
+        cell = 360.0 / (2 ** zoom) / 4
+        
+        collection = db.get_collection('accidents')
+        query = queries.bbox_query(min_lon, min_lat, max_lon, max_lat, active_only)
+        pipeline = [
+            {'$match': query},
+            {'$group': {
+                '_id': {
+                    'x': {'$floor': {'$divide': ['$longitude', cell]}},
+                    'y': {'$floor': {'$divide': ['$latitude', cell]}}
+                },
+                'count': {'$sum': 1},
+                'injured': {'$sum': {'$cond': ['$has_injured', 1, 0]}},
+                'latitude': {'$avg': '$latitude'},
+                'longitude': {'$avg': '$longitude'},
+                'accident_id': {'$first': '$_id'}
+            }}
+        ]
+        
+        clusters = []
+        for group in collection.aggregate(pipeline):
+            clusters.append({
+                'latitude': group['latitude'],
+                'longitude': group['longitude'],
+                'count': group['count'],
+                'injured': group['injured'],
+                'accident_id': str(group['accident_id']) if group['count'] == 1 else None
+            })
+        return clusters
+    
     @staticmethod
     def get_all(active_only: bool = True) -> list:
         """
@@ -98,24 +597,31 @@ class AccidentModel:
             if active_only:
                 query['status'] = 'active'
             
-            accidents = list(collection.find(query).sort('created_at', -1))
-            
-            # 轉換 ObjectId 為字串
-            for accident in accidents:
-                accident['_id'] = str(accident['_id'])
-                if isinstance(accident.get('timestamp'), datetime):
-                    accident['timestamp'] = accident['timestamp'].timestamp()
-                if isinstance(accident.get('created_at'), datetime):
-                    accident['created_at'] = accident['created_at'].timestamp()
-                if isinstance(accident.get('updated_at'), datetime):
-                    accident['updated_at'] = accident['updated_at'].timestamp()
-            
-            return accidents
+            # 不回傳舊版內嵌影像，影像改由 /api/accident_image/<id> 取得
+            cursor = collection.find(query, {'image': 0}).sort('created_at', -1)
+            return list(cursor)
         except Exception as e:
             print(f'MongoDB 查詢錯誤: {e}')
             # 如果 MongoDB 連接失敗，返回空列表而不是拋出異常
             return []
     
+    @staticmethod
+    def iter_all(active_only: bool = False, archived: bool = False, batch_size: int = 1000) -> Iterator[dict]:
+        """
+        逐筆走訪事故記錄（依 created_at 由新到舊），供串流匯出使用，不在記憶體中組出完整列表
+        
+        Args:
+            active_only: 是否只取得活動中的事故
+            archived: 走訪封存集合 accidents_archive 而非 accidents
+            batch_size: 每次向 MongoDB 取回的筆數
+        
+        Returns:
+            Iterator[dict]: 事故文件（_id 為 ObjectId、時間為 datetime）
+        """
+        collection = db.get_collection('accidents_archive' if archived else 'accidents')
+        query = {'status': 'active'} if active_only else {}
+        return collection.find(query, {'image': 0}).sort([('created_at', -1), ('_id', -1)]).batch_size(batch_size)
+    
     @staticmethod
     def get_by_id(accident_id: str) -> Optional[dict]:
         """
@@ -132,15 +638,9 @@ class AccidentModel:
         collection = db.get_collection('accidents')
         
         try:
-            accident = collection.find_one({'_id': ObjectId(accident_id)})
+            accident = collection.find_one({'_id': ObjectId(accident_id)}, {'image': 0})
             if accident:
-                accident['_id'] = str(accident['_id'])
-                if isinstance(accident.get('timestamp'), datetime):
-                    accident['timestamp'] = accident['timestamp'].timestamp()
-                if isinstance(accident.get('created_at'), datetime):
-                    accident['created_at'] = accident['created_at'].timestamp()
-                if isinstance(accident.get('updated_at'), datetime):
-                    accident['updated_at'] = accident['updated_at'].timestamp()
+                serialize_doc(accident)
             return accident
         except:
             return None
@@ -162,9 +662,19 @@ class AccidentModel:
         
         try:
             result = collection.delete_one({'_id': ObjectId(accident_id)})
-            return result.deleted_count > 0
         except:
             return False
+        
+        if result.deleted_count > 0:
+            # 留下刪除紀錄供增量查詢
+            db.get_collection('accident_tombstones').insert_one({
+                'accident_id': accident_id,
+                'deleted_at': datetime.now()
+            })
+            accident_version.bump()
+            events.publish('accident.deleted', {'_id': accident_id})
+            return True
+        return False
 
     @staticmethod
     def clear_all() -> int:
@@ -177,6 +687,14 @@ class AccidentModel:
         collection = db.get_collection('accidents')
         try:
             result = collection.delete_many({})
+            # 單筆清除紀錄：在此之前取得的資料全部失效，增量查詢會要求重新載入
+            db.get_collection('accident_tombstones').insert_one({
+                'accident_id': None,
+                'cleared': True,
+                'deleted_at': datetime.now()
+            })
+            accident_version.bump()
+            events.publish('accidents.cleared', {})
             return result.deleted_count
         except Exception as e:
             print(f'MongoDB 清除事故錯誤: {e}')
@@ -199,44 +717,781 @@ class AccidentModel:
         collection = db.get_collection('accidents')
         
         try:
+            updated_at = datetime.now()
             result = collection.update_one(
                 {'_id': ObjectId(accident_id)},
-                {'$set': {'status': status, 'updated_at': datetime.now()}}
+                {'$set': {'status': status, 'updated_at': updated_at}}
             )
-            return result.modified_count > 0
         except:
             return False
+        
+        if result.modified_count > 0:
+            accident_version.bump()
+            events.publish('accident.updated', {
+                '_id': accident_id,
+                'status': status,
+                'updated_at': updated_at.timestamp()
+            })
+            return True
+        return False
+
+    # 批次操作可用的狀態
+    STATUSES = ('active', 'resolved')
+    # 批次事件最多列出的 ID 數（其餘由客戶端增量查詢取得）
+    BULK_EVENT_IDS = 100
+    
+    @staticmethod
+    def bulk_query(ids: Optional[List[str]] = None, filters: Optional[dict] = None) -> dict:
+        """
+        組合批次操作的查詢條件（ID 列表與篩選條件同時提供時取交集）
+        
+        Args:
+            ids: 事故 ID 列表
+            filters: {"status", "start", "end", "device_id", "bbox": [西, 南, 東, 北]}，
+                     start/end 為建立時間的 Unix 時間戳
+        
+        Returns:
+            dict: MongoDB 查詢條件
+        
+        Raises:
+            ValueError: 沒有任何條件、ID 無效或篩選條件格式錯誤
+        """
+        from bson import ObjectId
+        from bson.errors import InvalidId
+        
+        query = {}
+        if ids is not None:
+            if not isinstance(ids, list) or not ids:
+                raise ValueError('ids 必須是非空的列表')
+            try:
+                query['_id'] = {'$in': [ObjectId(accident_id) for accident_id in ids]}
+            except (InvalidId, TypeError):
+                raise ValueError('ids 含有無效的事故 ID')
+        
+        filters = filters or {}
+        if not isinstance(filters, dict):
+            raise ValueError('filter 必須是物件')
+        unknown = set(filters) - {'status', 'start', 'end', 'device_id', 'bbox'}
+        if unknown:
+            raise ValueError(f'不支援的篩選欄位: {", ".join(sorted(unknown))}')
+        if 'status' in filters:
+            if filters['status'] not in AccidentModel.STATUSES:
+                raise ValueError(f'status 必須是 {" 或 ".join(AccidentModel.STATUSES)}')
+            query['status'] = filters['status']
+        if 'start' in filters or 'end' in filters:
+            created_at = {}
+            if 'start' in filters:
+                created_at['$gte'] = parse_timestamp(filters['start'], 'start')
+            if 'end' in filters:
+                created_at['$lt'] = parse_timestamp(filters['end'], 'end')
+            query['created_at'] = created_at
+        if 'device_id' in filters:
+            query['device_id'] = str(filters['device_id'])
+        if 'bbox' in filters:
+            try:
+                min_lon, min_lat, max_lon, max_lat = [float(v) for v in filters['bbox']]
+            except (TypeError, ValueError):
+                raise ValueError('bbox 必須是 [西, 南, 東, 北]')
+            query.update(queries.bbox_filter(min_lon, min_lat, max_lon, max_lat))
+        
+        if not query:
+            # 全部清除請使用 clear_all
+            raise ValueError('必須提供 ids 或至少一個篩選條件')
+        return query
+    
+    @staticmethod
+    def count(query: dict) -> int:
+        """符合條件的事故數（批次操作的 dry_run）"""
+        return db.get_collection('accidents').count_documents(query)
+    
+    @staticmethod
+    def _batches(query: dict, batch_size: int) -> Iterator[list]:
+        """
+        依序取出符合條件的事故 _id（每批最多 batch_size 筆）
+        
+        呼叫端須在處理每批後使其不再符合 query（更新狀態或刪除），否則會重複取得同一批。
+        """
+        collection = db.get_collection('accidents')
+        while True:
+            ids = [doc['_id'] for doc in collection.find(query, {'_id': 1}).limit(batch_size)]
+            if not ids:
+                return
+            yield ids
+    
+    @staticmethod
+    def _remaining_ids(ids: list) -> set:
+        """ids 中仍留在 accidents 的事故（批次刪除後確認實際刪除了哪些）"""
+        collection = db.get_collection('accidents')
+        return {doc['_id'] for doc in collection.find({'_id': {'$in': ids}}, {'_id': 1})}
+    
+    @staticmethod
+    def _record_removed(ids: list, removed_at: datetime):
+        """留下批次刪除 / 封存的刪除紀錄供增量查詢（只傳入實際刪除的事故）"""
+        if not ids:
+            return
+        db.get_collection('accident_tombstones').insert_many([
+            {'accident_id': str(accident_id), 'deleted_at': removed_at} for accident_id in ids
+        ], ordered=False)
+    
+    @staticmethod
+    def bulk_set_status(query: dict, status: str, batch_size: int = 1000) -> int:
+        """
+        批次變更事故狀態（每批一次 update_many）
+        
+        Args:
+            query: bulk_query 的結果
+            status: 新狀態
+            batch_size: 每批筆數
+        
+        Returns:
+            int: 變更筆數
+        """
+        if status not in AccidentModel.STATUSES:
+            raise ValueError(f'status 必須是 {" 或 ".join(AccidentModel.STATUSES)}')
+        collection = db.get_collection('accidents')
+        pending = {'$and': [query, {'status': {'$ne': status}}]}
+        modified = 0
+        ids_changed = []
+        for ids in AccidentModel._batches(pending, batch_size):
+            # 每批使用各自的 updated_at，更新後以此找出實際變更的事故（取出後可能已被他人修改）
+            updated_at = datetime.now()
+            result = collection.update_many(
+                {'$and': [pending, {'_id': {'$in': ids}}]},
+                {'$set': {'status': status, 'updated_at': updated_at}}
+            )
+            modified += result.modified_count
+            if result.modified_count and len(ids_changed) < AccidentModel.BULK_EVENT_IDS:
+                ids_changed.extend(doc['_id'] for doc in collection.find(
+                    {'_id': {'$in': ids}, 'status': status, 'updated_at': updated_at}, {'_id': 1}))
+        if modified:
+            accident_version.bump()
+            events.publish('accidents.bulk', {
+                'action': 'status', 'status': status, 'count': modified,
+                'ids': [str(i) for i in ids_changed[:AccidentModel.BULK_EVENT_IDS]]
+            })
+        return modified
+    
+    @staticmethod
+    def bulk_delete(query: dict, batch_size: int = 1000) -> int:
+        """
+        批次刪除事故（每批一次 delete_many）
+        
+        Args:
+            query: bulk_query 的結果
+            batch_size: 每批筆數
+        
+        Returns:
+            int: 刪除筆數
+        """
+        collection = db.get_collection('accidents')
+        deleted = 0
+        ids_removed = []
+        for ids in AccidentModel._batches(query, batch_size):
+            # 取出後已不符合條件的事故不刪除
+            result = collection.delete_many({'$and': [query, {'_id': {'$in': ids}}]})
+            remaining = AccidentModel._remaining_ids(ids) if result.deleted_count < len(ids) else set()
+            removed = [accident_id for accident_id in ids if accident_id not in remaining]
+            AccidentModel._record_removed(removed, datetime.now())
+            deleted += result.deleted_count
+            ids_removed.extend(removed)
+        if deleted:
+            accident_version.bump()
+            events.publish('accidents.bulk', {
+                'action': 'delete', 'count': deleted,
+                'ids': [str(i) for i in ids_removed[:AccidentModel.BULK_EVENT_IDS]]
+            })
+        return deleted
+    
+    @staticmethod
+    def archive(query: dict, batch_size: int = 1000) -> int:
+        """
+        將已解決的事故搬移到冷資料集合 accidents_archive，讓熱資料集合保持精簡
+        
+        每批先以 bulk_write（ReplaceOne upsert，重試時不會重複）寫入封存集合，
+        確認寫入後才從 accidents 刪除；只搬移 status 為 resolved 的事故。
+        刪除時比對 updated_at，取出後被重新開啟或修改的事故留在 accidents，
+        並移除其封存副本（仍為 resolved 者在下一輪以最新內容重新封存）。
+        
+        Args:
+            query: bulk_query 的結果
+            batch_size: 每批筆數
+        
+        Returns:
+            int: 封存筆數
+        """
+        collection = db.get_collection('accidents')
+        archive = db.get_collection('accidents_archive')
+        resolved = {'$and': [query, {'status': 'resolved'}]}
+        archived = 0
+        ids_removed = []
+        while True:
+            docs = list(collection.find(resolved).limit(batch_size))
+            if not docs:
+                break
+            archived_at = datetime.now()
+            archive.bulk_write([
+                ReplaceOne({'_id': doc['_id']}, dict(doc, archived_at=archived_at), upsert=True)
+                for doc in docs
+            ], ordered=False)
+            ids = [doc['_id'] for doc in docs]
+            result = collection.delete_many({'status': 'resolved', '$or': [
+                {'_id': doc['_id'], 'updated_at': doc.get('updated_at')} for doc in docs
+            ]})
+            remaining = AccidentModel._remaining_ids(ids) if result.deleted_count < len(ids) else set()
+            if remaining:
+                archive.delete_many({'_id': {'$in': list(remaining)}})
+            removed = [accident_id for accident_id in ids if accident_id not in remaining]
+            AccidentModel._record_removed(removed, archived_at)
+            archived += result.deleted_count
+            ids_removed.extend(removed)
+        if archived:
+            accident_version.bump()
+            events.publish('accidents.bulk', {
+                'action': 'archive', 'count': archived,
+                'ids': [str(i) for i in ids_removed[:AccidentModel.BULK_EVENT_IDS]]
+            })
+        return archived
+
+class HistoryWriteError(Exception):
+    """歷史軌跡寫入失敗；unwritten 為確定沒有寫入、可重送的樣本"""
+    
+    def __init__(self, error: Exception, unwritten: List[dict]):
+        super().__init__(str(error))
+        self.unwritten = unwritten
+
+
+class DeviceHistory:
+    """
+    裝置歷史軌跡儲存
+    
+    優先使用 device_positions 時間序列集合；伺服器不支援時（MongoDB < 5.0）
+    改用 device_position_buckets，每份文件存放同一裝置最多 BUCKET_SIZE 個樣本。
+    寫入前先略過間隔過短或幾乎沒有移動的樣本，儲存量取決於行駛時間
+    而不是回報頻率。
+    """
+    
+    BUCKET_SIZE = 720
+    
+    def __init__(self, min_interval: float = 1.0, min_distance: float = 2.0, max_gap: float = 60.0):
+        """
+        Args:
+            min_interval: 同一裝置兩筆樣本的最短間隔（秒）
+            min_distance: 移動少於此距離（公尺）時不記錄
+            max_gap: 靜止時仍每隔此秒數記錄一筆
+        """
+        self.min_interval = min_interval
+        self.min_distance = min_distance
+        self.max_gap = max_gap
+        self.last_recorded = {}
+        # 各裝置最新分桶的 (first, count)，減少寫入時的查詢；與資料庫不一致時由寫入條件保護
+        self.open_buckets = {}
+        self.lock = threading.Lock()
+        self._mode = None
+        self._mode_db = None
+    
+    def mode(self) -> str:
+        """目前的儲存方式：'timeseries' 或 'buckets'"""
+        if db.db is None:
+            raise Exception('MongoDB 未連接')
+        if self._mode_db is not db.db:
+            self._mode = history_mode(db.db)
+            self._mode_db = db.db
+        return self._mode
+    
+    def accept(self, device_id: str, timestamp: datetime, latitude: float, longitude: float) -> bool:
+        """
+        判斷樣本是否需要記錄（需要時同時更新該裝置的最後記錄點）
+        
+        Args:
+            device_id: 裝置 ID
+            timestamp: 時間
+            latitude: 緯度
+            longitude: 經度
+        
+        Returns:
+            bool: 是否記錄
+        """
+        with self.lock:
+            last = self.last_recorded.get(device_id)
+            if last is not None:
+                elapsed = (timestamp - last[0]).total_seconds()
+                if elapsed < self.min_interval:
+                    return False
+                moved = distance_meters(last[1], last[2], latitude, longitude)
+                if moved < self.min_distance and elapsed < self.max_gap:
+                    return False
+            self.last_recorded[device_id] = (timestamp, latitude, longitude)
+            return True
+    
+    def _open_bucket(self, device_id: str) -> Tuple[Optional[datetime], int]:
+        """裝置最新分桶的 (first, count)；沒有分桶時為 (None, 0)"""
+        with self.lock:
+            cached = self.open_buckets.get(device_id)
+        if cached is not None:
+            return cached
+        doc = db.get_collection('device_position_buckets').find_one(
+            {'device_id': device_id}, {'first': 1, 'count': 1}, sort=[('first', -1)])
+        return (doc['first'], doc['count']) if doc else (None, 0)
+    
+    def write(self, samples: List[dict]):
+        """
+        寫入樣本
+        
+        分桶模式下先補滿裝置最新的分桶，其餘樣本每 BUCKET_SIZE 個建立新分桶。
+        補入的條件要求分桶剩餘空間足夠，其他程序已先寫入時改由 upsert 建立新分桶，
+        分桶不會超過 BUCKET_SIZE 個樣本。
+        
+        Args:
+            samples: [{'device_id', 'timestamp', 'latitude', 'longitude'}, ...]（依時間排序）
+        
+        Raises:
+            HistoryWriteError: 寫入失敗（unwritten 為沒有寫入的樣本，重送不會重複）
+        """
+        from pymongo import InsertOne, UpdateOne
+        from pymongo.errors import BulkWriteError
+        
+        if not samples:
+            return
+        if self.mode() == 'timeseries':
+            try:
+                db.get_collection('device_positions').bulk_write(
+                    [InsertOne(sample) for sample in samples], ordered=False)
+            except BulkWriteError as e:
+                # 不依序寫入時只有 writeErrors 列出的樣本沒有寫入
+                failed = {error['index'] for error in e.details.get('writeErrors', [])}
+                raise HistoryWriteError(e, [samples[i] for i in sorted(failed)])
+            except Exception as e:
+                raise HistoryWriteError(e, list(samples))
+            return
+        
+        by_device = {}
+        for sample in samples:
+            by_device.setdefault(sample['device_id'], []).append(sample)
+        
+        def points(chunk: List[dict]) -> List[dict]:
+            return [{'t': sample['timestamp'], 'lat': sample['latitude'], 'lon': sample['longitude']}
+                    for sample in chunk]
+        
+        # operations[i] 寫入 chunks[i] 的樣本
+        operations = []
+        chunks = []
+        open_buckets = {}
+        for device_id, device_samples in by_device.items():
+            first, count = self._open_bucket(device_id)
+            if first is not None and count < self.BUCKET_SIZE:
+                chunk = device_samples[:self.BUCKET_SIZE - count]
+                device_samples = device_samples[len(chunk):]
+                # first 以範圍比對：不會寫入比最新分桶更舊的分桶，upsert 時也不會複製到新分桶
+                operations.append(UpdateOne(
+                    {'device_id': device_id, 'first': {'$gte': first},
+                     'count': {'$lte': self.BUCKET_SIZE - len(chunk)}},
+                    {
+                        '$push': {'samples': {'$each': points(chunk)}},
+                        '$inc': {'count': len(chunk)},
+                        '$min': {'first': chunk[0]['timestamp']},
+                        '$max': {'last': chunk[-1]['timestamp']}
+                    },
+                    upsert=True
+                ))
+                chunks.append(chunk)
+                open_buckets[device_id] = (first, count + len(chunk))
+            for i in range(0, len(device_samples), self.BUCKET_SIZE):
+                chunk = device_samples[i:i + self.BUCKET_SIZE]
+                operations.append(InsertOne({
+                    'device_id': device_id,
+                    'samples': points(chunk),
+                    'count': len(chunk),
+                    'first': chunk[0]['timestamp'],
+                    'last': chunk[-1]['timestamp']
+                }))
+                chunks.append(chunk)
+                open_buckets[device_id] = (chunk[0]['timestamp'], len(chunk))
+        try:
+            db.get_collection('device_position_buckets').bulk_write(operations, ordered=True)
+        except Exception as e:
+            # 分桶快取可能已與資料庫不一致，下次重新查詢
+            with self.lock:
+                for device_id in by_device:
+                    self.open_buckets.pop(device_id, None)
+            if isinstance(e, BulkWriteError) and e.details.get('writeErrors'):
+                # 依序寫入在第一個錯誤停止：之前的操作已寫入，之後的沒有執行
+                stopped = e.details['writeErrors'][0]['index']
+            else:
+                stopped = 0
+            raise HistoryWriteError(e, [sample for chunk in chunks[stopped:] for sample in chunk])
+        with self.lock:
+            self.open_buckets.update(open_buckets)
+    
+    def read(self, device_id: str, start: datetime, end: datetime) -> Iterator[Tuple[float, float, float]]:
+        """
+        依時間順序讀取軌跡
+        
+        Args:
+            device_id: 裝置 ID
+            start: 開始時間
+            end: 結束時間
+        
+        Yields:
+            Tuple[float, float, float]: (時間戳, 緯度, 經度)
+        """
+        mode = self.mode()
+        collection_name, query, sort = queries.track_query(mode, device_id, start, end)
+        collection = db.get_collection(collection_name)
+        if mode == 'timeseries':
+            cursor = collection.find(query, {'_id': 0, 'timestamp': 1, 'latitude': 1, 'longitude': 1}).sort(sort)
+            for doc in cursor:
+                yield doc['timestamp'].timestamp(), doc['latitude'], doc['longitude']
+            return
+        
+        cursor = collection.find(query, {'_id': 0, 'samples': 1}).sort(sort)
+        for bucket in cursor:
+            for sample in bucket['samples']:
+                if start <= sample['t'] <= end:
+                    yield sample['t'].timestamp(), sample['lat'], sample['lon']
+
+
+class DevicePositionBuffer:
+    """
+    裝置位置寫入緩衝（write-behind）
+    
+    每台裝置只保留最新位置，背景執行緒每 flush_interval 秒或累積
+    flush_size 台裝置時以單次 bulk_write 寫入；啟用歷史紀錄時
+    需要保存的樣本另交由 DeviceHistory 批次寫入。
+    """
+    
+    def __init__(self, flush_interval: float = 0.5, flush_size: int = 500, history: bool = False):
+        """
+        Args:
+            flush_interval: 寫入間隔（秒）
+            flush_size: 待寫入裝置數達到此值時立即寫入
+            history: 是否保存歷史軌跡
+        """
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.history = history
+        self.pending = {}
+        self.samples = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.running = False
+        
+        # 統計
+        self.received = 0
+        self.written = 0
+        self.flushes = 0
+    
+    def start(self):
+        """啟動背景寫入執行緒"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='device-position-flush', daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """停止背景執行緒並寫入剩餘資料"""
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+        self.flush()
+    
+    def add(self, device_id: str, latitude: float, longitude: float, updated_at: datetime):
+        """
+        加入一筆位置（覆蓋同一裝置尚未寫入的位置）
+        
+        Args:
+            device_id: 裝置 ID
+            latitude: 緯度
+            longitude: 經度
+            updated_at: 回報時間
+        """
+        if self.thread is None:
+            self.start()
+        with self.lock:
+            self.pending[device_id] = (latitude, longitude, updated_at)
+            if self.history and device_history.accept(device_id, updated_at, latitude, longitude):
+                self.samples.append({
+                    'device_id': device_id,
+                    'timestamp': updated_at,
+                    'latitude': latitude,
+                    'longitude': longitude
+                })
+            self.received += 1
+            full = len(self.pending) >= self.flush_size or len(self.samples) >= self.flush_size * 10
+        if full:
+            self.wakeup.set()
+    
+    def peek(self) -> dict:
+        """取得尚未寫入的最新位置 {device_id: (緯度, 經度, 時間)}"""
+        with self.lock:
+            return dict(self.pending)
+    
+    def _run(self):
+        while self.running:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f'裝置位置寫入失敗: {e}')
+    
+    def flush(self) -> int:
+        """
+        立即寫入所有待寫入的位置
+        
+        Returns:
+            int: 寫入的裝置數
+        """
+        from pymongo import UpdateOne
+        
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                samples, self.samples = self.samples, []
+            if not pending and not samples:
+                return 0
+            
+            operations = [
+                UpdateOne(
+                    {'device_id': device_id},
+                    {
+                        '$set': {
+                            'latitude': latitude,
+                            'longitude': longitude,
+                            'updated_at': updated_at
+                        },
+                        '$setOnInsert': {
+                            'device_id': device_id,
+                            'created_at': updated_at
+                        }
+                    },
+                    upsert=True
+                )
+                for device_id, (latitude, longitude, updated_at) in pending.items()
+            ]
+            # 裝置位置與歷史軌跡分別寫入、分別重試，一邊失敗不會讓另一邊重寫
+            error = None
+            if operations:
+                try:
+                    db.get_collection('devices').bulk_write(operations, ordered=False)
+                except Exception as e:
+                    # 位置寫入是冪等的 $set，全部放回緩衝（較新的位置優先）
+                    with self.lock:
+                        for device_id, position in pending.items():
+                            self.pending.setdefault(device_id, position)
+                    error = e
+                else:
+                    self.written += len(pending)
+                    self.flushes += 1
+            try:
+                device_history.write(samples)
+            except HistoryWriteError as e:
+                # 只放回沒有寫入的樣本，已寫入的不會重複
+                with self.lock:
+                    self.samples = e.unwritten + self.samples
+                error = error or e
+            if error is not None:
+                raise error
+            return len(pending)
+    
+    def stats(self) -> dict:
+        """緩衝統計"""
+        with self.lock:
+            return {
+                'received': self.received,
+                'written': self.written,
+                'flushes': self.flushes,
+                'pending': len(self.pending),
+                'pending_samples': len(self.samples)
+            }
+
+
+_position_config = BackendConfig()
+
+# 全域裝置歷史軌跡
+device_history = DeviceHistory(
+    min_interval=_position_config.DEVICE_HISTORY_MIN_INTERVAL,
+    min_distance=_position_config.DEVICE_HISTORY_MIN_DISTANCE,
+    max_gap=_position_config.DEVICE_HISTORY_MAX_GAP
+)
+
+# 全域裝置位置緩衝
+position_buffer = DevicePositionBuffer(
+    flush_interval=_position_config.DEVICE_FLUSH_INTERVAL,
+    flush_size=_position_config.DEVICE_FLUSH_SIZE,
+    history=_position_config.DEVICE_HISTORY
+)
+atexit.register(position_buffer.stop)
 
 class DeviceModel:
     """裝置資料模型"""
     
     @staticmethod
-    def update_position(device_id: str, latitude: float, longitude: float):
+    def parse_position(device_id, latitude, longitude,
+                       timestamp=None) -> Tuple[str, float, float, Optional[float]]:
+        """
+        轉換並檢查一筆裝置位置（批次上報時先檢查全部再寫入）
+        
+        Args:
+            device_id: 裝置 ID
+            latitude: 緯度
+            longitude: 經度
+            timestamp: Unix 時間（選填）
+        
+        Returns:
+            Tuple[str, float, float, Optional[float]]: (裝置 ID, 緯度, 經度, 時間戳)
+        
+        Raises:
+            ValueError: 欄位型別錯誤或超出範圍
+        """
+        if not isinstance(device_id, str) or not device_id:
+            raise ValueError('device_id 必須是非空字串')
+        longitude, latitude = geo_point(latitude, longitude)['coordinates']
+        if timestamp is not None:
+            parse_timestamp(timestamp)
+            timestamp = float(timestamp)
+        return device_id, latitude, longitude, timestamp
+    
+    @staticmethod
+    def update_position(device_id: str, latitude: float, longitude: float,
+                        timestamp: Optional[float] = None):
         """
         更新裝置位置
         
+        預設交給 position_buffer 批次寫入（DEVICE_WRITE_BEHIND=false 時直接寫入）。
+        
         Args:
             device_id: 裝置 ID
             latitude: 緯度
             longitude: 經度
+            timestamp: 車載端取得位置的 Unix 時間（離線補送時使用），預設為現在
+        
+        Raises:
+            ValueError: 位置資料無效
         """
-        collection = db.get_collection('devices')
+        device_id, latitude, longitude, timestamp = DeviceModel.parse_position(
+            device_id, latitude, longitude, timestamp)
+        now = datetime.now()
+        updated_at = min(datetime.fromtimestamp(timestamp), now) if timestamp is not None else now
         
-        collection.update_one(
-            {'device_id': device_id},
-            {
-                '$set': {
-                    'latitude': latitude,
-                    'longitude': longitude,
-                    'updated_at': datetime.now()
+        if _position_config.DEVICE_WRITE_BEHIND:
+            db.get_collection('devices')  # 未連線時與直接寫入相同地拋出例外
+            position_buffer.add(device_id, latitude, longitude, updated_at)
+        else:
+            collection = db.get_collection('devices')
+            collection.update_one(
+                {'device_id': device_id},
+                {
+                    '$set': {
+                        'latitude': latitude,
+                        'longitude': longitude,
+                        'updated_at': updated_at
+                    },
+                    '$setOnInsert': {
+                        'device_id': device_id,
+                        'created_at': datetime.now()
+                    }
                 },
-                '$setOnInsert': {
+                upsert=True
+            )
+            if _position_config.DEVICE_HISTORY and \
+                    device_history.accept(device_id, updated_at, latitude, longitude):
+                device_history.write([{
                     'device_id': device_id,
-                    'created_at': datetime.now()
-                }
+                    'timestamp': updated_at,
+                    'latitude': latitude,
+                    'longitude': longitude
+                }])
+        
+        events.publish('device.position', {
+            'device_id': device_id,
+            'latitude': latitude,
+            'longitude': longitude,
+            'updated_at': updated_at.timestamp()
+        })
+    
+    @staticmethod
+    def heartbeat(device_id: str, stream_url: Optional[str]) -> datetime:
+        """
+        記錄車載端心跳與影像串流位址
+        
+        Args:
+            device_id: 裝置 ID
+            stream_url: 車載端 Web API 位址（例如 http://10.0.0.5:8080），None 表示不變更
+        
+        Returns:
+            datetime: 心跳時間
+        """
+        now = datetime.now()
+        fields = {'heartbeat_at': now}
+        if stream_url:
+            fields['stream_url'] = stream_url
+        db.get_collection('devices').update_one(
+            {'device_id': device_id},
+            {
+                '$set': fields,
+                '$setOnInsert': {'device_id': device_id, 'created_at': now}
             },
             upsert=True
         )
+        return now
+    
+    @staticmethod
+    def get_endpoint(device_id: str) -> Optional[dict]:
+        """
+        取得裝置註冊的影像串流位址
+        
+        Args:
+            device_id: 裝置 ID
+        
+        Returns:
+            Optional[dict]: {'stream_url': ..., 'heartbeat_at': datetime}，未註冊則為 None
+        """
+        device = db.get_collection('devices').find_one(
+            {'device_id': device_id},
+            {'_id': 0, 'stream_url': 1, 'heartbeat_at': 1}
+        )
+        if not device or not device.get('stream_url'):
+            return None
+        return device
+    
+    @staticmethod
+    def get_track(device_id: str, start: datetime, end: datetime, method: str = 'dp',
+                  max_points: int = 500, tolerance: float = 5.0) -> dict:
+        """
+        取得裝置軌跡（伺服器端降採樣）
+        
+        Args:
+            device_id: 裝置 ID
+            start: 開始時間
+            end: 結束時間
+            method: 'dp'（Douglas-Peucker）或 'bucket'（固定時間桶）
+            max_points: 最多點數
+            tolerance: dp 允許偏離距離（公尺）
+        
+        Returns:
+            dict: {'device_id', 'raw_points', 'points': [[時間戳, 緯度, 經度], ...]}
+        
+        Raises:
+            ValueError: 參數無效
+        """
+        if end <= start:
+            raise ValueError('end 必須晚於 start')
+        if max_points < 3:
+            raise ValueError('max_points 至少為 3')
+        
+        # 緩衝中尚未寫入的樣本不在結果中（最多延遲 DEVICE_FLUSH_INTERVAL 秒）
+        points = list(device_history.read(device_id, start, end))
+        simplified = downsample(points, method=method, max_points=max_points, tolerance=tolerance)
+        return {
+            'device_id': device_id,
+            'raw_points': len(points),
+            'points': [[t, lat, lon] for t, lat, lon in simplified]
+        }
     
     @staticmethod
     def get_all() -> list:
@@ -250,13 +1505,22 @@ class DeviceModel:
         
         devices = list(collection.find())
         
-        # 轉換 ObjectId 為字串
+        # 套用緩衝中尚未寫入的最新位置
+        pending = position_buffer.peek()
         for device in devices:
-            device['_id'] = str(device['_id'])
-            if isinstance(device.get('created_at'), datetime):
-                device['created_at'] = device['created_at'].timestamp()
-            if isinstance(device.get('updated_at'), datetime):
-                device['updated_at'] = device['updated_at'].timestamp()
+            position = pending.pop(device.get('device_id'), None)
+            if position:
+                device['latitude'], device['longitude'], device['updated_at'] = position
+        for device_id, (latitude, longitude, updated_at) in pending.items():
+            devices.append({
+                '_id': None,
+                'device_id': device_id,
+                'latitude': latitude,
+                'longitude': longitude,
+                'created_at': updated_at,
+                'updated_at': updated_at
+            })
         
+        # ObjectId 與 datetime 由 json_codec 在序列化時轉換
         return devices
 
@@ -0,0 +1,274 @@
+"""
+熱路徑查詢的篩選條件與排序
+只組出查詢文件、不存取資料庫：models.py 以此執行查詢，
+indexes.py 以相同的函式產生查詢檢查索引（匯入時不會建立資料庫連線）。
+"""
+
+import base64
+import binascii
+import math
+from datetime import datetime
+from typing import Optional, Tuple
+
+# 多邊形緯度邊每段的最大經度跨距（度）與向外擴張的緯度（度）：
+# 緯度邊是測地線，1 度一段時最多向極區偏約 120 公尺，擴張 0.01 度（約 1.1 公里）可完整涵蓋
+BBOX_SEGMENT_DEGREES = 1.0
+BBOX_PADDING_DEGREES = 0.01
+
+
+def geo_point(latitude, longitude) -> dict:
+    """
+    建立 GeoJSON Point（座標順序為 [經度, 緯度]）
+
+    Args:
+        latitude: 緯度
+        longitude: 經度
+
+    Returns:
+        dict: GeoJSON Point
+
+    Raises:
+        ValueError: 座標不是數字或超出範圍
+    """
+    try:
+        lat = float(latitude)
+        lon = float(longitude)
+    except (TypeError, ValueError):
+        raise ValueError('經緯度必須是數字')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('經緯度超出範圍')
+    return {'type': 'Point', 'coordinates': [lon, lat]}
+
+
+def parse_timestamp(value, name: str = 'timestamp') -> datetime:
+    """
+    將 Unix 時間戳轉為（本地時間的）datetime
+
+    Args:
+        value: Unix 時間戳（數字或數字字串）
+        name: 錯誤訊息中的參數名稱
+
+    Returns:
+        datetime: 對應的時間
+
+    Raises:
+        ValueError: 不是數字、無限大、NaN 或超出 datetime 可表示的範圍
+    """
+    try:
+        return datetime.fromtimestamp(float(value))
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError(f'{name} 必須是有效的 Unix 時間')
+
+
+def encode_cursor(created_at: datetime, accident_id) -> str:
+    """
+    產生分頁游標（最後一筆的 created_at 與 _id）
+
+    Args:
+        created_at: 建立時間
+        accident_id: 事故 ObjectId
+
+    Returns:
+        str: 不透明游標字串
+    """
+    raw = f'{created_at.isoformat()}|{accident_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, object]:
+    """
+    解析分頁游標
+
+    Args:
+        cursor: encode_cursor 產生的字串
+
+    Returns:
+        Tuple[datetime, ObjectId]: (created_at, _id)
+
+    Raises:
+        ValueError: 游標格式錯誤
+    """
+    from bson import ObjectId
+    from bson.errors import InvalidId
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, accident_id = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), ObjectId(accident_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError, InvalidId):
+        raise ValueError('無效的分頁游標')
+
+
+def page_query(active_only: bool = True, cursor: Optional[str] = None) -> Tuple[dict, list]:
+    """
+    事故列表分頁的篩選條件與排序
+
+    Args:
+        active_only: 是否只取得活動中的事故
+        cursor: 上一頁回傳的 next_cursor
+
+    Returns:
+        Tuple[dict, list]: (篩選條件, 排序)
+
+    Raises:
+        ValueError: 游標無效
+    """
+    query = {}
+    if active_only:
+        query['status'] = 'active'
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        query['$or'] = [
+            {'created_at': {'$lt': created_at}},
+            {'created_at': created_at, '_id': {'$lt': last_id}}
+        ]
+    return query, [('created_at', -1), ('_id', -1)]
+
+
+def changes_query(since_dt: datetime) -> Tuple[dict, list]:
+    """增量查詢的篩選條件與排序：since_dt 之後更新的事故，依更新時間由舊到新"""
+    return {'updated_at': {'$gte': since_dt}}, [('updated_at', 1)]
+
+
+def tombstones_query(since_dt: datetime) -> dict:
+    """增量查詢的刪除紀錄篩選條件：since_dt 之後刪除的事故"""
+    return {'deleted_at': {'$gte': since_dt}}
+
+
+def _geo_query(active_only: bool, location_filter: Optional[dict]) -> dict:
+    """組合地理查詢；location_filter 為 None 時為 bbox_filter 產生的條件或不限範圍"""
+    query = {'location': location_filter} if location_filter is not None else {}
+    if active_only:
+        query['status'] = 'active'
+    return query
+
+
+def _bbox_ring(min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> list:
+    """沿緯度邊加密頂點的逆時針矩形環（經度不跨越 ±180）"""
+    steps = max(1, int(math.ceil((max_lon - min_lon) / BBOX_SEGMENT_DEGREES)))
+    lons = [min_lon + (max_lon - min_lon) * i / steps for i in range(steps)] + [max_lon]
+    ring = [[lon, min_lat] for lon in lons]
+    ring += [[lon, max_lat] for lon in reversed(lons)]
+    ring.append([min_lon, min_lat])
+    return ring
+
+
+def _bbox_part(min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> dict:
+    """單一不跨越 ±180 的矩形：以經緯度範圍為準，可行時再加上 2dsphere 多邊形供索引使用"""
+    query = {
+        'location.coordinates.0': {'$gte': min_lon, '$lte': max_lon},
+        'location.coordinates.1': {'$gte': min_lat, '$lte': max_lat},
+    }
+    pad = BBOX_PADDING_DEGREES
+    # 碰到極點或經度繞一整圈時多邊形會退化（頂點重複），只用範圍條件
+    if -90 < min_lat - pad and max_lat + pad < 90 and max_lon - min_lon < 360:
+        ring = _bbox_ring(min_lon, min_lat - pad, max_lon, max_lat + pad)
+        # 逆時針環 + strictwinding CRS：縮小地圖時大於半球的範圍也能正確查詢
+        query['location'] = {'$geoWithin': {'$geometry': {
+            'type': 'Polygon',
+            'coordinates': [ring],
+            'crs': {'type': 'name', 'properties': {'name': 'urn:x-mongodb:crs:strictwinding:EPSG:4326'}}
+        }}}
+    return query
+
+
+def bbox_filter(min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> dict:
+    """
+    矩形範圍的查詢條件（與其他條件合併到同一個查詢中）
+
+    多邊形的緯度邊是測地線而非等緯線，因此以 location 座標的範圍條件為準，
+    多邊形只向外擴張後用來縮小索引掃描範圍。
+
+    Args:
+        min_lon: 西界經度（大於東界時表示跨越 ±180 經線）
+        min_lat: 南界緯度
+        max_lon: 東界經度
+        max_lat: 北界緯度
+
+    Returns:
+        dict: 查詢條件（全世界範圍時為空）
+
+    Raises:
+        ValueError: bbox 無效
+    """
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180 and min_lon != max_lon
+            and -90 <= min_lat < max_lat <= 90):
+        raise ValueError('無效的 bbox')
+    if min_lon > max_lon:
+        # 跨越 ±180 經線時拆成東西兩塊（略過寬度為 0 的一塊）
+        parts = [_bbox_part(west, min_lat, east, max_lat)
+                 for west, east in ((min_lon, 180.0), (-180.0, max_lon)) if west < east]
+        if not parts:
+            raise ValueError('無效的 bbox')
+        return parts[0] if len(parts) == 1 else {'$or': parts}
+    if min_lon == -180 and max_lon == 180 and min_lat == -90 and max_lat == 90:
+        return {}
+    return _bbox_part(min_lon, min_lat, max_lon, max_lat)
+
+
+def bbox_query(min_lon: float, min_lat: float, max_lon: float, max_lat: float,
+               active_only: bool = True) -> dict:
+    """
+    矩形範圍查詢的篩選條件（find_in_bbox、get_clusters 共用）
+
+    Raises:
+        ValueError: bbox 無效
+    """
+    query = _geo_query(active_only, None)
+    query.update(bbox_filter(min_lon, min_lat, max_lon, max_lat))
+    return query
+
+
+def near_query(latitude: float, longitude: float, radius: float, active_only: bool = True) -> dict:
+    """
+    半徑範圍查詢的篩選條件（依距離排序）
+
+    Raises:
+        ValueError: 座標或半徑無效
+    """
+    if radius <= 0:
+        raise ValueError('radius 必須大於 0')
+    return _geo_query(active_only, {
+        '$nearSphere': {
+            '$geometry': geo_point(latitude, longitude),
+            '$maxDistance': radius
+        }
+    })
+
+
+def track_query(mode: str, device_id: str, start: datetime, end: datetime) -> Tuple[str, dict, list]:
+    """
+    裝置軌跡查詢的集合、篩選條件與排序
+
+    Args:
+        mode: 'timeseries' 或 'buckets'
+        device_id: 裝置 ID
+        start: 開始時間
+        end: 結束時間
+
+    Returns:
+        Tuple[str, dict, list]: (集合名稱, 篩選條件, 排序)
+    """
+    if mode == 'timeseries':
+        return ('device_positions',
+                {'device_id': device_id, 'timestamp': {'$gte': start, '$lte': end}},
+                [('timestamp', 1)])
+    # 與時間範圍重疊的分桶
+    return ('device_position_buckets',
+            {'device_id': device_id, 'first': {'$lte': end}, 'last': {'$gte': start}},
+            [('first', 1)])
+
+
+__all__ = [
+    'geo_point',
+    'parse_timestamp',
+    'encode_cursor',
+    'decode_cursor',
+    'page_query',
+    'changes_query',
+    'tombstones_query',
+    'bbox_filter',
+    'bbox_query',
+    'near_query',
+    'track_query',
+]
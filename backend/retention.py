@@ -0,0 +1,291 @@
+"""
+事故資料保存政策（熱 / 冷分層）與壓縮工作
+讓熱資料集合 accidents 只保留進行中與近期的事故，使列表查詢的工作集留在記憶體：
+
+1. 已解決超過 RETENTION_ARCHIVE_DAYS 天的事故搬到冷資料集合 accidents_archive
+2. 建立超過 RETENTION_THUMBNAIL_DAYS 天的封存事故，影像重新壓縮為縮圖（需要 OpenCV）
+3. 超過法定保存期限 RETENTION_PURGE_DAYS 天的封存事故由 TTL 索引自動刪除（見 indexes.py）
+4. 刪除不再被任何事故引用的影像（原圖、已到期事故的影像），回報回收的位元組數
+
+使用方式：
+    python retention.py                  # 執行一次
+    python retention.py --dry-run        # 只統計將處理的筆數
+    python retention.py --interval 3600  # 背景服務：每小時執行一次
+    python retention.py --compact        # 另外對集合執行 MongoDB compact 歸還磁碟空間
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Set
+from pymongo.errors import OperationFailure
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.blob_store import get_blob_store, image_info
+from backend.config import BackendConfig
+from backend.models import AccidentModel, db
+
+COLLECTIONS = ('accidents', 'accidents_archive')
+
+
+def make_thumbnail(data: bytes, max_side: int, quality: int) -> Optional[bytes]:
+    """
+    將影像縮小並重新壓縮為 JPEG
+
+    Args:
+        data: 原始影像位元組
+        max_side: 長邊像素上限
+        quality: JPEG 品質（1-100）
+
+    Returns:
+        Optional[bytes]: 縮圖；無法解碼或縮圖沒有比較小時為 None
+    """
+    import cv2
+    import numpy as np
+
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (max(int(width * scale), 1), max(int(height * scale), 1)),
+                           interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok or len(encoded) >= len(data):
+        return None
+    return encoded.tobytes()
+
+
+def archive_resolved(days: float, batch_size: int, dry_run: bool = False) -> int:
+    """
+    將已解決超過 days 天（以最後更新時間計）的事故搬到 accidents_archive
+
+    Returns:
+        int: 封存筆數（dry_run 時為符合筆數）
+    """
+    query = {'updated_at': {'$lt': datetime.now() - timedelta(days=days)}}
+    if dry_run:
+        return AccidentModel.count(dict(query, status='resolved'))
+    return AccidentModel.archive(query, batch_size)
+
+
+def thumbnail_archived(days: float, max_side: int, quality: int, batch_size: int,
+                       dry_run: bool = False) -> dict:
+    """
+    將建立超過 days 天的封存事故影像重新壓縮為縮圖
+
+    縮圖寫入影像儲存後更新事故的影像欄位並標記 thumbnail_at；
+    原圖不立即刪除（可能被其他事故引用），由 collect_garbage 回收。
+
+    Returns:
+        dict: {"accidents", "images", "bytes_before", "bytes_after"}
+    """
+    archive = db.get_collection('accidents_archive')
+    query = {
+        'created_at': {'$lt': datetime.now() - timedelta(days=days)},
+        'image_hash': {'$exists': True},
+        'thumbnail_at': {'$exists': False},
+    }
+    result = {'accidents': 0, 'images': 0, 'bytes_before': 0, 'bytes_after': 0}
+    if dry_run:
+        result['accidents'] = archive.count_documents(query)
+        return result
+
+    store = get_blob_store()
+    projection = {'image_hash': 1, 'image_type': 1, 'image_width': 1, 'image_height': 1,
+                  'image_size': 1, 'images': 1}
+    while True:
+        docs = list(archive.find(query, projection).limit(batch_size))
+        if not docs:
+            return result
+        for doc in docs:
+            images = doc.get('images') or [{
+                'hash': doc['image_hash'], 'type': doc.get('image_type'), 'width': doc.get('image_width'),
+                'height': doc.get('image_height'), 'size': doc.get('image_size')
+            }]
+            for image in images:
+                data = store.get(image['hash'])
+                thumbnail = make_thumbnail(data, max_side, quality) if data else None
+                if thumbnail is None:
+                    continue
+                content_type, width, height = image_info(thumbnail)
+                image.update(hash=store.put(thumbnail), type=content_type, width=width, height=height,
+                             size=len(thumbnail))
+                result['images'] += 1
+                result['bytes_before'] += len(data)
+                result['bytes_after'] += len(thumbnail)
+
+            fields = {'image_' + key: value for key, value in images[0].items()}
+            fields['thumbnail_at'] = datetime.now()
+            if doc.get('images'):
+                fields['images'] = images
+            archive.update_one({'_id': doc['_id']}, {'$set': fields})
+            result['accidents'] += 1
+
+
+def referenced_hashes() -> Set[str]:
+    """熱資料與封存集合中所有事故引用的影像雜湊"""
+    hashes = set()
+    for name in COLLECTIONS:
+        for doc in db.get_collection(name).find({'image_hash': {'$exists': True}},
+                                                {'image_hash': 1, 'images.hash': 1}):
+            hashes.add(doc['image_hash'])
+            hashes.update(image['hash'] for image in doc.get('images') or [])
+    return hashes
+
+
+def is_referenced(digest: str) -> bool:
+    """是否有任何事故引用此影像（以 image_hash / images.hash 索引查詢）"""
+    query = {'$or': [{'image_hash': digest}, {'images.hash': digest}]}
+    return any(db.get_collection(name).find_one(query, {'_id': 1}) is not None for name in COLLECTIONS)
+
+
+def collect_garbage(grace: float, dry_run: bool = False) -> dict:
+    """
+    刪除沒有任何事故引用的影像
+
+    寫入未滿 grace 秒的影像不刪除：上報時影像先寫入儲存（去重時更新寫入時間）才建立事故文件。
+    引用快照取得後才新增的引用，在刪除前逐一重新查詢引用並以寫入時間為條件刪除來排除。
+
+    Returns:
+        dict: {"blobs", "bytes"}（刪除或 dry_run 時將刪除的影像數與位元組數）
+    """
+    store = get_blob_store()
+    referenced = referenced_hashes()
+    cutoff = time.time() - grace
+    result = {'blobs': 0, 'bytes': 0}
+    # 先列出再刪除，避免邊走訪邊修改目錄
+    for digest, size, modified in list(store.iter_blobs()):
+        if digest in referenced or modified > cutoff:
+            continue
+        # 刪除前重新確認：列出影像後可能已被新事故引用或重新寫入
+        if dry_run or (not is_referenced(digest) and store.delete(digest, older_than=cutoff)):
+            result['blobs'] += 1
+            result['bytes'] += size
+    return result
+
+
+def collection_sizes() -> dict:
+    """
+    各集合的資料與索引大小（collStats；不支援時為空）
+
+    Returns:
+        dict: {集合名稱: {"count", "size", "storage_size", "index_size"}}
+    """
+    sizes = {}
+    for name in COLLECTIONS:
+        try:
+            stats = db.db.command({'collStats': name})
+        except (OperationFailure, NotImplementedError):
+            continue
+        sizes[name] = {
+            'count': stats.get('count', 0),
+            'size': stats.get('size', 0),
+            'storage_size': stats.get('storageSize', 0),
+            'index_size': stats.get('totalIndexSize', 0),
+        }
+    return sizes
+
+
+def compact_collections() -> dict:
+    """
+    對集合執行 MongoDB compact，將刪除後的空間歸還檔案系統
+
+    Returns:
+        dict: {集合名稱: 回收位元組數}（不支援或權限不足時略過）
+    """
+    reclaimed = {}
+    for name in COLLECTIONS:
+        try:
+            result = db.db.command({'compact': name})
+        except (OperationFailure, NotImplementedError) as e:
+            print(f'無法壓縮集合 {name}: {e}')
+            continue
+        reclaimed[name] = result.get('bytesFreed', 0)
+    return reclaimed
+
+
+def run_once(config: BackendConfig, dry_run: bool = False, compact: bool = False) -> dict:
+    """
+    依設定執行一次所有保存政策步驟
+
+    Returns:
+        dict: 各步驟結果與 bytes_reclaimed（影像回收與 compact 釋放的位元組數）
+    """
+    report = {'started_at': datetime.now(), 'dry_run': dry_run}
+    if not dry_run:
+        report['inline_migrated'] = sum(AccidentModel.migrate_inline_images(name) for name in COLLECTIONS)
+    if config.RETENTION_ARCHIVE_DAYS > 0:
+        report['archived'] = archive_resolved(config.RETENTION_ARCHIVE_DAYS, config.BULK_BATCH_SIZE, dry_run)
+    if config.RETENTION_THUMBNAIL_DAYS > 0:
+        try:
+            report['thumbnails'] = thumbnail_archived(config.RETENTION_THUMBNAIL_DAYS, config.THUMBNAIL_MAX_SIDE,
+                                                      config.THUMBNAIL_QUALITY, config.BULK_BATCH_SIZE, dry_run)
+        except ImportError:
+            print('未安裝 opencv-python-headless，略過縮圖重新壓縮')
+    report['garbage'] = collect_garbage(config.BLOB_GC_GRACE, dry_run)
+    report['bytes_reclaimed'] = report['garbage']['bytes']
+    if compact and not dry_run:
+        report['compacted'] = compact_collections()
+        report['bytes_reclaimed'] += sum(report['compacted'].values())
+    report['sizes'] = collection_sizes()
+    return report
+
+
+def format_bytes(value: float) -> str:
+    """以 KB / MB / GB 顯示位元組數"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(value) < 1024 or unit == 'GB':
+            return f'{value:.0f} {unit}' if unit == 'B' else f'{value:.1f} {unit}'
+        value /= 1024
+
+
+def print_report(report: dict):
+    """輸出單次執行結果"""
+    prefix = '[dry-run] ' if report['dry_run'] else ''
+    print(f"{prefix}{report['started_at']:%Y-%m-%d %H:%M:%S} 保存政策執行結果")
+    if 'inline_migrated' in report:
+        print(f"  內嵌影像搬移: {report['inline_migrated']} 筆")
+    if 'archived' in report:
+        print(f"  封存已解決事故: {report['archived']} 筆")
+    if 'thumbnails' in report:
+        thumbnails = report['thumbnails']
+        print(f"  縮圖重新壓縮: {thumbnails['accidents']} 筆事故、{thumbnails['images']} 張影像 "
+              f"({format_bytes(thumbnails['bytes_before'])} → {format_bytes(thumbnails['bytes_after'])})")
+    print(f"  回收未引用影像: {report['garbage']['blobs']} 個 ({format_bytes(report['garbage']['bytes'])})")
+    for name, freed in report.get('compacted', {}).items():
+        print(f"  compact {name}: {format_bytes(freed)}")
+    for name, size in report['sizes'].items():
+        print(f"  {name}: {size['count']} 筆，資料 {format_bytes(size['size'])}，"
+              f"索引 {format_bytes(size['index_size'])}，磁碟 {format_bytes(size['storage_size'])}")
+    print(f"  共回收 {format_bytes(report['bytes_reclaimed'])}")
+
+
+def main(argv=None) -> int:
+    """主函式"""
+    parser = argparse.ArgumentParser(description='事故資料保存政策與壓縮工作')
+    parser.add_argument('--dry-run', action='store_true', help='只統計將處理的筆數，不做任何變更')
+    parser.add_argument('--compact', action='store_true', help='另外對集合執行 MongoDB compact')
+    parser.add_argument('--interval', type=float, default=0, help='每隔幾秒執行一次（0 表示只執行一次）')
+    args = parser.parse_args(argv)
+
+    config = BackendConfig()
+    if db.db is None:
+        print('MongoDB 未連接')
+        return 1
+
+    while True:
+        print_report(run_once(config, args.dry_run, args.compact))
+        if args.interval <= 0:
+            return 0
+        try:
+            time.sleep(args.interval)
+        except KeyboardInterrupt:
+            return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+正式環境伺服器
+以 gunicorn 執行 Flask 應用程式，取代 app.run() 的開發伺服器。
+
+使用方式：
+    python serve.py                          # 依 SERVER_* 環境變數
+    python serve.py --worker-class gevent    # 大量 MJPEG / SSE 觀看者（需 pip install gevent）
+    python serve.py --workers 4 --threads 32
+
+worker 類型：
+    gthread（預設）每條 MJPEG / SSE 串流佔用一個執行緒，SERVER_THREADS 需大於同時觀看人數加上輪詢請求
+    gevent         每條串流只佔一個 greenlet，適合大量觀看者
+
+每個 worker 各自有事件中心、影像轉送與位置緩衝；事件推播需 EVENTS_SOURCE=change_stream
+才能收到其他 worker 的寫入，因此 SERVER_WORKERS=0（預設）在 EVENTS_SOURCE=local 時只開 1 個 worker。
+
+關閉（SIGTERM）時先結束所有 MJPEG 與 SSE 串流（瀏覽器會自動重新連線），
+再等待一般請求完成（SERVER_GRACEFUL_TIMEOUT 秒），最後寫入裝置位置緩衝。
+gunicorn 不支援 Windows，未安裝時改用開發伺服器。
+"""
+
+import argparse
+import multiprocessing
+import signal
+import threading
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.config import BackendConfig
+
+
+def resolve_workers(config: BackendConfig) -> int:
+    """
+    決定 worker 數
+
+    Args:
+        config: 後端配置
+
+    Returns:
+        int: SERVER_WORKERS，為 0 時 EVENTS_SOURCE=local 用 1 個，否則依 CPU 數（最多 8 個）
+    """
+    if config.SERVER_WORKERS > 0:
+        return config.SERVER_WORKERS
+    if config.EVENTS_SOURCE != 'change_stream':
+        return 1
+    return min(multiprocessing.cpu_count() * 2 + 1, 8)
+
+
+def stop_streams():
+    """結束本 worker 的所有長連線串流（影像轉送與事件推播）"""
+    from backend.events import hub
+    from backend.video_relay import relay_hub
+    relay_hub.stop_all()
+    hub.close()
+
+
+def post_worker_init(worker):
+    """worker 載入應用程式後：SIGTERM 時先結束串流，否則串流會佔住 worker 直到 graceful_timeout"""
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(signum, frame):
+        # 在另一個執行緒中停止，避免在訊號處理中等待請求執行緒持有的鎖
+        threading.Thread(target=stop_streams, daemon=True).start()
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    """worker 結束前寫入尚未寫入的裝置位置"""
+    from backend.models import position_buffer
+    position_buffer.stop()
+
+
+def build_options(config: BackendConfig, args: argparse.Namespace) -> dict:
+    """
+    組合 gunicorn 設定
+
+    Args:
+        config: 後端配置
+        args: 命令列參數（覆蓋環境變數）
+
+    Returns:
+        dict: gunicorn 設定
+    """
+    worker_class = args.worker_class or config.SERVER_WORKER_CLASS
+    options = {
+        'bind': f'{args.host or config.FLASK_HOST}:{args.port or config.FLASK_PORT}',
+        'workers': args.workers or resolve_workers(config),
+        'worker_class': worker_class,
+        'timeout': config.SERVER_TIMEOUT,
+        'graceful_timeout': config.SERVER_GRACEFUL_TIMEOUT,
+        'keepalive': config.SERVER_KEEPALIVE,
+        # 每個 worker 自行連線 MongoDB 並啟動背景執行緒，不可在 fork 前載入
+        'preload_app': False,
+        'post_worker_init': post_worker_init,
+        'worker_exit': worker_exit,
+        'accesslog': '-' if args.access_log else None,
+    }
+    if worker_class == 'gthread':
+        options['threads'] = args.threads or config.SERVER_THREADS
+    else:
+        options['worker_connections'] = config.SERVER_WORKER_CONNECTIONS
+    return options
+
+
+def run_gunicorn(options: dict):
+    """以 gunicorn 執行（需已安裝 gunicorn）"""
+    from gunicorn.app.base import BaseApplication
+
+    class BackendApplication(BaseApplication):
+        """以 Python 設定啟動 gunicorn，不需要設定檔"""
+
+        def load_config(self):
+            for key, value in options.items():
+                if value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            from backend.app import app
+            return app
+
+    BackendApplication().run()
+
+
+def main(argv=None):
+    """主函式"""
+    parser = argparse.ArgumentParser(description='以 gunicorn 執行後端 API')
+    parser.add_argument('--host', help='綁定位址（預設 FLASK_HOST）')
+    parser.add_argument('--port', type=int, help='埠號（預設 FLASK_PORT）')
+    parser.add_argument('--worker-class', choices=['gthread', 'gevent'], help='worker 類型（預設 SERVER_WORKER_CLASS）')
+    parser.add_argument('--workers', type=int, help='worker 數（預設 SERVER_WORKERS）')
+    parser.add_argument('--threads', type=int, help='gthread 每個 worker 的執行緒數（預設 SERVER_THREADS）')
+    parser.add_argument('--access-log', action='store_true', help='輸出存取紀錄')
+    args = parser.parse_args(argv)
+
+    config = BackendConfig()
+    options = build_options(config, args)
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        print('未安裝 gunicorn（pip install gunicorn；Windows 不支援），改用開發伺服器')
+        from backend.app import app
+        host, port = options['bind'].rsplit(':', 1)
+        app.run(host=host, port=int(port), threaded=True)
+        return
+
+    print(f"啟動 gunicorn: http://{options['bind']} "
+          f"({options['workers']} 個 {options['worker_class']} worker"
+          f"{', 每個 ' + str(options['threads']) + ' 個執行緒' if 'threads' in options else ''})")
+    run_gunicorn(options)
+
+
+if __name__ == '__main__':
+    main()
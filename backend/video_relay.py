@@ -0,0 +1,500 @@
+"""
+即時影像轉送模組
+每台車（每種 overlay 模式）只向車載端開一條 MJPEG 上游連線，
+解析出完整的 JPEG 幀後分送給所有觀看者。
+
+每個觀看者只取「目前最新的一幀」，處理較慢的客戶端會自動跳過中間的幀，
+不會拖慢上游或其他觀看者；車載端上行頻寬與觀看人數無關。
+最後一位觀看者離開 VIDEO_RELAY_IDLE_TIMEOUT 秒後關閉上游連線。
+
+轉送以執行緒與 threading.Condition 實作，可在 Flask 多執行緒伺服器上執行，
+也相容 gunicorn gevent worker（monkey patch 後每個觀看者只佔一個 greenlet）。
+
+上游收到的每一幀同時寫入 KeyframeCache，/api/snapshot 有人觀看時直接取用；
+沒有上游連線時才向車載端 /snapshot.jpg 取一張，並在短時間內共用結果。
+"""
+
+import functools
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import requests
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.config import BackendConfig
+
+# 轉送給瀏覽器的 multipart 分隔字串
+BOUNDARY = 'frame'
+MIMETYPE = f'multipart/x-mixed-replace; boundary={BOUNDARY}'
+
+
+def format_part(jpeg: bytes) -> bytes:
+    """將 JPEG 包成 multipart 區段（每幀只編排一次，所有觀看者共用）"""
+    return (f'--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n'.encode('ascii')
+            + jpeg + b'\r\n')
+
+
+def parse_boundary(content_type: str) -> bytes:
+    """
+    由 Content-Type 取得 multipart 分隔字串
+
+    Args:
+        content_type: 例如 'multipart/x-mixed-replace; boundary=frame'
+
+    Returns:
+        bytes: 分隔字串（不含前置 --），未指定時為 b'frame'
+    """
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.strip().partition('=')
+        if key.lower() == 'boundary' and value:
+            value = value.strip('"')
+            return (value[2:] if value.startswith('--') else value).encode('latin-1')
+    return BOUNDARY.encode('ascii')
+
+
+class MJPEGParser:
+    """增量解析 multipart MJPEG 串流，輸出完整的 JPEG 幀"""
+
+    def __init__(self, boundary: bytes, max_buffer: int = 8 * 1024 * 1024):
+        """
+        Args:
+            boundary: 分隔字串（不含前置 --）
+            max_buffer: 緩衝上限，超過時丟棄（串流損毀）
+        """
+        self.delimiter = b'--' + boundary
+        self.max_buffer = max_buffer
+        self.buffer = bytearray()
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """
+        加入資料並取出已完整的幀
+
+        Args:
+            chunk: 上游讀到的位元組
+
+        Returns:
+            List[bytes]: JPEG 幀（依序）
+        """
+        self.buffer += chunk
+        frames = []
+        while True:
+            start = self.buffer.find(self.delimiter)
+            if start < 0:
+                break
+            end = self.buffer.find(self.delimiter, start + len(self.delimiter))
+            if end < 0:
+                # 丟棄第一個分隔字串之前的雜訊，等待下一個分隔字串
+                if start > 0:
+                    del self.buffer[:start]
+                break
+            part = bytes(self.buffer[start + len(self.delimiter):end])
+            del self.buffer[:end]
+            header_end = part.find(b'\r\n\r\n')
+            if header_end < 0:
+                continue
+            body = part[header_end + 4:]
+            if body.endswith(b'\r\n'):
+                body = body[:-2]
+            if body[:2] == b'\xff\xd8':
+                frames.append(body)
+        if len(self.buffer) > self.max_buffer:
+            self.buffer.clear()
+        return frames
+
+
+class Keyframe:
+    """快取中的一幀"""
+
+    __slots__ = ('jpeg', 'timestamp', '_etag')
+
+    def __init__(self, jpeg: bytes, timestamp: float):
+        """
+        Args:
+            jpeg: JPEG 位元組
+            timestamp: 取得時間（Unix 時間戳）
+        """
+        self.jpeg = jpeg
+        self.timestamp = timestamp
+        self._etag: Optional[str] = None
+
+    @property
+    def etag(self) -> str:
+        """內容雜湊（第一次使用時才計算，上游每幀寫入不需雜湊）"""
+        if self._etag is None:
+            self._etag = hashlib.sha256(self.jpeg).hexdigest()[:32]
+        return self._etag
+
+    @property
+    def age(self) -> float:
+        """距今秒數"""
+        return max(time.time() - self.timestamp, 0.0)
+
+
+class KeyframeCache:
+    """每台車（每種 overlay 模式）的最新一幀"""
+
+    def __init__(self, failure_ttl: float = 2.0):
+        """
+        Args:
+            failure_ttl: 抓取失敗後多久內不再重試（秒），避免車載端離線時每個請求都等到逾時
+        """
+        self.failure_ttl = failure_ttl
+        self.frames: Dict[Tuple[str, bool], Keyframe] = {}
+        self.failures: Dict[Tuple[str, bool], Tuple[float, Exception]] = {}
+        self.fetch_locks: Dict[Tuple[str, bool], threading.Lock] = {}
+        self.lock = threading.Lock()
+
+    def put(self, key: Tuple[str, bool], jpeg: bytes) -> Keyframe:
+        """
+        寫入最新一幀（上游執行緒每幀呼叫，只替換參照）
+
+        Args:
+            key: (device_id, overlay)
+            jpeg: JPEG 位元組
+
+        Returns:
+            Keyframe: 寫入的幀
+        """
+        frame = Keyframe(jpeg, time.time())
+        self.frames[key] = frame
+        return frame
+
+    def get(self, key: Tuple[str, bool], max_age: Optional[float] = None) -> Optional[Keyframe]:
+        """
+        取得最新一幀
+
+        Args:
+            key: (device_id, overlay)
+            max_age: 最長可接受的秒數（None 表示不限）
+
+        Returns:
+            Optional[Keyframe]: 幀，沒有或過舊時為 None
+        """
+        frame = self.frames.get(key)
+        if frame is None or (max_age is not None and frame.age > max_age):
+            return None
+        return frame
+
+    def get_or_fetch(self, key: Tuple[str, bool], max_age: float, fetch: Callable[[], bytes],
+                     stale_max: float = 0.0) -> Keyframe:
+        """
+        取得不超過 max_age 秒的幀，必要時呼叫 fetch 取得新的一幀
+
+        同一台車同時只有一個請求會呼叫 fetch，其餘等待並共用結果。
+
+        Args:
+            key: (device_id, overlay)
+            max_age: 最長可接受的秒數
+            fetch: 向車載端取得 JPEG 的函式
+            stale_max: 抓取失敗時仍可回傳的舊幀秒數
+
+        Returns:
+            Keyframe: 幀
+
+        Raises:
+            Exception: 抓取失敗且沒有可用的舊幀
+        """
+        frame = self.get(key, max_age)
+        if frame is not None:
+            return frame
+
+        with self.lock:
+            fetch_lock = self.fetch_locks.setdefault(key, threading.Lock())
+        with fetch_lock:
+            # 等待期間可能已由其他請求或上游更新
+            frame = self.get(key, max_age)
+            if frame is not None:
+                return frame
+            try:
+                failure = self.failures.get(key)
+                if failure is not None and time.monotonic() - failure[0] < self.failure_ttl:
+                    raise failure[1]
+                try:
+                    frame = self.put(key, fetch())
+                except Exception as e:
+                    self.failures[key] = (time.monotonic(), e)
+                    raise
+                self.failures.pop(key, None)
+                return frame
+            except Exception:
+                stale = self.get(key, stale_max)
+                if stale is None:
+                    raise
+                return stale
+
+    def stats(self) -> Dict[str, float]:
+        """各裝置快取幀的秒數 {'device_id:overlay': age}"""
+        return {f'{device_id}:{"overlay" if overlay else "raw"}': round(frame.age, 3)
+                for (device_id, overlay), frame in list(self.frames.items())}
+
+
+def fetch_snapshot(base_url: str, overlay: bool, session: requests.Session, timeout) -> bytes:
+    """
+    向車載端取得一張快照
+
+    舊版車載端沒有 /snapshot.jpg 時（404），改由 /video_stream 讀取第一幀後中斷。
+
+    Args:
+        base_url: 車載端位址（例如 http://10.0.0.5:8080）
+        overlay: 是否顯示偵測框
+        session: 該車的連線池
+        timeout: (連線逾時, 讀取逾時)
+
+    Returns:
+        bytes: JPEG 位元組
+
+    Raises:
+        requests.RequestException: 連線失敗或沒有影像
+    """
+    params = {'overlay': str(overlay).lower()}
+    response = session.get(f'{base_url}/snapshot.jpg', params=params, timeout=timeout)
+    if response.status_code != 404:
+        response.raise_for_status()
+        if response.content[:2] != b'\xff\xd8':
+            raise requests.RequestException('車載端回傳的快照不是 JPEG')
+        return response.content
+
+    with session.get(f'{base_url}/video_stream', params=params, stream=True, timeout=timeout) as stream:
+        stream.raise_for_status()
+        parser = MJPEGParser(parse_boundary(stream.headers.get('Content-Type', '')))
+        for chunk in stream.iter_content(chunk_size=None):
+            frames = parser.feed(chunk)
+            if frames:
+                return frames[-1]
+    raise requests.ConnectionError('影像串流在第一幀前結束')
+
+
+class StreamRelay:
+    """單一上游 MJPEG 串流的轉送"""
+
+    def __init__(self, url: str, session: Optional[requests.Session] = None, idle_timeout: float = 10.0,
+                 connect_timeout: float = 5.0, read_timeout: float = 10.0,
+                 on_frame: Optional[Callable[[bytes], None]] = None):
+        """
+        Args:
+            url: 車載端 /video_stream URL
+            session: 連線使用的 Session（None 則自行建立）
+            idle_timeout: 沒有觀看者多久後關閉上游（秒）
+            connect_timeout: 連線逾時（秒）
+            read_timeout: 上游無資料多久視為中斷（秒）
+            on_frame: 每收到一幀時呼叫（在上游執行緒中，必須簡短）
+        """
+        self.url = url
+        self.session = session or requests.Session()
+        self.idle_timeout = idle_timeout
+        self.timeout = (connect_timeout, read_timeout)
+        self.on_frame = on_frame
+
+        self.cond = threading.Condition()
+        self.latest: Optional[bytes] = None
+        self.sequence = 0
+        self.viewers = 0
+        self.idle_since = time.monotonic()
+        self.error: Optional[str] = None
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.connects = 0
+
+    @property
+    def alive(self) -> bool:
+        """上游執行緒是否仍在執行"""
+        return self.running
+
+    def start(self):
+        """啟動上游執行緒"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='video-relay', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """停止上游（觀看者的串流隨之結束）"""
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def attach(self):
+        """加入一位觀看者"""
+        with self.cond:
+            self.viewers += 1
+
+    def detach(self):
+        """移除一位觀看者"""
+        with self.cond:
+            self.viewers -= 1
+            if self.viewers == 0:
+                self.idle_since = time.monotonic()
+
+    def wait_first_frame(self, timeout: float) -> bool:
+        """
+        等待第一幀（新連線時用來判斷車載端是否可連線）
+
+        Returns:
+            bool: 是否已有影像
+        """
+        with self.cond:
+            return self.cond.wait_for(
+                lambda: self.latest is not None or self.error is not None or not self.running,
+                timeout
+            ) and self.latest is not None
+
+    def frames(self, keepalive: float = 5.0) -> Iterator[bytes]:
+        """
+        觀看者的串流產生器（每次產生最新一幀的 multipart 區段）
+
+        呼叫前須已 attach()（VideoRelayHub.get 會代為登記），結束時自動 detach()。
+
+        Args:
+            keepalive: 上游沒有新幀時重送最後一幀的間隔（秒），讓伺服器能偵測客戶端已離線
+        """
+        try:
+            seen = -1
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.sequence != seen or not self.running, keepalive)
+                    if not self.running:
+                        return
+                    part = self.latest
+                    seen = self.sequence
+                if part is not None:
+                    yield part
+        finally:
+            self.detach()
+
+    def _publish(self, jpeg: bytes):
+        part = format_part(jpeg)
+        with self.cond:
+            self.latest = part
+            self.sequence += 1
+            self.frames_in += 1
+            self.error = None
+            self.cond.notify_all()
+        if self.on_frame is not None:
+            try:
+                self.on_frame(jpeg)
+            except Exception as e:
+                print(f'影像回呼錯誤: {e}')
+
+    def _idle(self) -> bool:
+        with self.cond:
+            return self.viewers == 0 and time.monotonic() - self.idle_since >= self.idle_timeout
+
+    def _run(self):
+        backoff = 1.0
+        try:
+            while self.running and not self._idle():
+                try:
+                    with self.session.get(self.url, stream=True, timeout=self.timeout) as response:
+                        response.raise_for_status()
+                        self.connects += 1
+                        backoff = 1.0
+                        parser = MJPEGParser(parse_boundary(response.headers.get('Content-Type', '')))
+                        # 資料到達即處理，不等待湊滿固定大小
+                        for chunk in response.iter_content(chunk_size=None):
+                            if not self.running or self._idle():
+                                return
+                            self.bytes_in += len(chunk)
+                            for jpeg in parser.feed(chunk):
+                                self._publish(jpeg)
+                    raise requests.ConnectionError('上游串流結束')
+                except requests.RequestException as e:
+                    with self.cond:
+                        self.error = str(e)
+                        self.cond.notify_all()
+                    print(f'影像上游中斷，{backoff:.0f} 秒後重新連線: {self.url}: {e}')
+                    with self.cond:
+                        self.cond.wait_for(lambda: not self.running, backoff)
+                    backoff = min(backoff * 2, 10.0)
+        finally:
+            with self.cond:
+                self.running = False
+                self.cond.notify_all()
+
+    def stats(self) -> dict:
+        """轉送統計"""
+        with self.cond:
+            return {
+                'url': self.url,
+                'viewers': self.viewers,
+                'frames': self.frames_in,
+                'bytes': self.bytes_in,
+                'connects': self.connects,
+                'error': self.error
+            }
+
+
+class VideoRelayHub:
+    """依 (device_id, overlay) 共用上游連線"""
+
+    def __init__(self, config: Optional[BackendConfig] = None):
+        """
+        Args:
+            config: 後端配置（逾時設定）
+        """
+        self.config = config or BackendConfig()
+        self.keyframes = KeyframeCache(self.config.SNAPSHOT_FAILURE_TTL)
+        self.relays: Dict[Tuple[str, bool], StreamRelay] = {}
+        self.lock = threading.Lock()
+
+    def get(self, device_id: str, overlay: bool, url: str,
+            session: Optional[requests.Session] = None) -> StreamRelay:
+        """
+        取得（必要時建立）轉送，並先登記一位觀看者以免剛建立就被視為閒置
+
+        呼叫端必須接著使用 relay.frames()，或在不使用時呼叫 relay.detach()。
+
+        Args:
+            device_id: 裝置 ID
+            overlay: 是否顯示偵測框
+            url: 車載端 /video_stream URL
+            session: 該車的連線池（None 則每條上游自行建立）
+
+        Returns:
+            StreamRelay: 轉送
+        """
+        key = (device_id, overlay)
+        with self.lock:
+            relay = self.relays.get(key)
+            if relay is None or not relay.alive or relay.url != url:
+                if relay is not None:
+                    relay.stop()
+                relay = StreamRelay(
+                    url,
+                    session=session,
+                    idle_timeout=self.config.VIDEO_RELAY_IDLE_TIMEOUT,
+                    connect_timeout=self.config.VIDEO_RELAY_CONNECT_TIMEOUT,
+                    read_timeout=self.config.VIDEO_RELAY_READ_TIMEOUT,
+                    on_frame=functools.partial(self.keyframes.put, key)
+                )
+                relay.start()
+                self.relays[key] = relay
+            relay.attach()
+        return relay
+
+    def stats(self) -> dict:
+        """所有轉送的統計 {'device_id:overlay': {...}}"""
+        with self.lock:
+            relays = dict(self.relays)
+        return {f'{device_id}:{"overlay" if overlay else "raw"}': relay.stats()
+                for (device_id, overlay), relay in relays.items() if relay.alive}
+
+    def stop_all(self):
+        """停止所有上游"""
+        with self.lock:
+            relays = list(self.relays.values())
+            self.relays.clear()
+        for relay in relays:
+            relay.stop()
+
+
+# 全域轉送中心
+relay_hub = VideoRelayHub()
+
+
+__all__ = ['MJPEGParser', 'StreamRelay', 'VideoRelayHub', 'relay_hub', 'format_part', 'parse_boundary',
+           'Keyframe', 'KeyframeCache', 'fetch_snapshot', 'BOUNDARY', 'MIMETYPE']
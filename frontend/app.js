@@ -5,6 +5,7 @@ const CONFIG = {
     API_URL: 'http://localhost:5000/api',  // 本地開發使用
     VIDEO_STREAM_URL: 'http://localhost:5000/api/video/vehicle_001',  // 本地開發使用
     UPDATE_INTERVAL: 5000, // 5 秒更新一次
+    PAGE_SIZE: 500, // 事故列表每頁筆數
     MAP_CENTER: [25.0330, 121.5654], // 預設位置（台北）[緯度, 經度]
     MAP_ZOOM: 13
 };
@@ -16,6 +17,15 @@ let isAdmin = false;
 let adminToken = null;
 let videoStreamInterval = null;
 
+// 事故列表增量同步狀態
+let accidentsById = new Map();
+let accidentsSince = null;
+let accidentsETag = null;
+
+// 事件推播連線（連線中時停止輪詢）
+let eventSource = null;
+let eventsConnected = false;
+
 // 初始化
 document.addEventListener('DOMContentLoaded', () => {
     console.log('前端初始化中...');
@@ -30,9 +40,48 @@ document.addEventListener('DOMContentLoaded', () => {
     // 載入資料
     loadAccidents();
     startVideoStream();
-    setInterval(loadAccidents, CONFIG.UPDATE_INTERVAL);
+    startEventStream();
+    // 事件推播中斷時以輪詢作為備援
+    setInterval(() => {
+        if (!eventsConnected) {
+            loadAccidents();
+        }
+    }, CONFIG.UPDATE_INTERVAL);
 });
 
+// 訂閱後端事件推播，有事故變動時立即增量同步
+function startEventStream() {
+    if (typeof EventSource === 'undefined') {
+        console.warn('瀏覽器不支援 EventSource，使用輪詢');
+        return;
+    }
+    
+    eventSource = new EventSource(`${CONFIG.API_URL}/events`);
+    
+    eventSource.onopen = () => {
+        console.log('事件推播已連線');
+        eventsConnected = true;
+        // 重新連線期間可能錯過事件
+        loadAccidents();
+    };
+    
+    eventSource.onerror = () => {
+        // EventSource 會自動重新連線
+        eventsConnected = false;
+    };
+    
+    ['accident.created', 'accident.updated', 'accident.deleted', 'accidents.bulk'].forEach(type => {
+        eventSource.addEventListener(type, () => loadAccidents());
+    });
+    
+    ['accidents.cleared', 'resync'].forEach(type => {
+        eventSource.addEventListener(type, () => {
+            accidentsSince = null;
+            loadAccidents();
+        });
+    });
+}
+
 // 初始化 Leaflet 地圖
 function initMap() {
     // 檢查 Leaflet 是否已載入
@@ -59,6 +108,9 @@ function initMap() {
             maxZoom: 19
         }).addTo(map);
         
+        // 地圖移動或縮放後只載入可視範圍內的事故
+        map.on('moveend', loadMapAccidents);
+        
         console.log('Leaflet 地圖初始化成功');
     } catch (error) {
         console.error('Leaflet 地圖初始化失敗:', error);
@@ -170,34 +222,16 @@ function updateUIForUser() {
 // 載入事故列表
 async function loadAccidents() {
     try {
-        const url = `${CONFIG.API_URL}/get_accidents?active_only=true`;
-        console.log('載入事故列表:', url);
-        
-        const response = await fetch(url, {
-            method: 'GET',
-            headers: {
-                'Content-Type': 'application/json'
-            }
-        });
-        
-        if (!response.ok) {
-            console.error('HTTP 錯誤:', response.status, response.statusText);
-            const errorText = await response.text();
-            console.error('錯誤詳情:', errorText);
-            throw new Error(`HTTP error! status: ${response.status}`);
+        let changed;
+        if (accidentsSince === null) {
+            changed = await loadAllAccidents();
+        } else {
+            changed = await loadAccidentChanges();
         }
         
-        const data = await response.json();
-        console.log('事故列表載入成功:', data);
-
-        if (data.accidents) {
-            displayAccidents(data.accidents);
-            updateMapMarkers(data.accidents);
-            document.getElementById('activeAccidentsCount').textContent = data.accidents.length;
-        } else {
-            console.warn('API 回應格式異常:', data);
-            displayAccidents([]);
-            updateMapMarkers([]);
+        if (changed) {
+            renderAccidents();
+            loadMapAccidents();
         }
     } catch (error) {
         console.error('載入事故列表失敗:', error);
@@ -214,6 +248,98 @@ async function loadAccidents() {
     }
 }
 
+// 以目前同步的資料重新繪製事故列表
+function renderAccidents() {
+    const accidents = Array.from(accidentsById.values())
+        .sort((a, b) => b.timestamp - a.timestamp);
+    console.log('事故列表已更新:', accidents.length);
+    displayAccidents(accidents);
+    document.getElementById('activeAccidentsCount').textContent = accidents.length;
+}
+
+// 呼叫事故列表 API，集合未變動時回傳 null（304）
+async function fetchAccidents(params, etag) {
+    const url = `${CONFIG.API_URL}/get_accidents?active_only=true&fields=${ACCIDENT_FIELDS}&${params}`;
+    const headers = {
+        'Content-Type': 'application/json'
+    };
+    if (etag) {
+        headers['If-None-Match'] = etag;
+    }
+    
+    const response = await fetch(url, {
+        method: 'GET',
+        headers,
+        cache: 'no-store'
+    });
+    
+    if (response.status === 304) {
+        return null;
+    }
+    if (!response.ok) {
+        console.error('HTTP 錯誤:', response.status, response.statusText);
+        const errorText = await response.text();
+        console.error('錯誤詳情:', errorText);
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    
+    return {
+        data: await response.json(),
+        etag: response.headers.get('ETag')
+    };
+}
+
+// 只取列表與地圖需要的欄位
+const ACCIDENT_FIELDS = 'latitude,longitude,timestamp,device_id,has_injured,status';
+
+// 完整載入事故列表（依 next_cursor 逐頁載入）
+async function loadAllAccidents() {
+    const loaded = new Map();
+    let since = null;
+    let etag = null;
+    let cursor = null;
+    
+    do {
+        let params = `limit=${CONFIG.PAGE_SIZE}`;
+        if (cursor) {
+            params += `&cursor=${encodeURIComponent(cursor)}`;
+        }
+        const result = await fetchAccidents(params, null);
+        const page = result.data;
+        if (since === null) {
+            // 以第一頁的時間與版本作為增量同步起點
+            since = page.since;
+            etag = result.etag;
+        }
+        (page.accidents || []).forEach(accident => loaded.set(accident._id, accident));
+        cursor = page.next_cursor;
+    } while (cursor);
+    
+    accidentsById = loaded;
+    accidentsSince = since;
+    accidentsETag = etag;
+    return true;
+}
+
+// 只載入上次同步後的變動
+async function loadAccidentChanges() {
+    const result = await fetchAccidents(`since=${accidentsSince}`, accidentsETag);
+    if (result === null) {
+        return false;
+    }
+    
+    const delta = result.data;
+    if (delta.reset) {
+        return loadAllAccidents();
+    }
+    
+    delta.deleted.forEach(id => accidentsById.delete(id));
+    delta.changes.forEach(accident => accidentsById.set(accident._id, accident));
+    accidentsSince = delta.since;
+    accidentsETag = result.etag;
+    return delta.deleted.length > 0 || delta.changes.length > 0;
+}
+
 // 顯示事故列表
 function displayAccidents(accidents) {
     const listContainer = document.getElementById('accidentsList');
@@ -275,7 +401,101 @@ function displayAccidents(accidents) {
 
 // 更新事故卡片（添加/移除管理員功能）
 function updateAccidentCards() {
-    loadAccidents();
+    renderAccidents();
+}
+
+// 載入地圖可視範圍內的事故（縮小時由後端回傳聚合結果）
+async function loadMapAccidents() {
+    if (!map || typeof L === 'undefined') {
+        return;
+    }
+    
+    const bounds = map.getBounds();
+    // 經度換算回 -180 ~ 180；跨越 ±180 經線時西界大於東界，由後端拆成兩塊查詢
+    const wrapLongitude = (lon) => ((lon + 180) % 360 + 360) % 360 - 180;
+    let west = -180;
+    let east = 180;
+    if (bounds.getEast() - bounds.getWest() < 360) {
+        west = wrapLongitude(bounds.getWest());
+        east = wrapLongitude(bounds.getEast());
+        if (east === -180) {
+            east = 180;
+        }
+        if (west === east) {
+            west = -180;
+            east = 180;
+        }
+    }
+    const bbox = [
+        west,
+        Math.max(bounds.getSouth(), -90),
+        east,
+        Math.min(bounds.getNorth(), 90)
+    ].join(',');
+    
+    try {
+        const url = `${CONFIG.API_URL}/get_accidents_in_bbox?active_only=true&bbox=${bbox}&zoom=${map.getZoom()}`;
+        const response = await fetch(url, {
+            method: 'GET',
+            headers: {
+                'Content-Type': 'application/json'
+            }
+        });
+        
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        
+        const data = await response.json();
+        if (data.clusters) {
+            updateMapClusters(data.clusters);
+        } else {
+            updateMapMarkers(data.accidents || []);
+        }
+    } catch (error) {
+        console.error('載入地圖事故失敗:', error);
+    }
+}
+
+// 更新地圖聚合標記（點擊後放大該區域）
+function updateMapClusters(clusters) {
+    markers.forEach(marker => map.removeLayer(marker));
+    markers = [];
+    
+    clusters.forEach(cluster => {
+        const size = cluster.count >= 100 ? 48 : cluster.count >= 10 ? 40 : 32;
+        const clusterIcon = L.divIcon({
+            className: 'custom-marker',
+            html: `
+                <div style="
+                    width: ${size}px;
+                    height: ${size}px;
+                    background-color: ${cluster.injured > 0 ? '#ef4444' : '#f97316'};
+                    border: 2px solid white;
+                    border-radius: 50%;
+                    display: flex;
+                    align-items: center;
+                    justify-content: center;
+                    color: white;
+                    font-weight: bold;
+                    font-size: 14px;
+                    box-shadow: 0 2px 4px rgba(0,0,0,0.3);
+                ">${cluster.count}</div>
+            `,
+            iconSize: [size, size],
+            iconAnchor: [size / 2, size / 2]
+        });
+        
+        const marker = L.marker([cluster.latitude, cluster.longitude], {
+            icon: clusterIcon,
+            title: `${cluster.count} 起事故`
+        }).addTo(map);
+        
+        marker.on('click', () => {
+            map.setView([cluster.latitude, cluster.longitude], Math.min(map.getZoom() + 2, 19));
+        });
+        markers.push(marker);
+    });
 }
 
 // 更新地圖標記
@@ -4,5 +4,5 @@
 cd "$(dirname "$0")/backend"
 source venv/bin/activate
 
-python app.py
+python serve.py
 
@@ -0,0 +1,236 @@
+"""
+非阻塞致動排程模組
+以單一背景執行緒的計時輪（timer wheel）排程致動完成事件，
+伺服與警報呼叫立即返回 Future，動作完成時由計時輪設定結果。
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+
+class TimerWheel:
+    """
+    簡易雜湊計時輪
+
+    每個 tick 推進一格，到期的回呼在計時執行緒中執行，
+    因此回呼必須簡短（寫一次腳位、設定 Future 結果）。
+    沒有待執行的事件時計時執行緒停住不推進，由 schedule() 喚醒，閒置時不會每 tick 喚醒一次。
+    """
+
+    def __init__(self, tick: float = 0.01, slots: int = 512):
+        """
+        初始化計時輪
+
+        Args:
+            tick: 每格時間（秒）
+            slots: 格數，tick * slots 為一圈的時間
+        """
+        self.tick = tick
+        self.slots: List[list] = [[] for _ in range(slots)]
+        self.position = 0
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+
+    def start(self):
+        """啟動計時執行緒（重複呼叫無副作用）"""
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name='timer-wheel', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """停止計時執行緒，未到期的事件不會被執行"""
+        with self.lock:
+            self.running = False
+            self.wakeup.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> list:
+        """
+        排程回呼
+
+        Args:
+            delay: 延遲秒數
+            callback: 到期時呼叫的函式
+
+        Returns:
+            list: 事件項目，可傳給 cancel() 取消
+        """
+        self.start()
+        ticks = max(1, int(round(delay / self.tick)))
+        with self.lock:
+            # 第一次經過目標格時已走過 ((ticks - 1) % slots) + 1 格，其餘以圈數計
+            rounds = (ticks - 1) // len(self.slots)
+            entry = [rounds, callback]
+            self.slots[(self.position + ticks) % len(self.slots)].append(entry)
+            self.pending += 1
+            if self.pending == 1:
+                self.wakeup.notify()
+        return entry
+
+    def cancel(self, entry: list):
+        """
+        取消尚未到期的事件（已到期或已取消的事件不受影響）
+
+        Args:
+            entry: schedule() 回傳的事件項目
+        """
+        with self.lock:
+            if entry[1] is not None:
+                entry[1] = None
+                self.pending -= 1
+
+    def _run(self):
+        """計時執行緒主迴圈（以單調時鐘補償漂移）"""
+        next_tick = time.monotonic()
+        while True:
+            with self.lock:
+                if self.pending == 0:
+                    # 停住時不推進格位，喚醒後由現在重新計時，事件仍在排程後 delay 秒到期
+                    while self.running and self.pending == 0:
+                        self.wakeup.wait()
+                    next_tick = time.monotonic()
+                if not self.running:
+                    return
+            next_tick += self.tick
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            with self.lock:
+                if not self.running:
+                    return
+                self.position = (self.position + 1) % len(self.slots)
+                slot = self.slots[self.position]
+                due = []
+                for entry in slot:
+                    if entry[0] == 0 and entry[1] is not None:
+                        due.append(entry[1])
+                        # 已到期的事件視同取消，之後再呼叫 cancel() 不會重複扣減 pending
+                        entry[1] = None
+                self.pending -= len(due)
+                remaining = []
+                for entry in slot:
+                    if entry[0] > 0 and entry[1] is not None:
+                        entry[0] -= 1
+                        remaining.append(entry)
+                self.slots[self.position] = remaining
+
+            for callback in due:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"計時輪回呼錯誤: {e}")
+
+
+_default_wheel: Optional[TimerWheel] = None
+_default_wheel_lock = threading.Lock()
+
+
+def get_timer_wheel() -> TimerWheel:
+    """
+    取得共用的計時輪
+
+    Returns:
+        TimerWheel: 共用計時輪
+    """
+    global _default_wheel
+    with _default_wheel_lock:
+        if _default_wheel is None:
+            _default_wheel = TimerWheel()
+        return _default_wheel
+
+
+def completed_future(result=None) -> Future:
+    """
+    建立已完成的 Future
+
+    Args:
+        result: 結果值
+
+    Returns:
+        Future: 已完成的 Future
+    """
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def complete_after(delay: float, result=None, action: Optional[Callable[[], None]] = None,
+                   wheel: Optional[TimerWheel] = None) -> Future:
+    """
+    延遲後完成 Future（可選擇在完成前執行動作，例如拉低腳位）
+
+    Args:
+        delay: 延遲秒數
+        result: Future 結果
+        action: 到期時先執行的動作
+        wheel: 計時輪，None 則使用共用計時輪
+
+    Returns:
+        Future: 到期時完成的 Future
+    """
+    future = Future()
+    future.set_running_or_notify_cancel()
+
+    def _fire():
+        try:
+            if action is not None:
+                action()
+        except Exception as e:
+            future.set_exception(e)
+            return
+        future.set_result(result)
+
+    if delay <= 0:
+        _fire()
+    else:
+        (wheel or get_timer_wheel()).schedule(delay, _fire)
+    return future
+
+
+def gather(*futures: Future) -> Future:
+    """
+    合併多個 Future，全部完成時完成
+
+    Args:
+        futures: 要等待的 Future
+
+    Returns:
+        Future: 結果為各 Future 結果列表
+    """
+    combined = Future()
+    combined.set_running_or_notify_cancel()
+    if not futures:
+        combined.set_result([])
+        return combined
+
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def _done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            combined.set_exception(errors[0])
+        else:
+            combined.set_result([f.result() for f in futures])
+
+    for f in futures:
+        f.add_done_callback(_done)
+    return combined
+
+
+__all__ = ['TimerWheel', 'get_timer_wheel', 'completed_future', 'complete_after', 'gather']
@@ -3,79 +3,105 @@
 使用 ISD1820 模組播放警示音
 """
 
-import RPi.GPIO as GPIO
-import time
+import threading
+from concurrent.futures import Future
+from typing import Optional
+
+from actuation import complete_after, completed_future
+from pin_driver import PinDriver, get_pin_driver
 
 class AlarmModule:
     """警示音模組類別"""
     
-    def __init__(self, alarm_pin: int = 24):
+    def __init__(self, alarm_pin: int = 24, driver: Optional[PinDriver] = None):
         """
         初始化警示音模組
         
         Args:
             alarm_pin: ISD1820 PLAY 腳位連接的 GPIO 腳位
+            driver: 腳位驅動，None 則使用共用驅動
         """
-        # GPIO 設定
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
+        # 腳位驅動（GPIO 模式只在驅動建立時設定一次）
+        self.driver = driver if driver is not None else get_pin_driver()
         
         self.alarm_pin = alarm_pin
         
-        # 設定 GPIO 為輸出
-        GPIO.setup(self.alarm_pin, GPIO.OUT)
-        GPIO.output(self.alarm_pin, GPIO.LOW)
+        # 設定 GPIO 為輸出（初始為 LOW）
+        self.driver.setup_output(self.alarm_pin, False)
+        
+        # 播放序號：較新的播放會延長拉高時間，舊的到期事件不會提早拉低
+        self._generation = 0
+        self._lock = threading.Lock()
         
         print("警示音模組已初始化")
     
-    def play_alarm(self, duration: float = 3.0):
+    def play_alarm(self, duration: float = 3.0) -> Future:
         """
-        播放警示音
+        播放警示音（立即返回）
         
         Args:
             duration: 播放持續時間（秒）
+        
+        Returns:
+            Future: 播放完成（PLAY 腳位拉低）時完成
         """
         print(f"播放警示音 ({duration} 秒)...")
         
-        # ISD1820 觸發播放：將 PLAY 腳位拉高
-        GPIO.output(self.alarm_pin, GPIO.HIGH)
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
         
-        # 等待播放完成
-        time.sleep(duration)
+        # ISD1820 觸發播放：將 PLAY 腳位拉高
+        self.driver.write(self.alarm_pin, True)
         
-        # 停止播放：將 PLAY 腳位拉低
-        GPIO.output(self.alarm_pin, GPIO.LOW)
+        def _finish():
+            # 停止播放：將 PLAY 腳位拉低（期間若有新的播放則交由新的事件處理）
+            with self._lock:
+                if generation != self._generation:
+                    return
+            self.driver.write(self.alarm_pin, False)
+            print("警示音播放完成")
         
-        print("警示音播放完成")
+        return complete_after(duration, action=_finish)
     
-    def play_alarm_loop(self, times: int = 3, interval: float = 1.0):
+    def play_alarm_loop(self, times: int = 3, interval: float = 1.0) -> Future:
         """
-        循環播放警示音
+        循環播放警示音（立即返回）
         
         Args:
             times: 播放次數
             interval: 每次播放間隔（秒）
+        
+        Returns:
+            Future: 全部播放完成時完成
         """
-        for i in range(times):
-            self.play_alarm()
-            if i < times - 1:
-                time.sleep(interval)
+        if times <= 0:
+            return completed_future()
+        
+        done = Future()
+        done.set_running_or_notify_cancel()
+        
+        def _play(remaining: int):
+            current = self.play_alarm()
+            
+            def _next(_):
+                if remaining <= 1:
+                    done.set_result(None)
+                else:
+                    complete_after(interval).add_done_callback(lambda _: _play(remaining - 1))
+            
+            current.add_done_callback(_next)
+        
+        _play(times)
+        return done
     
     def cleanup(self):
         """清理 GPIO 資源（只清理本模組，不調用 GPIO.cleanup）"""
         try:
-            # 確保 GPIO mode 已設定
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)
-            GPIO.setup(self.alarm_pin, GPIO.OUT)
-            GPIO.output(self.alarm_pin, GPIO.LOW)
-        except RuntimeError:
-            # 如果 GPIO 已被清理，則重新設定
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)
-            GPIO.setup(self.alarm_pin, GPIO.OUT)
-            GPIO.output(self.alarm_pin, GPIO.LOW)
-        except Exception as e:
+            with self._lock:
+                self._generation += 1
+            self.driver.write(self.alarm_pin, False)
+        except Exception:
             # 其他錯誤則忽略
             pass
         print("警示音模組已清理")
@@ -0,0 +1,543 @@
+"""
+車載端管線延遲基準測試
+針對固定的錄製資料（影片 / NMEA 記錄）量測各階段延遲：
+- detect_obstacles / detect_people / calculate_avoidance_path
+- control_tick      : 擷取 → 偵測 → 決策 → 馬達指令
+- jpeg_encode       : cv2.imencode
+- generate_frames   : web_api MJPEG 產生器（擷取 + 人形偵測 + 編碼）
+- gps_parse         : NMEA 解析（GPSModule.read_gps_data）
+- gps_distance      : 解析 + 累積距離（GPSModule.update_distance）
+- bmduino_roundtrip : 指令送出到假 BMduino 處理完成
+- metrics_*         : metrics.span / observe 單次成本與啟用 / 停用量測的 control_tick，
+                      比例另寫入 JSON 的 metrics_overhead
+- stream            : （選用）經後端代理接收 MJPEG 影格的間隔
+
+結果輸出為 JSON（p50 / p95 / p99 / fps），可用 --compare 與先前結果比較。
+
+使用方式：
+    python benchmark.py --output results.json
+    python benchmark.py --video road.mp4 --nmea drive.nmea --compare baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from gps_module import GPSModule
+from vision_module import VisionModule
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """
+    線性內插百分位數
+
+    Args:
+        sorted_values: 已排序的數值
+        pct: 百分位（0-100）
+
+    Returns:
+        float: 百分位數值
+    """
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    low = int(k)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (k - low)
+
+
+def summarize(samples: List[float]) -> dict:
+    """
+    將延遲樣本（秒）整理為統計摘要（毫秒）
+
+    Args:
+        samples: 每次執行的秒數
+
+    Returns:
+        dict: count / mean / p50 / p95 / p99 / max（毫秒）與 fps
+    """
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        'count': len(ordered),
+        'mean_ms': total / len(ordered) * 1000 if ordered else 0.0,
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p95_ms': percentile(ordered, 95) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': ordered[-1] * 1000 if ordered else 0.0,
+        'fps': len(ordered) / total if total > 0 else 0.0,
+    }
+
+
+def measure(fn: Callable[[int], None], iterations: int, warmup: int = 3) -> List[float]:
+    """
+    重複執行並記錄每次耗時
+
+    Args:
+        fn: 以迭代序號為參數的函式
+        iterations: 量測次數
+        warmup: 暖機次數（不計入）
+
+    Returns:
+        List[float]: 每次耗時（秒）
+    """
+    for i in range(warmup):
+        fn(i)
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+# ===== 錄製資料 =====
+
+def load_frames(video: Optional[str], count: int) -> List[np.ndarray]:
+    """
+    載入影格（影片檔或影像資料夾），未指定時使用固定的合成影像
+
+    Args:
+        video: 影片路徑或影像資料夾
+        count: 最多載入的影格數
+
+    Returns:
+        List[np.ndarray]: 影格列表
+    """
+    frames = []
+    if video and os.path.isdir(video):
+        for name in sorted(os.listdir(video)):
+            frame = cv2.imread(os.path.join(video, name))
+            if frame is not None:
+                frames.append(frame)
+            if len(frames) >= count:
+                break
+    elif video:
+        cap = cv2.VideoCapture(video)
+        while len(frames) < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    else:
+        from simulation.camera import SyntheticCamera
+        camera = SyntheticCamera(fps=None)
+        for _ in range(count):
+            _, frame = camera.read()
+            frames.append(frame)
+
+    if not frames:
+        raise RuntimeError(f'無法載入影格: {video}')
+    return frames
+
+
+def load_nmea(path: Optional[str], count: int) -> List[str]:
+    """
+    載入 NMEA 語句，未指定時產生固定的合成軌跡
+
+    Args:
+        path: NMEA 記錄檔
+        count: 合成時的語句數
+
+    Returns:
+        List[str]: NMEA 語句
+    """
+    if path:
+        with open(path, errors='ignore') as f:
+            lines = [line.strip() for line in f if line.startswith('$')]
+        if not lines:
+            raise RuntimeError(f'NMEA 記錄檔沒有語句: {path}')
+        return lines
+
+    from simulation.nmea import SyntheticTrack, build_gga, build_rmc
+    track = SyntheticTrack(speed_mps=0.6, bearing=180.0)
+    base = 1700000000.0
+    lines = []
+    for i in range(count):
+        lat, lon = track.position_at(i)
+        lines.append(build_rmc(lat, lon, base + i, 0.6, 180.0, talker='GN'))
+        lines.append(build_gga(lat, lon, base + i, talker='GN'))
+    return lines
+
+
+class _ReplaySerial:
+    """以固定語句列表取代序列埠（循環播放）"""
+
+    def __init__(self, lines: List[str]):
+        self.lines = [(line + '\r\n').encode('ascii') for line in lines]
+        self.index = 0
+        self.is_open = True
+
+    def readline(self) -> bytes:
+        line = self.lines[self.index % len(self.lines)]
+        self.index += 1
+        return line
+
+    def close(self):
+        self.is_open = False
+
+
+class _FrameCapture:
+    """以影格列表取代攝影機（循環播放，介面同 cv2.VideoCapture）"""
+
+    def __init__(self, frames: List[np.ndarray]):
+        self.frames = frames
+        self.index = 0
+
+    def isOpened(self) -> bool:
+        return True
+
+    def read(self):
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return True, frame.copy()
+
+    def release(self):
+        pass
+
+
+# ===== 各階段 =====
+
+def bench_vision(frames: List[np.ndarray], iterations: int) -> Dict[str, dict]:
+    vision = VisionModule()
+    n = len(frames)
+    results = {}
+
+    results['detect_obstacles'] = summarize(
+        measure(lambda i: vision.detect_obstacles(frames[i % n]), iterations))
+    results['detect_people'] = summarize(
+        measure(lambda i: vision.detect_people(frames[i % n]), iterations))
+
+    obstacles = [vision.detect_obstacles(frame) for frame in frames]
+    results['calculate_avoidance_path'] = summarize(
+        measure(lambda i: vision.calculate_avoidance_path(frames[i % n], obstacles[i % n]),
+                iterations * 10))
+
+    results['jpeg_encode'] = summarize(
+        measure(lambda i: cv2.imencode('.jpg', frames[i % n], [cv2.IMWRITE_JPEG_QUALITY, 85]),
+                iterations))
+    return results
+
+
+def make_control_tick(frames: List[np.ndarray]) -> Callable[[int], None]:
+    """建立與 run_movement_loop 相同決策流程的單次 tick（不含 sleep）"""
+    from motor_controller import MotorController
+    from pin_driver import FakePinDriver
+
+    vision = VisionModule()
+    vision.cap = _FrameCapture(frames)
+    motor = MotorController(driver=FakePinDriver())
+
+    def tick(_):
+        frame = vision.get_frame()
+        obstacles = vision.detect_obstacles(frame)
+        direction = vision.calculate_avoidance_path(frame, obstacles) if obstacles else 'forward'
+        if direction != 'forward':
+            motor.avoid_obstacle(direction, 50)
+        else:
+            motor.move_backward(60)
+
+    return tick
+
+
+def bench_control_tick(frames: List[np.ndarray], iterations: int) -> Dict[str, dict]:
+    return {'control_tick': summarize(measure(make_control_tick(frames), iterations))}
+
+
+def bench_metrics(frames: List[np.ndarray], iterations: int, calls: int = 1000) -> Tuple[Dict[str, dict], dict]:
+    """
+    量測 metrics.span / observe 的單次成本，並與不量測時的控制迴圈 tick 比較
+
+    Args:
+        frames: 影格
+        iterations: 量測次數
+        calls: 每次量測連續呼叫的次數（單次呼叫短於 perf_counter 的解析度）
+
+    Returns:
+        Tuple[Dict[str, dict], dict]: (各階段統計, 量測成本摘要與比例)
+    """
+    from metrics import MetricsRegistry, metrics
+
+    registry = MetricsRegistry(enabled=True)
+
+    def spans(_):
+        for _ in range(calls):
+            with registry.span('bench'):
+                pass
+
+    def observes(_):
+        for _ in range(calls):
+            registry.observe('bench', 0.001)
+
+    results = {
+        'metrics_span': summarize([s / calls for s in measure(spans, iterations)]),
+        'metrics_observe': summarize([s / calls for s in measure(observes, iterations)]),
+    }
+
+    tick = make_control_tick(frames)
+
+    def instrumented_tick(i):
+        # run_movement_loop 另外記錄整個 tick 的耗時
+        start = metrics.now()
+        tick(i)
+        metrics.observe('control_tick', metrics.now() - start)
+
+    enabled = metrics.enabled
+    try:
+        metrics.enabled = False
+        results['control_tick_no_metrics'] = summarize(measure(instrumented_tick, iterations))
+        metrics.enabled = True
+        before = sum(hist.count for hist in metrics.histograms.values())
+        results['control_tick_metrics'] = summarize(measure(instrumented_tick, iterations, warmup=0))
+        spans_per_tick = (sum(hist.count for hist in metrics.histograms.values()) - before) / iterations
+    finally:
+        metrics.enabled = enabled
+
+    bare_ms = results['control_tick_no_metrics']['p50_ms']
+    span_ms = results['metrics_span']['p50_ms']
+    observe_ms = results['metrics_observe']['p50_ms']
+    overhead = {
+        'span_us': span_ms * 1000,
+        'observe_us': observe_ms * 1000,
+        'control_tick_ms': bare_ms,
+        'spans_per_tick': spans_per_tick,
+        # 單次量測相對於一個 tick 的比例，以及每個 tick 所有量測合計的比例
+        'span_ratio': span_ms / bare_ms if bare_ms else 0.0,
+        'observe_ratio': observe_ms / bare_ms if bare_ms else 0.0,
+        'tick_ratio': span_ms * spans_per_tick / bare_ms if bare_ms else 0.0,
+    }
+    return results, overhead
+
+
+def bench_generate_frames(frames: List[np.ndarray], iterations: int) -> Dict[str, dict]:
+    import web_api
+
+    vision = VisionModule()
+    vision.cap = _FrameCapture(frames)
+    web_api.set_vision_instance(vision)
+    results = {}
+    for overlay in (False, True):
+        stream = web_api.generate_frames(show_overlay=overlay)
+        samples = measure(lambda _: next(stream), iterations)
+        stream.close()
+        results[f'generate_frames_overlay_{str(overlay).lower()}'] = summarize(samples)
+    return results
+
+
+def bench_gps(lines: List[str], iterations: int) -> Dict[str, dict]:
+    gps = GPSModule()
+    gps.serial_connection = _ReplaySerial(lines)
+    results = {'gps_parse': summarize(measure(lambda _: gps.read_gps_data(), iterations))}
+
+    gps = GPSModule()
+    gps.serial_connection = _ReplaySerial(lines)
+    results['gps_distance'] = summarize(measure(lambda _: gps.update_distance(), iterations))
+    return results
+
+
+def bench_bmduino(iterations: int, timeout: float = 1.0) -> Dict[str, dict]:
+    """量測指令來回延遲；假 BMduino 超過 timeout 秒沒有處理指令時以 RuntimeError 中止"""
+    from bmduino_controller import BMduinoController
+    from simulation.fake_bmduino import FakeBMduino
+
+    device = FakeBMduino()
+    device.start()
+    controller = BMduinoController(device.port)
+    try:
+        def roundtrip(i):
+            expected = len(device.commands) + 1
+            controller.set_led_brightness(i % 256)
+            # 等待假 BMduino 收到並處理完指令
+            deadline = time.perf_counter() + timeout
+            while len(device.commands) < expected:
+                if time.perf_counter() > deadline:
+                    raise RuntimeError(f'假 BMduino 在 {timeout} 秒內沒有處理第 {i + 1} 個指令'
+                                       f'（已處理 {len(device.commands)}，預期 {expected}）')
+                time.sleep(0.0001)
+
+        return {'bmduino_roundtrip': summarize(measure(roundtrip, iterations))}
+    finally:
+        controller.close()
+        device.stop()
+
+
+def bench_stream(url: str, frames: int) -> Dict[str, dict]:
+    """量測經後端代理收到的 MJPEG 影格間隔與首格延遲"""
+    import requests
+
+    start = time.perf_counter()
+    response = requests.get(url, stream=True, timeout=10)
+    buffer = b''
+    arrivals = []
+    first_frame = None
+    for chunk in response.iter_content(chunk_size=4096):
+        buffer += chunk
+        while True:
+            end = buffer.find(b'\xff\xd9')
+            if end < 0:
+                break
+            buffer = buffer[end + 2:]
+            now = time.perf_counter()
+            if first_frame is None:
+                first_frame = now - start
+            arrivals.append(now)
+        if len(arrivals) > frames:
+            break
+    response.close()
+
+    intervals = [b - a for a, b in zip(arrivals, arrivals[1:])]
+    result = summarize(intervals)
+    result['first_frame_ms'] = (first_frame or 0.0) * 1000
+    return {'stream': result}
+
+
+# ===== 結果輸出與比較 =====
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(current: dict, baseline: dict, threshold: float, min_delta_ms: float = 0.05) -> List[str]:
+    """
+    比較兩次結果，回傳 p50 或 p95 變慢超過門檻的階段
+
+    Args:
+        current: 本次結果
+        baseline: 基準結果
+        threshold: 允許的變慢比例（0.1 為 10%）
+        min_delta_ms: 絕對差距低於此值（毫秒）時視為量測雜訊
+
+    Returns:
+        List[str]: 退步的階段描述
+    """
+    regressions = []
+    print(f"\n與基準比較（{baseline.get('commit') or '未知版本'}）:")
+    for stage, stats in current['stages'].items():
+        base = baseline.get('stages', {}).get(stage)
+        if not base:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            if base[key] <= 0:
+                continue
+            change = (stats[key] - base[key]) / base[key]
+            marker = ''
+            if change > threshold and stats[key] - base[key] > min_delta_ms:
+                marker = '  <-- 退步'
+                regressions.append(f'{stage} {key} +{change * 100:.1f}%')
+            print(f"  {stage:<34} {key:<7} {base[key]:9.3f} → {stats[key]:9.3f} ms "
+                  f"({change * 100:+.1f}%){marker}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='車載端管線延遲基準測試')
+    parser.add_argument('--video', default=None, help='錄製影片或影像資料夾，預設使用合成影像')
+    parser.add_argument('--nmea', default=None, help='錄製的 NMEA 記錄檔，預設使用合成軌跡')
+    parser.add_argument('--frames', type=int, default=60, help='載入的影格數')
+    parser.add_argument('--iterations', type=int, default=100, help='每個階段的量測次數')
+    parser.add_argument('--stages', default='vision,control,frames,gps,bmduino,metrics',
+                        help='要執行的階段（逗號分隔）：vision,control,frames,gps,bmduino,metrics')
+    parser.add_argument('--bmduino-timeout', type=float, default=1.0,
+                        help='等待假 BMduino 處理單一指令的秒數上限，逾時則中止')
+    parser.add_argument('--stream-url', default=None,
+                        help='量測後端代理串流，例如 http://localhost:5000/api/video/vehicle_001')
+    parser.add_argument('--output', default='benchmark_results.json', help='結果 JSON 路徑')
+    parser.add_argument('--compare', default=None, help='基準結果 JSON，退步超過門檻時回傳非 0')
+    parser.add_argument('--threshold', type=float, default=0.10, help='退步門檻（比例）')
+    parser.add_argument('--min-delta-ms', type=float, default=0.05, help='低於此絕對差距（毫秒）不視為退步')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """主函式"""
+    args = parse_args(argv)
+    stages = {s.strip() for s in args.stages.split(',') if s.strip()}
+
+    frames = load_frames(args.video, args.frames)
+    lines = load_nmea(args.nmea, max(args.iterations, 100))
+
+    results: Dict[str, dict] = {}
+    metrics_overhead = None
+    try:
+        if 'vision' in stages:
+            results.update(bench_vision(frames, args.iterations))
+        if 'control' in stages:
+            results.update(bench_control_tick(frames, args.iterations))
+        if 'metrics' in stages:
+            stage_results, metrics_overhead = bench_metrics(frames, args.iterations)
+            results.update(stage_results)
+        if 'frames' in stages:
+            results.update(bench_generate_frames(frames, args.iterations))
+        if 'gps' in stages:
+            results.update(bench_gps(lines, args.iterations * 10))
+        if 'bmduino' in stages:
+            results.update(bench_bmduino(args.iterations, args.bmduino_timeout))
+        if args.stream_url:
+            results.update(bench_stream(args.stream_url, args.iterations))
+    except RuntimeError as e:
+        print(f"\n基準測試失敗: {e}")
+        return 2
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.time(),
+        'platform': {
+            'machine': platform.machine(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'system': platform.platform(),
+        },
+        'fixtures': {
+            'video': args.video or 'synthetic',
+            'nmea': args.nmea or 'synthetic',
+            'frames': len(frames),
+            'frame_shape': list(frames[0].shape),
+        },
+        'iterations': args.iterations,
+        'stages': results,
+    }
+    if metrics_overhead is not None:
+        report['metrics_overhead'] = metrics_overhead
+
+    print(f"\n{'階段':<36}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'fps':>10}")
+    for stage, stats in results.items():
+        print(f"{stage:<36}{stats['p50_ms']:10.3f}{stats['p95_ms']:10.3f}"
+              f"{stats['p99_ms']:10.3f}{stats['fps']:10.1f}")
+    if metrics_overhead is not None:
+        print(f"\n量測成本: span {metrics_overhead['span_us']:.2f} us、observe {metrics_overhead['observe_us']:.2f} us，"
+              f"每個 tick {metrics_overhead['spans_per_tick']:.1f} 次量測，"
+              f"約佔控制迴圈 tick（{metrics_overhead['control_tick_ms']:.3f} ms）的 "
+              f"{metrics_overhead['tick_ratio'] * 100:.3f}%")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n結果已寫入 {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print("\n效能退步: " + ', '.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,11 +3,16 @@ BMduino 控制模組
 透過序列埠與 BMduino-UNO 通訊，控制馬達、伺服、警報與 LED。
 """
 
+import threading
 import time
+from concurrent.futures import Future
 from typing import Optional
 
 import serial
 
+from actuation import complete_after
+from metrics import metrics
+
 
 class BMduinoController:
     """BMduino 控制類別
@@ -20,13 +25,23 @@ class BMduinoController:
     - `S D`     : 伺服放下警示牌 (Sign Down)
     - `A P 3`   : 播放警報 3 秒
     - `L S 128` : 設定 LED 亮度 0–255
+
+    韌體逐一處理指令，升降警示牌與播放警報期間不處理後續指令；
+    `raise_sign` / `lower_sign` / `play_alarm` 送出後立即返回 Future，
+    在韌體預估完成時間到達時完成。
     """
 
+    # 韌體 raiseSign()/lowerSign() 的 delay(500)
+    SIGN_MOTION_SECONDS = 0.5
+
     def __init__(self, port: str, baudrate: int = 9600, timeout: float = 1.0) -> None:
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
         self.ser: Optional[serial.Serial] = None
+        # 韌體忙碌至此時間點（time.monotonic）
+        self._busy_until = 0.0
+        self._busy_lock = threading.Lock()
 
         self.connect()
 
@@ -60,8 +75,9 @@ class BMduinoController:
 
         try:
             line = (cmd.strip() + "\n").encode("utf-8")
-            self.ser.write(line)
-            self.ser.flush()
+            with metrics.span('serial_write'):
+                self.ser.write(line)
+                self.ser.flush()
 
             if expect_response:
                 resp = self.ser.readline().decode("utf-8", errors="ignore").strip()
@@ -70,6 +86,21 @@ class BMduinoController:
             print(f"BMduino 指令失敗 ({cmd}): {e}")
         return None
 
+    def _complete_when_idle(self, busy_seconds: float) -> Future:
+        """依韌體的指令佇列估算完成時間，並在到期時完成 Future。
+
+        Args:
+            busy_seconds: 此指令讓韌體忙碌的秒數
+        Returns:
+            到期時完成的 Future
+        """
+        with self._busy_lock:
+            now = time.monotonic()
+            start = max(now, self._busy_until)
+            self._busy_until = start + busy_seconds
+            delay = self._busy_until - now
+        return complete_after(delay)
+
     # ===== 高階控制方法 =====
     def set_motor(self, direction: str, speed: int) -> None:
         """設定馬達動作。
@@ -87,22 +118,26 @@ class BMduinoController:
         """停止馬達。"""
         self.set_motor("S", 0)
 
-    def raise_sign(self) -> None:
-        """升起警示牌。"""
+    def raise_sign(self) -> Future:
+        """升起警示牌（立即返回，Future 於伺服動作完成時完成）。"""
         self._send_command("S U")
+        return self._complete_when_idle(self.SIGN_MOTION_SECONDS)
 
-    def lower_sign(self) -> None:
-        """放下警示牌。"""
+    def lower_sign(self) -> Future:
+        """放下警示牌（立即返回，Future 於伺服動作完成時完成）。"""
         self._send_command("S D")
+        return self._complete_when_idle(self.SIGN_MOTION_SECONDS)
 
-    def play_alarm(self, duration: float = 3.0) -> None:
-        """播放警報。
+    def play_alarm(self, duration: float = 3.0) -> Future:
+        """播放警報（立即返回，Future 於播放結束時完成）。
 
         Args:
             duration: 播放秒數（BMduino 端可決定是否精準使用此參數）
         """
-        secs = max(1, int(round(duration)))
+        # 韌體限制 1–10 秒
+        secs = max(1, min(10, int(round(duration))))
         self._send_command(f"A P {secs}")
+        return self._complete_when_idle(secs)
 
     def set_led_brightness(self, value: int) -> None:
         """設定 LED 亮度 (0–255)。"""
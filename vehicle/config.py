@@ -30,12 +30,30 @@ class VehicleConfig:
     SERVO_RAISE_ANGLE = int(os.getenv('SERVO_RAISE_ANGLE', '90'))
     SERVO_LOWER_ANGLE = int(os.getenv('SERVO_LOWER_ANGLE', '0'))
     
+    # 腳位驅動後端：auto / pigpio / sysfs / rpigpio / fake
+    PIN_DRIVER = os.getenv('PIN_DRIVER', 'auto')
+    PIGPIO_HOST = os.getenv('PIGPIO_HOST', '')
+    SYSFS_PWM_CHIP = os.getenv('SYSFS_PWM_CHIP', '/sys/class/pwm/pwmchip0')
+    
     # 警示音 GPIO 腳位
     ALARM_PIN = int(os.getenv('ALARM_PIN', '24'))
     
     # 後端 API 配置
     BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:5000')
     API_TOKEN = os.getenv('API_TOKEN', 'your_api_token_here')
+    DEVICE_ID = os.getenv('DEVICE_ID', 'vehicle_001')
+    ACCIDENT_KEYFRAMES = int(os.getenv('ACCIDENT_KEYFRAMES', '3'))  # 事故上報的現場關鍵幀數
+    
+    # 上行傳輸佇列（離線時事故與位置保存在磁碟，恢復連線後送出）
+    UPLINK_DB_PATH = os.getenv('UPLINK_DB_PATH', 'uplink.db')
+    UPLINK_BATCH_SIZE = int(os.getenv('UPLINK_BATCH_SIZE', '50'))  # 每次送出的位置筆數
+    UPLINK_BATCH_INTERVAL = float(os.getenv('UPLINK_BATCH_INTERVAL', '2'))  # 位置最多延遲秒數
+    UPLINK_POSITION_BACKLOG = int(os.getenv('UPLINK_POSITION_BACKLOG', '5000'))  # 離線時保留的位置筆數
+    UPLINK_BACKOFF_MIN = float(os.getenv('UPLINK_BACKOFF_MIN', '1'))  # 第一次重試等待秒數
+    UPLINK_BACKOFF_MAX = float(os.getenv('UPLINK_BACKOFF_MAX', '60'))  # 重試等待上限（秒）
+    UPLINK_HEARTBEAT_INTERVAL = float(os.getenv('UPLINK_HEARTBEAT_INTERVAL', '30'))  # 心跳間隔（秒）
+    # 後端連線到本車 Web API 的位址（例如 http://10.0.0.5:8080），空白則由後端以來源 IP 與 WEB_API_PORT 組成
+    VEHICLE_STREAM_URL = os.getenv('VEHICLE_STREAM_URL', '')
     
     # 視覺辨識配置
     CAMERA_INDEX = int(os.getenv('CAMERA_INDEX', '0'))
@@ -56,6 +74,12 @@ class VehicleConfig:
     # Web API 配置（影像串流）
     WEB_API_HOST = os.getenv('WEB_API_HOST', '0.0.0.0')
     WEB_API_PORT = int(os.getenv('WEB_API_PORT', '8080'))
+    WEB_API_MAX_CLIENTS = int(os.getenv('WEB_API_MAX_CLIENTS', '8'))  # 同時連線上限，超過回 503
+    # /snapshot.jpg 直接使用串流最新幀的最長時間（秒），超過則重新擷取
+    SNAPSHOT_MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', '1.0'))
+    
+    # 各階段計時量測（/metrics 端點）
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
 
     # BMduino UART 序列連線配置（硬體序列埠）
     BMDUINO_PORT = os.getenv('BMDUINO_PORT', '/dev/serial0')
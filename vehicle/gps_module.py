@@ -11,6 +11,8 @@ import math
 from typing import Optional, Tuple
 from geopy.distance import geodesic
 
+from metrics import metrics
+
 class GPSModule:
     """GPS 定位模組類別"""
     
@@ -69,14 +71,16 @@ class GPSModule:
         
         try:
             # 讀取 NMEA 資料
-            line = self.serial_connection.readline().decode('utf-8', errors='ignore').strip()
+            with metrics.span('gps_read'):
+                line = self.serial_connection.readline().decode('utf-8', errors='ignore').strip()
             
             if not line:
                 return None
             
             # 同時支援 GP/GN 前綴與 RMC/GGA 訊息
             if line.startswith(('$GPRMC', '$GNRMC', '$GPGGA', '$GNGGA')):
-                msg = pynmea2.parse(line)
+                with metrics.span('gps_parse'):
+                    msg = pynmea2.parse(line)
 
                 # 如果是 RMC 訊息，檢查狀態（A=有效，V=無效）
                 if hasattr(msg, 'status') and msg.status != 'A':
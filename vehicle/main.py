@@ -6,19 +6,19 @@
 import time
 import sys
 import signal
-import requests
-import base64
 import cv2
 import threading
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
 from config import VehicleConfig
 from gps_module import GPSModule
 from vision_module import VisionModule
 from motor_controller import MotorController
 from alarm import AlarmModule
-from web_api import run_web_api
+from web_api import run_web_api, stop_web_api
 from bmduino_controller import BMduinoController
+from metrics import metrics
+from uplink import create_uplink
 
 class SafetyVehicle:
     """自動安全警示車主類別"""
@@ -65,6 +65,9 @@ class SafetyVehicle:
         
         self.alarm = AlarmModule(self.config.ALARM_PIN)
         
+        # 上行傳輸佇列：上報與位置回報寫入磁碟後立即返回，由背景執行緒送出
+        self.uplink = create_uplink(self.config)
+        
         # 狀態變數
         self.target_distance = 0
         self.current_speed_limit = None
@@ -172,6 +175,9 @@ class SafetyVehicle:
         except Exception as e:
             print(f"警告: Web API 伺服器啟動失敗: {e}")
         
+        # 啟動上行傳輸（先送出上次未完成的項目）
+        self.uplink.start()
+        
         print("\n系統初始化完成！")
         self.running = True
         return True
@@ -207,15 +213,33 @@ class SafetyVehicle:
             self.gps.last_position = (25.0330, 121.5654)
             return True
     
-    def report_accident(self, has_injured: bool = False) -> bool:
+    @staticmethod
+    def encode_keyframe(frame) -> Optional[bytes]:
+        """
+        將影像編碼為 JPEG 關鍵幀
+        
+        Args:
+            frame: 影像
+        
+        Returns:
+            Optional[bytes]: JPEG 位元組，編碼失敗則為 None
+        """
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        return buffer.tobytes() if ok else None
+    
+    def report_accident(self, has_injured: bool = False, keyframes: Optional[List[bytes]] = None) -> bool:
         """
         上報事故資料到後端（只上報一次）
         
+        資料寫入上行佇列後立即返回，不等待網路；離線時保留在磁碟中持續重試。
+        關鍵幀以原始 JPEG 上傳（multipart），不做 base64。
+        
         Args:
             has_injured: 是否有民眾受傷（偵測到人形為 True）
+            keyframes: 現場 JPEG 關鍵幀，None 則擷取目前影像一張
         
         Returns:
-            bool: 是否成功上報
+            bool: 是否已排入上行佇列
         """
         print("\n上報事故資料到後端...")
         
@@ -225,43 +249,40 @@ class SafetyVehicle:
             position = (self.gps.start_latitude, self.gps.start_longitude)
         
         # 取得影像
-        frame = self.vision.get_frame()
-        image_data = None
-        if frame is not None:
-            # 將影像編碼為 base64
-            _, buffer = cv2.imencode('.jpg', frame)
-            image_data = base64.b64encode(buffer).decode('utf-8')
+        if keyframes is None:
+            frame = self.vision.get_frame()
+            keyframe = self.encode_keyframe(frame) if frame is not None else None
+            keyframes = [keyframe] if keyframe else []
         
         # 準備資料
         accident_data = {
             'latitude': position[0],
             'longitude': position[1],
             'timestamp': time.time(),
-            'image': image_data,
-            'device_id': 'vehicle_001',
+            'device_id': self.config.DEVICE_ID,
             # 是否有民眾受傷（偵測到人形為 True）
             'has_injured': bool(has_injured)
         }
         
         try:
-            # 發送 POST 請求
-            response = requests.post(
-                f"{self.config.BACKEND_URL}/api/report_accident",
-                json=accident_data,
-                headers={'Authorization': f'Bearer {self.config.API_TOKEN}'},
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                print("事故資料上報成功")
-                return True
-            else:
-                print(f"事故資料上報失敗: {response.status_code}")
-                return False
+            report_id = self.uplink.report_accident(accident_data, keyframes)
+            print(f"事故資料已排入上行佇列: {report_id}（關鍵幀 {len(keyframes)} 張）")
+            return True
         except Exception as e:
-            print(f"事故資料上報錯誤: {e}")
+            print(f"事故資料寫入上行佇列失敗: {e}")
             return False
     
+    def report_position(self):
+        """回報目前位置（排入上行佇列，批次送出）"""
+        latitude = self.gps.current_latitude
+        longitude = self.gps.current_longitude
+        if latitude is None or longitude is None:
+            return
+        try:
+            self.uplink.update_position(self.config.DEVICE_ID, latitude, longitude)
+        except Exception as e:
+            print(f"位置寫入上行佇列失敗: {e}")
+    
     def avoid_obstacle(self, direction: str):
         """
         執行避障動作
@@ -290,8 +311,11 @@ class SafetyVehicle:
         last_distance = 0.0
         
         while self.running:
+            tick_start = metrics.now()
+            
             # 更新 GPS 距離
             current_distance = self.gps.update_distance()
+            self.report_position()
             
             # 顯示進度
             if abs(current_distance - last_distance) > 1.0:  # 每 1 公尺更新一次
@@ -326,15 +350,18 @@ class SafetyVehicle:
                 # 無法取得影像，繼續移動
                 self.motor.move_backward(self.config.MOTOR_SPEED_NORMAL)
             
+            metrics.observe('control_tick', metrics.now() - tick_start)
+            
             # 短暫延遲
             time.sleep(0.1)
     
-    def execute_safety_protocol(self, speed_limit: Optional[int] = None):
+    def execute_safety_protocol(self, speed_limit: Optional[int] = None, hold: bool = True):
         """
         執行完整安全警示流程
         
         Args:
             speed_limit: 道路速限（km/h）
+            hold: 完成警示後是否持續運行提供影像串流（模擬器使用 False 直接結束）
         """
         try:
             # 1. 初始化系統
@@ -356,11 +383,21 @@ class SafetyVehicle:
             detection_duration = 3.0
             detection_count = 0
             total_detections = 0
+            # 偵測期間平均擷取數張現場關鍵幀，隨事故一起上報
+            keyframes = []
+            keyframe_interval = detection_duration / max(self.config.ACCIDENT_KEYFRAMES, 1)
+            next_keyframe = 0.0
             
             while time.time() - detection_start < detection_duration:
                 result = self.vision.get_frame_with_detections()
                 if result is not None:
-                    _, people = result
+                    frame, people = result
+                    elapsed = time.time() - detection_start
+                    if len(keyframes) < self.config.ACCIDENT_KEYFRAMES and elapsed >= next_keyframe:
+                        keyframe = self.encode_keyframe(frame)
+                        if keyframe:
+                            keyframes.append(keyframe)
+                        next_keyframe = elapsed + keyframe_interval
                     if len(people) > 0:
                         total_detections += len(people)
                         detection_count += 1
@@ -375,6 +412,7 @@ class SafetyVehicle:
                 if self.bm is not None:
                     print("觸發 BMduino 警示...")
                     try:
+                        # 立即返回，警示動作與後續上報、移動並行
                         self.bm.raise_sign()
                         self.bm.play_alarm(3.0)
                         self.bm.set_led_brightness(255)
@@ -385,7 +423,7 @@ class SafetyVehicle:
             
             # 4. 上報一次事故（包含是否有民眾受傷的資訊）
             print("\n上報事故資料（只上報一次）...")
-            self.report_accident(has_injured=has_injured)
+            self.report_accident(has_injured=has_injured, keyframes=keyframes or None)
             
             # 5. 根據道路類型判斷目標距離並往後移動
             print("\n判斷道路類型並計算目標距離...")
@@ -408,8 +446,11 @@ class SafetyVehicle:
             last_print_time = time.time()
             
             while self.running:
+                tick_start = metrics.now()
+                
                 # 更新 GPS 距離
                 current_distance = self.gps.get_distance_from_start()
+                self.report_position()
                 
                 # 每 1 秒或每 1 公尺更新一次顯示
                 now = time.time()
@@ -426,18 +467,21 @@ class SafetyVehicle:
                         self.bm.stop_motor()
                     break
                 
+                metrics.observe('control_tick', metrics.now() - tick_start)
                 time.sleep(0.5)  # 每 0.5 秒檢查一次距離
             
             # 7. 到達距離後：升起警示牌、播放警報
             print("\n到達目標距離，觸發警示...")
             if self.bm is not None:
                 try:
+                    # 致動指令立即返回 Future，不阻塞流程
                     print("升起警示牌...")
-                    self.bm.raise_sign()
-                    time.sleep(1)  # 等待伺服動作完成
+                    sign_done = self.bm.raise_sign()
+                    sign_done.add_done_callback(lambda _: print("警示牌已升起"))
                     
                     print("播放警示音...")
-                    self.bm.play_alarm(3.0)  # 播放 3 秒
+                    alarm_done = self.bm.play_alarm(3.0)  # 播放 3 秒
+                    alarm_done.add_done_callback(lambda _: print("警示音播放完成"))
                     
                     print("設定 LED 亮度...")
                     self.bm.set_led_brightness(255)  # 最大亮度
@@ -447,11 +491,12 @@ class SafetyVehicle:
                 print("警告: BMduino 未連接，無法觸發警示")
             
             # 8. 保持運行狀態，持續提供即時影像串流
-            print("\n系統運行中，持續提供即時影像串流...")
-            print("按 Ctrl+C 停止...")
-            
-            while self.running:
-                time.sleep(1)
+            if hold:
+                print("\n系統運行中，持續提供即時影像串流...")
+                print("按 Ctrl+C 停止...")
+                
+                while self.running:
+                    time.sleep(1)
                 
         except KeyboardInterrupt:
             print("\n使用者中斷")
@@ -475,6 +520,18 @@ class SafetyVehicle:
         except Exception as e:
             print(f"BMduino 清理失敗: {e}")
         
+        # 盡量送出上行佇列，未送出的項目保留在磁碟中，下次啟動時送出
+        try:
+            self.uplink.stop(timeout=3.0)
+        except Exception as e:
+            print(f"上行傳輸停止失敗: {e}")
+        
+        # 先停止影像串流，避免串流執行緒讀取已釋放的攝影機
+        try:
+            stop_web_api()
+        except Exception as e:
+            print(f"Web API 伺服器停止失敗: {e}")
+        
         # 清理各模組（不調用 GPIO.cleanup，統一在最後清理）
         self.vision.release_camera()
         self.gps.disconnect()
@@ -0,0 +1,275 @@
+"""
+熱路徑計時量測模組
+以單調時鐘（time.perf_counter）量測各階段耗時並累積到固定桶的直方圖，
+提供 Prometheus 文字格式與 JSON 快照，由 web_api 的 /metrics 端點輸出。
+
+每次量測只有兩次 perf_counter 呼叫、一次二分搜尋與一次加鎖累加（約 1-2 微秒），
+相對於毫秒級的影像處理與序列通訊可忽略；實際比例可用 benchmark.py --stages metrics 量測。
+"""
+
+import bisect
+import threading
+import time
+from functools import wraps
+from typing import Dict, List, Optional, Sequence
+
+from config import VehicleConfig
+
+# 預設桶上限（秒），涵蓋序列寫入（< 1 ms）到人形偵測（數百 ms）
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Histogram:
+    """固定桶直方圖"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets: 遞增的桶上限（秒），最後自動加上 +Inf
+        """
+        self.bounds = list(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        """
+        記錄一筆量測值
+
+        Args:
+            value: 秒數
+        """
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float, counts: Optional[List[int]] = None) -> float:
+        """
+        由桶計數以線性內插估算分位數
+
+        Args:
+            q: 分位（0-1）
+            counts: 桶計數（預設為目前計數）
+
+        Returns:
+            float: 估計值（秒）
+        """
+        counts = counts if counts is not None else list(self.counts)
+        total = sum(counts)
+        if total == 0:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        for i, c in enumerate(counts):
+            if cumulative + c >= rank and c > 0:
+                low = self.bounds[i - 1] if i > 0 else 0.0
+                high = self.bounds[i] if i < len(self.bounds) else max(self.max, low)
+                return low + (high - low) * (rank - cumulative) / c
+            cumulative += c
+        return self.max
+
+    def snapshot(self) -> dict:
+        """
+        取得一致的快照
+
+        Returns:
+            dict: count / sum / max / 分位數 / 桶計數
+        """
+        with self.lock:
+            counts = list(self.counts)
+            total = self.total
+            count = self.count
+            maximum = self.max
+        return {
+            'count': count,
+            'sum_seconds': total,
+            'mean_ms': total / count * 1000 if count else 0.0,
+            'max_ms': maximum * 1000,
+            'p50_ms': self.quantile(0.50, counts) * 1000,
+            'p95_ms': self.quantile(0.95, counts) * 1000,
+            'p99_ms': self.quantile(0.99, counts) * 1000,
+            'buckets': dict(zip([str(b) for b in self.bounds] + ['+Inf'], counts)),
+        }
+
+
+class _Span:
+    """計時區段（context manager）"""
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    """停用量測時使用的空區段"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class MetricsRegistry:
+    """各階段直方圖的集合"""
+
+    def __init__(self, enabled: bool = True, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Args:
+            enabled: 是否啟用量測
+            buckets: 新建直方圖使用的桶上限
+        """
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.histograms: Dict[str, Histogram] = {}
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+
+    def histogram(self, stage: str) -> Histogram:
+        """
+        取得（必要時建立）階段直方圖
+
+        Args:
+            stage: 階段名稱
+        """
+        hist = self.histograms.get(stage)
+        if hist is None:
+            with self.lock:
+                hist = self.histograms.setdefault(stage, Histogram(self.buckets))
+        return hist
+
+    @staticmethod
+    def now() -> float:
+        """
+        量測用單調時鐘（不受模擬器替換的 time 模組影響）
+
+        Usage:
+            start = metrics.now()
+            ...
+            metrics.observe('control_tick', metrics.now() - start)
+        """
+        return time.perf_counter()
+
+    def span(self, stage: str):
+        """
+        計時區段
+
+        Usage:
+            with metrics.span('jpeg_encode'):
+                ...
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self.histogram(stage))
+
+    def observe(self, stage: str, seconds: float):
+        """
+        直接記錄一筆耗時
+
+        Args:
+            stage: 階段名稱
+            seconds: 秒數
+        """
+        if self.enabled:
+            self.histogram(stage).observe(seconds)
+
+    def timed(self, stage: str):
+        """
+        函式計時裝飾器
+
+        Usage:
+            @metrics.timed('gps_parse')
+            def parse(...):
+                ...
+        """
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return f(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    self.histogram(stage).observe(time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> dict:
+        """
+        JSON 快照
+
+        Returns:
+            dict: {'uptime_seconds': ..., 'stages': {stage: {...}}}
+        """
+        return {
+            'enabled': self.enabled,
+            'uptime_seconds': time.time() - self.started_at,
+            'stages': {name: hist.snapshot() for name, hist in sorted(self.histograms.items())},
+        }
+
+    def render_prometheus(self, metric: str = 'vehicle_stage_duration_seconds') -> str:
+        """
+        輸出 Prometheus 文字格式（text/plain; version=0.0.4）
+
+        Args:
+            metric: 指標名稱
+
+        Returns:
+            str: 指標文字
+        """
+        lines = [
+            f'# HELP {metric} Duration of vehicle pipeline stages.',
+            f'# TYPE {metric} histogram',
+        ]
+        for name, hist in sorted(self.histograms.items()):
+            with hist.lock:
+                counts = list(hist.counts)
+                total = hist.total
+                count = hist.count
+            cumulative = 0
+            for bound, c in zip(hist.bounds, counts):
+                cumulative += c
+                lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{stage="{name}",le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{stage="{name}"}} {total}')
+            lines.append(f'{metric}_count{{stage="{name}"}} {count}')
+        lines.append('# HELP vehicle_uptime_seconds Seconds since metrics registry start.')
+        lines.append('# TYPE vehicle_uptime_seconds gauge')
+        lines.append(f'vehicle_uptime_seconds {time.time() - self.started_at}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """清除所有直方圖"""
+        with self.lock:
+            self.histograms = {}
+            self.started_at = time.time()
+
+
+# 全域量測實例
+metrics = MetricsRegistry(enabled=VehicleConfig.METRICS_ENABLED)
+
+
+__all__ = ['Histogram', 'MetricsRegistry', 'metrics', 'DEFAULT_BUCKETS']
@@ -4,9 +4,17 @@
 實作 PWM 速度控制與方向控制
 """
 
-import RPi.GPIO as GPIO
 import time
-from typing import Literal
+from typing import Literal, Optional
+
+from pin_driver import PinDriver, get_pin_driver
+
+# 方向 → (IN1, IN2) 電位
+_DIRECTION_LEVELS = {
+    'forward': (True, False),
+    'backward': (False, True),
+    'stop': (False, False),
+}
 
 class MotorController:
     """履帶馬達控制類別"""
@@ -17,7 +25,8 @@ class MotorController:
                  left_in2_pin: int = 27,
                  right_pwm_pin: int = 19,
                  right_in3_pin: int = 22,
-                 right_in4_pin: int = 23):
+                 right_in4_pin: int = 23,
+                 driver: Optional[PinDriver] = None):
         """
         初始化馬達控制器
         
@@ -28,10 +37,10 @@ class MotorController:
             right_pwm_pin: 右馬達 PWM 腳位
             right_in3_pin: 右馬達 IN3 腳位
             right_in4_pin: 右馬達 IN4 腳位
+            driver: 腳位驅動，None 則使用共用驅動（pigpio / sysfs / RPi.GPIO）
         """
-        # GPIO 設定
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
+        # 腳位驅動（GPIO 模式只在驅動建立時設定一次）
+        self.driver = driver if driver is not None else get_pin_driver()
         
         # 左馬達腳位
         self.left_pwm_pin = left_pwm_pin
@@ -44,23 +53,52 @@ class MotorController:
         self.right_in4_pin = right_in4_pin
         
         # 設定 GPIO 為輸出
-        GPIO.setup(self.left_in1_pin, GPIO.OUT)
-        GPIO.setup(self.left_in2_pin, GPIO.OUT)
-        GPIO.setup(self.left_pwm_pin, GPIO.OUT)
-        GPIO.setup(self.right_in3_pin, GPIO.OUT)
-        GPIO.setup(self.right_in4_pin, GPIO.OUT)
-        GPIO.setup(self.right_pwm_pin, GPIO.OUT)
+        self.driver.setup_output(self.left_in1_pin)
+        self.driver.setup_output(self.left_in2_pin)
+        self.driver.setup_output(self.right_in3_pin)
+        self.driver.setup_output(self.right_in4_pin)
         
-        # 建立 PWM 物件（頻率 1000 Hz）
-        self.left_pwm = GPIO.PWM(self.left_pwm_pin, 1000)
-        self.right_pwm = GPIO.PWM(self.right_pwm_pin, 1000)
+        # 建立 PWM（頻率 1000 Hz，初始速度為 0）
+        self.driver.setup_pwm(self.left_pwm_pin, 1000, 0)
+        self.driver.setup_pwm(self.right_pwm_pin, 1000, 0)
         
-        # 啟動 PWM（初始速度為 0）
-        self.left_pwm.start(0)
-        self.right_pwm.start(0)
+        # 目前方向與速度快取，方向不變時只需寫入 duty
+        self._left_state = ('stop', 0)
+        self._right_state = ('stop', 0)
         
         print("馬達控制器已初始化")
     
+    def _apply(self, state: tuple, in_a: int, in_b: int, pwm_pin: int,
+               direction: str, speed: int) -> tuple:
+        """
+        將方向與速度寫入單側馬達，只寫入有變化的腳位
+        
+        Args:
+            state: 目前 (方向, 速度)
+            in_a: 方向腳位 A
+            in_b: 方向腳位 B
+            pwm_pin: PWM 腳位
+            direction: 方向 ('forward', 'backward', 'stop')
+            speed: 速度 (0-100)
+        
+        Returns:
+            tuple: 新的 (方向, 速度)
+        """
+        if direction not in _DIRECTION_LEVELS:
+            direction = 'stop'
+        if direction == 'stop':
+            speed = 0
+        else:
+            speed = max(0, min(100, speed))  # 限制速度範圍
+        
+        if direction != state[0]:
+            level_a, level_b = _DIRECTION_LEVELS[direction]
+            self.driver.write(in_a, level_a)
+            self.driver.write(in_b, level_b)
+        if speed != state[1]:
+            self.driver.set_duty(pwm_pin, speed)
+        return (direction, speed)
+    
     def set_left_motor(self, direction: Literal['forward', 'backward', 'stop'], speed: int = 60):
         """
         控制左馬達
@@ -69,48 +107,10 @@ class MotorController:
             direction: 方向 ('forward', 'backward', 'stop')
             speed: 速度 (0-100)
         """
-        try:
-            # 確保 GPIO mode 已設定
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)
-        except RuntimeError:
-            # 如果已經設定過，則忽略
-            pass
-        
-        speed = max(0, min(100, speed))  # 限制速度範圍
-        
-        try:
-            if direction == 'forward':
-                GPIO.output(self.left_in1_pin, GPIO.HIGH)
-                GPIO.output(self.left_in2_pin, GPIO.LOW)
-                self.left_pwm.ChangeDutyCycle(speed)
-            elif direction == 'backward':
-                GPIO.output(self.left_in1_pin, GPIO.LOW)
-                GPIO.output(self.left_in2_pin, GPIO.HIGH)
-                self.left_pwm.ChangeDutyCycle(speed)
-            else:  # stop
-                GPIO.output(self.left_in1_pin, GPIO.LOW)
-                GPIO.output(self.left_in2_pin, GPIO.LOW)
-                self.left_pwm.ChangeDutyCycle(0)
-        except RuntimeError:
-            # 如果 GPIO 已被清理，重新設定
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)
-            GPIO.setup(self.left_in1_pin, GPIO.OUT)
-            GPIO.setup(self.left_in2_pin, GPIO.OUT)
-            # 重新執行操作
-            if direction == 'forward':
-                GPIO.output(self.left_in1_pin, GPIO.HIGH)
-                GPIO.output(self.left_in2_pin, GPIO.LOW)
-                self.left_pwm.ChangeDutyCycle(speed)
-            elif direction == 'backward':
-                GPIO.output(self.left_in1_pin, GPIO.LOW)
-                GPIO.output(self.left_in2_pin, GPIO.HIGH)
-                self.left_pwm.ChangeDutyCycle(speed)
-            else:  # stop
-                GPIO.output(self.left_in1_pin, GPIO.LOW)
-                GPIO.output(self.left_in2_pin, GPIO.LOW)
-                self.left_pwm.ChangeDutyCycle(0)
+        self._left_state = self._apply(
+            self._left_state, self.left_in1_pin, self.left_in2_pin,
+            self.left_pwm_pin, direction, speed
+        )
     
     def set_right_motor(self, direction: Literal['forward', 'backward', 'stop'], speed: int = 60):
         """
@@ -120,48 +120,10 @@ class MotorController:
             direction: 方向 ('forward', 'backward', 'stop')
             speed: 速度 (0-100)
         """
-        try:
-            # 確保 GPIO mode 已設定
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)
-        except RuntimeError:
-            # 如果已經設定過，則忽略
-            pass
-        
-        speed = max(0, min(100, speed))  # 限制速度範圍
-        
-        try:
-            if direction == 'forward':
-                GPIO.output(self.right_in3_pin, GPIO.HIGH)
-                GPIO.output(self.right_in4_pin, GPIO.LOW)
-                self.right_pwm.ChangeDutyCycle(speed)
-            elif direction == 'backward':
-                GPIO.output(self.right_in3_pin, GPIO.LOW)
-                GPIO.output(self.right_in4_pin, GPIO.HIGH)
-                self.right_pwm.ChangeDutyCycle(speed)
-            else:  # stop
-                GPIO.output(self.right_in3_pin, GPIO.LOW)
-                GPIO.output(self.right_in4_pin, GPIO.LOW)
-                self.right_pwm.ChangeDutyCycle(0)
-        except RuntimeError:
-            # 如果 GPIO 已被清理，重新設定
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)
-            GPIO.setup(self.right_in3_pin, GPIO.OUT)
-            GPIO.setup(self.right_in4_pin, GPIO.OUT)
-            # 重新執行操作
-            if direction == 'forward':
-                GPIO.output(self.right_in3_pin, GPIO.HIGH)
-                GPIO.output(self.right_in4_pin, GPIO.LOW)
-                self.right_pwm.ChangeDutyCycle(speed)
-            elif direction == 'backward':
-                GPIO.output(self.right_in3_pin, GPIO.LOW)
-                GPIO.output(self.right_in4_pin, GPIO.HIGH)
-                self.right_pwm.ChangeDutyCycle(speed)
-            else:  # stop
-                GPIO.output(self.right_in3_pin, GPIO.LOW)
-                GPIO.output(self.right_in4_pin, GPIO.LOW)
-                self.right_pwm.ChangeDutyCycle(0)
+        self._right_state = self._apply(
+            self._right_state, self.right_in3_pin, self.right_in4_pin,
+            self.right_pwm_pin, direction, speed
+        )
     
     def move_forward(self, speed: int = 60):
         """
@@ -226,31 +188,8 @@ class MotorController:
     def stop(self):
         """停止所有馬達"""
         try:
-            # 確保 GPIO mode 已設定
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)
             self.set_left_motor('stop')
             self.set_right_motor('stop')
-        except RuntimeError:
-            # 如果 GPIO 已被清理，重新設定並停止馬達
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)
-            # 重新設定 GPIO 腳位
-            GPIO.setup(self.left_in1_pin, GPIO.OUT)
-            GPIO.setup(self.left_in2_pin, GPIO.OUT)
-            GPIO.setup(self.right_in3_pin, GPIO.OUT)
-            GPIO.setup(self.right_in4_pin, GPIO.OUT)
-            # 設定為停止狀態
-            GPIO.output(self.left_in1_pin, GPIO.LOW)
-            GPIO.output(self.left_in2_pin, GPIO.LOW)
-            GPIO.output(self.right_in3_pin, GPIO.LOW)
-            GPIO.output(self.right_in4_pin, GPIO.LOW)
-            # 停止 PWM
-            try:
-                self.left_pwm.ChangeDutyCycle(0)
-                self.right_pwm.ChangeDutyCycle(0)
-            except Exception:
-                pass
         except Exception:
             # 其他錯誤則忽略
             pass
@@ -276,8 +215,8 @@ class MotorController:
             # 停止馬達
             self.stop()
             # 停止 PWM
-            self.left_pwm.stop()
-            self.right_pwm.stop()
+            self.driver.stop_pwm(self.left_pwm_pin)
+            self.driver.stop_pwm(self.right_pwm_pin)
         except Exception:
             # 如果 PWM 已被停止，則忽略錯誤
             pass
@@ -0,0 +1,398 @@
+"""
+GPIO 腳位驅動抽象層
+提供可替換的 PWM / 數位輸出後端：
+- pigpio      : 使用 pigpiod 的 DMA / 硬體 PWM（建議）
+- sysfs       : 使用核心 /sys/class/pwm 硬體 PWM
+- rpigpio     : RPi.GPIO 軟體 PWM（相容舊行為）
+- fake        : 純 Python 假驅動，供離線測試使用
+
+所有後端皆在建立時完成一次性設定（setmode / export），
+熱路徑只剩一次 duty 寫入。
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+from config import VehicleConfig
+
+# 樹莓派 BCM 腳位與硬體 PWM 通道對應（PWM0: 12/18，PWM1: 13/19）
+HARDWARE_PWM_CHANNELS = {12: 0, 18: 0, 13: 1, 19: 1}
+
+
+class PinDriver:
+    """腳位驅動基底類別"""
+
+    name = 'base'
+
+    def setup_output(self, pin: int, initial: bool = False):
+        """
+        設定數位輸出腳位
+
+        Args:
+            pin: BCM 腳位
+            initial: 初始電位
+        """
+        raise NotImplementedError
+
+    def setup_pwm(self, pin: int, frequency: int, duty: float = 0.0):
+        """
+        設定 PWM 腳位並以指定 duty 啟動
+
+        Args:
+            pin: BCM 腳位
+            frequency: PWM 頻率 (Hz)
+            duty: 初始 duty cycle (0-100)
+        """
+        raise NotImplementedError
+
+    def write(self, pin: int, value: bool):
+        """
+        寫入數位輸出
+
+        Args:
+            pin: BCM 腳位
+            value: True 為 HIGH，False 為 LOW
+        """
+        raise NotImplementedError
+
+    def set_duty(self, pin: int, duty: float):
+        """
+        設定 PWM duty cycle
+
+        Args:
+            pin: BCM 腳位
+            duty: duty cycle (0-100)
+        """
+        raise NotImplementedError
+
+    def stop_pwm(self, pin: int):
+        """停止指定腳位的 PWM 輸出"""
+        raise NotImplementedError
+
+    def release(self):
+        """釋放驅動資源（不調用 GPIO.cleanup）"""
+        pass
+
+
+class RPiGPIODriver(PinDriver):
+    """RPi.GPIO 軟體 PWM 驅動（每個腳位一個計時執行緒）"""
+
+    name = 'rpigpio'
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        # 只在建立時設定一次
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+        self._outputs: Dict[int, bool] = {}
+        self._pwms: Dict[int, Tuple[object, int, float]] = {}
+
+    def _restore(self):
+        """GPIO 被其他模組 cleanup 後，重新設定所有已知腳位"""
+        GPIO = self.GPIO
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+        for pin, value in self._outputs.items():
+            GPIO.setup(pin, GPIO.OUT, initial=GPIO.HIGH if value else GPIO.LOW)
+        for pin, (_, frequency, duty) in list(self._pwms.items()):
+            GPIO.setup(pin, GPIO.OUT)
+            pwm = GPIO.PWM(pin, frequency)
+            pwm.start(duty)
+            self._pwms[pin] = (pwm, frequency, duty)
+
+    def setup_output(self, pin: int, initial: bool = False):
+        GPIO = self.GPIO
+        GPIO.setup(pin, GPIO.OUT, initial=GPIO.HIGH if initial else GPIO.LOW)
+        self._outputs[pin] = initial
+
+    def setup_pwm(self, pin: int, frequency: int, duty: float = 0.0):
+        GPIO = self.GPIO
+        GPIO.setup(pin, GPIO.OUT)
+        pwm = GPIO.PWM(pin, frequency)
+        pwm.start(duty)
+        self._pwms[pin] = (pwm, frequency, duty)
+
+    def write(self, pin: int, value: bool):
+        self._outputs[pin] = value
+        try:
+            self.GPIO.output(pin, self.GPIO.HIGH if value else self.GPIO.LOW)
+        except RuntimeError:
+            # 如果 GPIO 已被清理，重新設定後再寫入
+            self._restore()
+            self.GPIO.output(pin, self.GPIO.HIGH if value else self.GPIO.LOW)
+
+    def set_duty(self, pin: int, duty: float):
+        pwm, frequency, _ = self._pwms[pin]
+        self._pwms[pin] = (pwm, frequency, duty)
+        try:
+            pwm.ChangeDutyCycle(duty)
+        except RuntimeError:
+            self._restore()
+            self._pwms[pin][0].ChangeDutyCycle(duty)
+
+    def stop_pwm(self, pin: int):
+        entry = self._pwms.pop(pin, None)
+        if entry is not None:
+            try:
+                entry[0].stop()
+            except Exception:
+                pass
+
+
+class PigpioDriver(PinDriver):
+    """pigpio 驅動：硬體 PWM 腳位使用 hardware_PWM，其餘使用 DMA 定時 PWM"""
+
+    name = 'pigpio'
+
+    # DMA PWM 的解析度（duty 0-100 對應 0-1000）
+    PWM_RANGE = 1000
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None):
+        import pigpio
+        self.pigpio = pigpio
+        kwargs = {}
+        if host:
+            kwargs['host'] = host
+        if port:
+            kwargs['port'] = port
+        self.pi = pigpio.pi(**kwargs)
+        if not self.pi.connected:
+            raise RuntimeError('無法連線至 pigpiod（請先執行 sudo pigpiod）')
+        self._hardware: Dict[int, int] = {}  # pin -> frequency
+        self._claimed_channels: Dict[int, int] = {}  # channel -> pin
+
+    def setup_output(self, pin: int, initial: bool = False):
+        self.pi.set_mode(pin, self.pigpio.OUTPUT)
+        self.pi.write(pin, 1 if initial else 0)
+
+    def setup_pwm(self, pin: int, frequency: int, duty: float = 0.0):
+        self.pi.set_mode(pin, self.pigpio.OUTPUT)
+        channel = HARDWARE_PWM_CHANNELS.get(pin)
+        if channel is not None and channel not in self._claimed_channels:
+            # 同一硬體通道只能輸出一組頻率，先到先得
+            self._claimed_channels[channel] = pin
+            self._hardware[pin] = frequency
+            self.pi.hardware_PWM(pin, frequency, int(duty * 10000))
+        else:
+            self.pi.set_PWM_frequency(pin, frequency)
+            self.pi.set_PWM_range(pin, self.PWM_RANGE)
+            self.pi.set_PWM_dutycycle(pin, int(duty * self.PWM_RANGE / 100))
+
+    def write(self, pin: int, value: bool):
+        self.pi.write(pin, 1 if value else 0)
+
+    def set_duty(self, pin: int, duty: float):
+        frequency = self._hardware.get(pin)
+        if frequency is not None:
+            # hardware_PWM 的 duty 單位為百萬分之一
+            self.pi.hardware_PWM(pin, frequency, int(duty * 10000))
+        else:
+            self.pi.set_PWM_dutycycle(pin, int(duty * self.PWM_RANGE / 100))
+
+    def stop_pwm(self, pin: int):
+        if pin in self._hardware:
+            self.pi.hardware_PWM(pin, 0, 0)
+            del self._hardware[pin]
+            for channel, owner in list(self._claimed_channels.items()):
+                if owner == pin:
+                    del self._claimed_channels[channel]
+        else:
+            self.pi.set_PWM_dutycycle(pin, 0)
+
+    def release(self):
+        try:
+            self.pi.stop()
+        except Exception:
+            pass
+
+
+class SysfsPWMDriver(PinDriver):
+    """
+    核心 /sys/class/pwm 硬體 PWM 驅動
+
+    需在 /boot/config.txt 啟用 dtoverlay=pwm-2chan。
+    只有硬體 PWM 通道由核心輸出，數位腳位與無法分配通道的 PWM
+    交由 fallback 驅動處理。
+    """
+
+    name = 'sysfs'
+
+    def __init__(self, chip: str = '/sys/class/pwm/pwmchip0', fallback: Optional[PinDriver] = None):
+        if not os.path.isdir(chip):
+            raise RuntimeError(f'找不到 PWM 晶片: {chip}')
+        self.chip = chip
+        self.fallback = fallback if fallback is not None else RPiGPIODriver()
+        self._periods: Dict[int, int] = {}  # pin -> period (ns)
+        self._duty_fds: Dict[int, int] = {}  # pin -> 開啟中的 duty_cycle 檔案描述子
+        self._claimed_channels: Dict[int, int] = {}  # channel -> pin
+
+    def _channel_path(self, channel: int) -> str:
+        return os.path.join(self.chip, f'pwm{channel}')
+
+    def _write_attr(self, channel: int, attr: str, value):
+        with open(os.path.join(self._channel_path(channel), attr), 'w') as f:
+            f.write(str(value))
+
+    def setup_output(self, pin: int, initial: bool = False):
+        self.fallback.setup_output(pin, initial)
+
+    def setup_pwm(self, pin: int, frequency: int, duty: float = 0.0):
+        channel = HARDWARE_PWM_CHANNELS.get(pin)
+        if channel is None or channel in self._claimed_channels:
+            self.fallback.setup_pwm(pin, frequency, duty)
+            return
+
+        if not os.path.isdir(self._channel_path(channel)):
+            with open(os.path.join(self.chip, 'export'), 'w') as f:
+                f.write(str(channel))
+
+        period = int(1e9 / frequency)
+        # 先將 duty 歸零，避免新 period 小於舊 duty 時寫入失敗
+        self._write_attr(channel, 'duty_cycle', 0)
+        self._write_attr(channel, 'period', period)
+        self._write_attr(channel, 'enable', 1)
+
+        self._claimed_channels[channel] = pin
+        self._periods[pin] = period
+        # 保持 duty_cycle 檔案開啟，熱路徑只需一次 pwrite 系統呼叫
+        self._duty_fds[pin] = os.open(os.path.join(self._channel_path(channel), 'duty_cycle'), os.O_WRONLY)
+        self.set_duty(pin, duty)
+
+    def write(self, pin: int, value: bool):
+        self.fallback.write(pin, value)
+
+    def set_duty(self, pin: int, duty: float):
+        fd = self._duty_fds.get(pin)
+        if fd is None:
+            self.fallback.set_duty(pin, duty)
+            return
+        os.pwrite(fd, str(int(self._periods[pin] * duty / 100)).encode(), 0)
+
+    def stop_pwm(self, pin: int):
+        fd = self._duty_fds.pop(pin, None)
+        if fd is None:
+            self.fallback.stop_pwm(pin)
+            return
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+        for channel, owner in list(self._claimed_channels.items()):
+            if owner == pin:
+                self._write_attr(channel, 'enable', 0)
+                del self._claimed_channels[channel]
+        self._periods.pop(pin, None)
+
+    def release(self):
+        for pin in list(self._duty_fds):
+            try:
+                self.stop_pwm(pin)
+            except Exception:
+                pass
+        self.fallback.release()
+
+
+class FakePinDriver(PinDriver):
+    """純 Python 假驅動，記錄所有腳位狀態與寫入歷程"""
+
+    name = 'fake'
+
+    def __init__(self):
+        self.outputs: Dict[int, bool] = {}
+        self.pwm: Dict[int, Dict[str, float]] = {}
+        self.history: List[Tuple[str, int, float]] = []
+
+    def setup_output(self, pin: int, initial: bool = False):
+        self.outputs[pin] = initial
+
+    def setup_pwm(self, pin: int, frequency: int, duty: float = 0.0):
+        self.pwm[pin] = {'frequency': frequency, 'duty': duty}
+
+    def write(self, pin: int, value: bool):
+        self.outputs[pin] = value
+        self.history.append(('write', pin, 1.0 if value else 0.0))
+
+    def set_duty(self, pin: int, duty: float):
+        self.pwm[pin]['duty'] = duty
+        self.history.append(('duty', pin, duty))
+
+    def stop_pwm(self, pin: int):
+        if pin in self.pwm:
+            self.pwm[pin]['duty'] = 0.0
+
+
+def create_pin_driver(backend: str = 'auto') -> PinDriver:
+    """
+    建立腳位驅動
+
+    Args:
+        backend: 'auto'、'pigpio'、'sysfs'、'rpigpio' 或 'fake'；
+                 'auto' 依序嘗試 pigpio → sysfs → rpigpio → fake
+
+    Returns:
+        PinDriver: 驅動實例
+    """
+    backend = (backend or 'auto').lower()
+    config = VehicleConfig()
+    factories = {
+        'pigpio': lambda: PigpioDriver(config.PIGPIO_HOST or None),
+        'sysfs': lambda: SysfsPWMDriver(config.SYSFS_PWM_CHIP),
+        'rpigpio': RPiGPIODriver,
+        'fake': FakePinDriver,
+    }
+
+    if backend != 'auto':
+        if backend not in factories:
+            raise ValueError(f'未知的腳位驅動: {backend}')
+        return factories[backend]()
+
+    for name in ('pigpio', 'sysfs', 'rpigpio'):
+        try:
+            driver = factories[name]()
+            print(f"腳位驅動: {name}")
+            return driver
+        except Exception as e:
+            print(f"腳位驅動 {name} 不可用: {e}")
+
+    print("警告: 無可用的 GPIO 驅動，使用假驅動（不會控制實體腳位）")
+    return FakePinDriver()
+
+
+_default_driver: Optional[PinDriver] = None
+
+
+def get_pin_driver() -> PinDriver:
+    """
+    取得共用的腳位驅動（第一次呼叫時依 PIN_DRIVER 配置建立）
+
+    Returns:
+        PinDriver: 共用驅動實例
+    """
+    global _default_driver
+    if _default_driver is None:
+        _default_driver = create_pin_driver(VehicleConfig.PIN_DRIVER)
+    return _default_driver
+
+
+def set_pin_driver(driver: Optional[PinDriver]):
+    """
+    替換共用的腳位驅動（測試或模擬器使用）
+
+    Args:
+        driver: 新驅動，None 表示下次呼叫 get_pin_driver() 時重新建立
+    """
+    global _default_driver
+    _default_driver = driver
+
+
+__all__ = [
+    'PinDriver',
+    'RPiGPIODriver',
+    'PigpioDriver',
+    'SysfsPWMDriver',
+    'FakePinDriver',
+    'create_pin_driver',
+    'get_pin_driver',
+    'set_pin_driver',
+]
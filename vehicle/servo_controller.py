@@ -3,13 +3,17 @@
 控制兩個 360 度伺服馬達升起警示牌
 """
 
-import RPi.GPIO as GPIO
-import time
+from concurrent.futures import Future
+from typing import Optional
+
+from actuation import complete_after, gather
+from pin_driver import PinDriver, get_pin_driver
 
 class ServoController:
     """伺服馬達控制類別"""
     
-    def __init__(self, servo1_pin: int = 12, servo2_pin: int = 13, frequency: int = 50):
+    def __init__(self, servo1_pin: int = 12, servo2_pin: int = 13, frequency: int = 50,
+                 driver: Optional[PinDriver] = None):
         """
         初始化伺服控制器
         
@@ -17,26 +21,19 @@ class ServoController:
             servo1_pin: 伺服 1 GPIO 腳位
             servo2_pin: 伺服 2 GPIO 腳位
             frequency: PWM 頻率 (Hz)，標準伺服為 50Hz
+            driver: 腳位驅動，None 則使用共用驅動（pigpio / sysfs / RPi.GPIO）
         """
-        # GPIO 設定
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
+        # 腳位驅動（GPIO 模式只在驅動建立時設定一次）
+        self.driver = driver if driver is not None else get_pin_driver()
         
         self.servo1_pin = servo1_pin
         self.servo2_pin = servo2_pin
         self.frequency = frequency
         
-        # 設定 GPIO 為輸出
-        GPIO.setup(self.servo1_pin, GPIO.OUT)
-        GPIO.setup(self.servo2_pin, GPIO.OUT)
-        
-        # 建立 PWM 物件
-        self.servo1_pwm = GPIO.PWM(self.servo1_pin, self.frequency)
-        self.servo2_pwm = GPIO.PWM(self.servo2_pin, self.frequency)
-        
-        # 啟動 PWM（初始角度為 0）
-        self.servo1_pwm.start(0)
-        self.servo2_pwm.start(0)
+        # 建立並啟動 PWM（初始 duty 為 0）
+        self.driver.setup_pwm(self.servo1_pin, self.frequency, 0)
+        self.driver.setup_pwm(self.servo2_pin, self.frequency, 0)
+        self._pins = {1: self.servo1_pin, 2: self.servo2_pin}
         
         # 角度範圍（360 度伺服）
         self.min_angle = 0
@@ -46,24 +43,22 @@ class ServoController:
         self.raise_angle = 90
         self.lower_angle = 0
         
+        # 伺服轉動所需時間（秒）
+        self.settle_time = 0.3
+        
         print("伺服控制器已初始化")
     
-    def set_angle(self, servo_num: int, angle: float):
+    def set_angle(self, servo_num: int, angle: float) -> Future:
         """
-        設定伺服角度
+        設定伺服角度（立即返回，不等待伺服轉動）
         
         Args:
             servo_num: 伺服編號 (1 或 2)
             angle: 角度 (0-180)
-        """
-        try:
-            # 確保 GPIO mode 已設定
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)
-        except RuntimeError:
-            # 如果已經設定過，則忽略
-            pass
         
+        Returns:
+            Future: 伺服轉動完成時完成，結果為設定的角度
+        """
         # 限制角度範圍
         angle = max(self.min_angle, min(self.max_angle, angle))
         
@@ -74,30 +69,12 @@ class ServoController:
         # 180 度 = 12.5% duty cycle
         duty_cycle = 2.5 + (angle / 180.0) * 10.0
         
-        try:
-            if servo_num == 1:
-                self.servo1_pwm.ChangeDutyCycle(duty_cycle)
-            elif servo_num == 2:
-                self.servo2_pwm.ChangeDutyCycle(duty_cycle)
-        except RuntimeError:
-            # 如果 GPIO 已被清理，重新設定
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)
-            GPIO.setup(self.servo1_pin, GPIO.OUT)
-            GPIO.setup(self.servo2_pin, GPIO.OUT)
-            # 重新建立 PWM 物件
-            self.servo1_pwm = GPIO.PWM(self.servo1_pin, self.frequency)
-            self.servo2_pwm = GPIO.PWM(self.servo2_pin, self.frequency)
-            self.servo1_pwm.start(0)
-            self.servo2_pwm.start(0)
-            # 重新執行操作
-            if servo_num == 1:
-                self.servo1_pwm.ChangeDutyCycle(duty_cycle)
-            elif servo_num == 2:
-                self.servo2_pwm.ChangeDutyCycle(duty_cycle)
-        
-        # 等待伺服轉動
-        time.sleep(0.3)
+        pin = self._pins.get(servo_num)
+        if pin is not None:
+            self.driver.set_duty(pin, duty_cycle)
+        
+        # 由計時輪在伺服轉動完成後完成 Future
+        return complete_after(self.settle_time, angle)
     
     def set_raise_angle(self, angle: float):
         """
@@ -117,26 +94,42 @@ class ServoController:
         """
         self.lower_angle = angle
     
-    def raise_sign(self):
-        """升起警示牌"""
+    def raise_sign(self) -> Future:
+        """
+        升起警示牌（兩個伺服同時轉動）
+        
+        Returns:
+            Future: 兩個伺服都轉動完成時完成
+        """
         print("升起警示牌...")
-        self.set_angle(1, self.raise_angle)
-        self.set_angle(2, self.raise_angle)
-        print("警示牌已升起")
+        done = gather(
+            self.set_angle(1, self.raise_angle),
+            self.set_angle(2, self.raise_angle)
+        )
+        done.add_done_callback(lambda _: print("警示牌已升起"))
+        return done
     
-    def lower_sign(self):
-        """降下警示牌"""
+    def lower_sign(self) -> Future:
+        """
+        降下警示牌（兩個伺服同時轉動）
+        
+        Returns:
+            Future: 兩個伺服都轉動完成時完成
+        """
         print("降下警示牌...")
-        self.set_angle(1, self.lower_angle)
-        self.set_angle(2, self.lower_angle)
-        print("警示牌已降下")
+        done = gather(
+            self.set_angle(1, self.lower_angle),
+            self.set_angle(2, self.lower_angle)
+        )
+        done.add_done_callback(lambda _: print("警示牌已降下"))
+        return done
     
     def cleanup(self):
         """清理 GPIO 資源（只清理本模組，不調用 GPIO.cleanup）"""
         try:
             # 停止 PWM
-            self.servo1_pwm.stop()
-            self.servo2_pwm.stop()
+            self.driver.stop_pwm(self.servo1_pin)
+            self.driver.stop_pwm(self.servo2_pin)
         except Exception:
             # 如果 PWM 已被停止，則忽略錯誤
             pass
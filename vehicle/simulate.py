@@ -0,0 +1,148 @@
+"""
+硬體迴路模擬執行腳本
+以假 BMduino、pty 虛擬 GPS、模擬攝影機與假 GPIO 驅動
+端對端執行 SafetyVehicle.execute_safety_protocol，並可加速模擬時間。
+
+使用方式：
+    python simulate.py --speed-limit 60 --scale 20
+    python simulate.py --track recorded.nmea --video road.mp4
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from config import VehicleConfig
+from pin_driver import FakePinDriver, set_pin_driver
+from simulation import (
+    FakeBMduino,
+    NMEAGenerator,
+    RecordedTrack,
+    ScaledClock,
+    VehicleKinematics,
+    install_clock,
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='自動安全警示車硬體迴路模擬')
+    parser.add_argument('--speed-limit', type=int, default=None, help='道路速限（km/h）')
+    parser.add_argument('--scale', type=float, default=20.0, help='模擬時間加速倍率')
+    parser.add_argument('--lat', type=float, default=25.0330, help='起點緯度')
+    parser.add_argument('--lon', type=float, default=121.5654, help='起點經度')
+    parser.add_argument('--heading', type=float, default=0.0, help='車頭方位角（度）')
+    parser.add_argument('--max-speed', type=float, default=1.0, help='速度 100 時的車速（公尺/秒）')
+    parser.add_argument('--track', default=None, help='重播錄製軌跡（.csv 或 NMEA 記錄檔），取代運動模型位置')
+    parser.add_argument('--video', default=None, help='以影片檔作為攝影機來源，預設使用合成影像')
+    parser.add_argument('--fix-delay', type=float, default=2.0, help='GPS 冷啟動無效定位秒數')
+    parser.add_argument('--backend', default='http://127.0.0.1:9', help='後端 URL（預設為不可連線位址）')
+    parser.add_argument('--web-port', type=int, default=8081, help='車載端 Web API 埠號')
+    return parser.parse_args(argv)
+
+
+def build_camera_factory(args, clock):
+    """建立 VisionModule.capture_factory（忽略攝影機索引）"""
+    from simulation.camera import SyntheticCamera, VideoFileCamera
+
+    if args.video:
+        return lambda index: VideoFileCamera(args.video, clock=clock)
+    return lambda index: SyntheticCamera(clock=clock)
+
+
+def run_simulation(args) -> dict:
+    """
+    執行一次端對端模擬
+
+    Args:
+        args: parse_args() 的結果
+
+    Returns:
+        dict: 模擬結果摘要
+    """
+    clock = ScaledClock(args.scale)
+
+    # 假 GPIO 驅動（馬達 / 警示音模組仍會建立，但不控制實體腳位）
+    set_pin_driver(FakePinDriver())
+
+    # 虛擬序列裝置
+    kinematics = VehicleKinematics(args.lat, args.lon, args.heading, args.max_speed)
+    bmduino = FakeBMduino(kinematics, clock=clock)
+    if args.track:
+        if args.track.lower().endswith('.csv'):
+            track = RecordedTrack.from_csv(args.track)
+        else:
+            track = RecordedTrack.from_nmea(args.track)
+        gps = NMEAGenerator(track=track, clock=clock, fix_delay=args.fix_delay)
+    else:
+        gps = NMEAGenerator(position_fn=kinematics.position, clock=clock, fix_delay=args.fix_delay)
+    bmduino.start()
+    gps.start()
+
+    # 指向虛擬裝置
+    VehicleConfig.GPS_SERIAL_PORT = gps.port
+    VehicleConfig.BMDUINO_PORT = bmduino.port
+    VehicleConfig.BACKEND_URL = args.backend
+    VehicleConfig.WEB_API_PORT = args.web_port
+    # 上行佇列使用暫存檔，不留下上次模擬未送出的事故
+    uplink_dir = tempfile.mkdtemp(prefix='uplink-')
+    VehicleConfig.UPLINK_DB_PATH = os.path.join(uplink_dir, 'uplink.db')
+
+    import actuation
+    import bmduino_controller
+    import gps_module
+    import main as vehicle_main
+    install_clock(clock, [actuation, bmduino_controller, gps_module, vehicle_main])
+
+    vehicle = vehicle_main.SafetyVehicle()
+    vehicle.vision.capture_factory = build_camera_factory(args, clock)
+
+    real_start = time.perf_counter()
+    sim_start = clock.monotonic()
+    try:
+        vehicle.execute_safety_protocol(args.speed_limit, hold=False)
+    finally:
+        real_elapsed = time.perf_counter() - real_start
+        sim_elapsed = clock.monotonic() - sim_start
+        # 讓假 BMduino 處理完佇列中的指令（警報、LED、清理）
+        bmduino.wait_idle()
+        gps.stop()
+        bmduino.stop()
+
+    return {
+        'real_seconds': real_elapsed,
+        'sim_seconds': sim_elapsed,
+        'target_distance': vehicle.target_distance,
+        'odometer': kinematics.odometer,
+        'sign_raised': 'S U' in [line.upper() for _, line in bmduino.commands],
+        'led': bmduino.led,
+        'commands': [line for _, line in bmduino.commands],
+        'gps_sentences': gps.sentences_sent,
+        'uplink': vehicle.uplink.stats(),
+    }
+
+
+def main(argv=None):
+    """主函式"""
+    args = parse_args(argv)
+    result = run_simulation(args)
+
+    print("\n" + "=" * 50)
+    print("模擬結果")
+    print("=" * 50)
+    print(f"模擬時間: {result['sim_seconds']:.1f} 秒（真實 {result['real_seconds']:.1f} 秒，"
+          f"{result['sim_seconds'] / max(result['real_seconds'], 1e-9):.1f}x）")
+    print(f"目標距離: {result['target_distance']} 公尺，實際行駛: {result['odometer']:.1f} 公尺")
+    print(f"警示牌: {'已升起' if result['sign_raised'] else '未升起'}，最終 LED: {result['led']}")
+    print(f"BMduino 指令: {', '.join(result['commands'])}")
+    print(f"GPS 語句數: {result['gps_sentences']}")
+    print(f"上行佇列: 待送事故 {result['uplink']['pending_accidents']}，"
+          f"待送位置 {result['uplink']['pending_positions']}")
+
+    ok = result['odometer'] >= result['target_distance'] and result['sign_raised']
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
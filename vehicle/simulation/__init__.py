@@ -0,0 +1,27 @@
+"""
+硬體迴路模擬套件
+在沒有樹莓派與周邊硬體的環境下執行車載端控制流程：
+- clock        : 可加速的模擬時鐘
+- pty_device   : pty 虛擬序列裝置基底
+- nmea         : NMEA 軌跡重播 / 合成 GPS
+- fake_bmduino : 依韌體協定回應並積分車輛運動的假 BMduino
+- camera       : 影片檔 / 合成影像攝影機來源（需 OpenCV，請直接 import simulation.camera）
+"""
+
+from simulation.clock import ScaledClock, install_clock
+from simulation.pty_device import PtyDevice
+from simulation.nmea import NMEAGenerator, RecordedTrack, SyntheticTrack, build_rmc, build_gga
+from simulation.fake_bmduino import FakeBMduino, VehicleKinematics
+
+__all__ = [
+    'ScaledClock',
+    'install_clock',
+    'PtyDevice',
+    'NMEAGenerator',
+    'RecordedTrack',
+    'SyntheticTrack',
+    'build_rmc',
+    'build_gga',
+    'FakeBMduino',
+    'VehicleKinematics',
+]
@@ -0,0 +1,148 @@
+"""
+模擬攝影機來源
+提供與 cv2.VideoCapture 相容的介面（isOpened / read / set / get / release），
+可指定給 VisionModule.capture_factory 取代實體攝影機。
+"""
+
+import time
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+class _PacedSource:
+    """依指定 fps 節流的影像來源基底（模擬實體攝影機的擷取間隔）"""
+
+    def __init__(self, fps: Optional[float], clock):
+        self.fps = fps
+        self.clock = clock
+        self._next_frame = None
+        self.width = None
+        self.height = None
+
+    def _pace(self):
+        if not self.fps:
+            return
+        now = self.clock.monotonic()
+        if self._next_frame is None:
+            self._next_frame = now
+        wait = self._next_frame - now
+        if wait > 0:
+            self.clock.sleep(wait)
+        self._next_frame = max(self._next_frame, now) + 1.0 / self.fps
+
+    def _resize(self, frame: np.ndarray) -> np.ndarray:
+        if self.width and self.height and frame.shape[1::-1] != (self.width, self.height):
+            return cv2.resize(frame, (self.width, self.height))
+        return frame
+
+    def set(self, prop_id: int, value: float) -> bool:
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+        elif prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+        elif prop_id == cv2.CAP_PROP_FPS:
+            self.fps = float(value) if value else None
+        return True
+
+    def get(self, prop_id: int) -> float:
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width or 0)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height or 0)
+        if prop_id == cv2.CAP_PROP_FPS:
+            return float(self.fps or 0)
+        return 0.0
+
+
+class VideoFileCamera(_PacedSource):
+    """以影片檔（或影像序列）模擬攝影機，可循環播放"""
+
+    def __init__(self, path: str, loop: bool = True, fps: Optional[float] = None, clock=time):
+        """
+        Args:
+            path: 影片路徑（cv2.VideoCapture 可讀取的任何來源）
+            loop: 播放結束後是否從頭開始
+            fps: 擷取頻率，None 則使用影片本身的 fps
+            clock: 時鐘（time 模組或 ScaledClock）
+        """
+        self.cap = cv2.VideoCapture(path)
+        super().__init__(fps or self.cap.get(cv2.CAP_PROP_FPS) or None, clock)
+        self.path = path
+        self.loop = loop
+        self.frames_read = 0
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        self._pace()
+        ret, frame = self.cap.read()
+        if not ret and self.loop and self.frames_read > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if not ret:
+            return False, None
+        self.frames_read += 1
+        return True, self._resize(frame)
+
+    def release(self):
+        self.cap.release()
+
+
+class SyntheticCamera(_PacedSource):
+    """合成影像攝影機：路面背景加上橫向移動的障礙物方塊"""
+
+    def __init__(self, width: int = 640, height: int = 480, fps: Optional[float] = 30.0,
+                 obstacle: bool = True, clock=time):
+        """
+        Args:
+            width: 影像寬度
+            height: 影像高度
+            fps: 擷取頻率，None 則不節流
+            obstacle: 是否繪製障礙物
+            clock: 時鐘（time 模組或 ScaledClock）
+        """
+        super().__init__(fps, clock)
+        self.width = width
+        self.height = height
+        self.obstacle = obstacle
+        self.frames_read = 0
+        self.opened = True
+        self._background = None
+
+    def _build_background(self) -> np.ndarray:
+        # 由上到下漸亮的灰色路面與中央車道線
+        gradient = np.linspace(60, 140, self.height, dtype=np.uint8)[:, None]
+        frame = np.repeat(np.repeat(gradient, self.width, axis=1)[:, :, None], 3, axis=2)
+        cx = self.width // 2
+        for y in range(0, self.height, 40):
+            cv2.line(frame, (cx, y), (cx, y + 20), (220, 220, 220), 3)
+        return frame
+
+    def isOpened(self) -> bool:
+        return self.opened
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.opened:
+            return False, None
+        self._pace()
+        if self._background is None or self._background.shape[:2] != (self.height, self.width):
+            self._background = self._build_background()
+        frame = self._background.copy()
+        if self.obstacle:
+            size = self.height // 5
+            span = self.width - size
+            x = int((self.frames_read * 4) % (2 * span))
+            x = x if x < span else 2 * span - x
+            y = self.height // 2
+            cv2.rectangle(frame, (x, y), (x + size, y + size), (30, 30, 200), -1)
+        self.frames_read += 1
+        return True, frame
+
+    def release(self):
+        self.opened = False
+
+
+__all__ = ['VideoFileCamera', 'SyntheticCamera']
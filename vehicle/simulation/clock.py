@@ -0,0 +1,70 @@
+"""
+模擬時鐘
+以固定倍率加速 time.time / time.monotonic / time.sleep，
+讓控制流程可以比真實時間更快執行。
+"""
+
+import time as _time
+from typing import Iterable
+
+
+class ScaledClock:
+    """可加速的時鐘，介面與 time 模組相容（time / monotonic / perf_counter / sleep）"""
+
+    def __init__(self, scale: float = 1.0):
+        """
+        初始化模擬時鐘
+
+        Args:
+            scale: 加速倍率，例如 20 表示模擬 20 秒只需真實 1 秒
+        """
+        if scale <= 0:
+            raise ValueError('scale 必須大於 0')
+        self.scale = scale
+        self._base_real = _time.perf_counter()
+        self._base_wall = _time.time()
+        self._base_monotonic = _time.monotonic()
+
+    def _elapsed(self) -> float:
+        return (_time.perf_counter() - self._base_real) * self.scale
+
+    def time(self) -> float:
+        """模擬的 Unix 時間"""
+        return self._base_wall + self._elapsed()
+
+    def monotonic(self) -> float:
+        """模擬的單調時鐘"""
+        return self._base_monotonic + self._elapsed()
+
+    def perf_counter(self) -> float:
+        """模擬的高解析度計時器"""
+        return self._base_real + self._elapsed()
+
+    def sleep(self, seconds: float):
+        """
+        依倍率縮短的 sleep
+
+        Args:
+            seconds: 模擬秒數
+        """
+        if seconds > 0:
+            _time.sleep(seconds / self.scale)
+
+    def __getattr__(self, name):
+        # 其餘函式（strftime、gmtime 等）直接使用 time 模組
+        return getattr(_time, name)
+
+
+def install_clock(clock: ScaledClock, modules: Iterable):
+    """
+    將模組中的 `time` 參照替換為模擬時鐘
+
+    Args:
+        clock: 模擬時鐘
+        modules: 以 `import time` 使用時間函式的模組
+    """
+    for module in modules:
+        module.time = clock
+
+
+__all__ = ['ScaledClock', 'install_clock']
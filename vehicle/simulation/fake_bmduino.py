@@ -0,0 +1,232 @@
+"""
+假 BMduino
+在 pty 上實作與 bmduino_firmware.ino 相同的文字協定，
+並以簡單的運動模型積分車輛位置，供模擬 GPS 輸出。
+
+單獨執行可提供一個虛擬序列埠給硬體測試腳本：
+    python -m simulation.fake_bmduino
+    BMDUINO_PORT=<顯示的路徑> python test_motor.py
+"""
+
+import threading
+import time
+from typing import List, Tuple
+
+from simulation.nmea import offset_position
+from simulation.pty_device import PtyDevice
+
+
+class VehicleKinematics:
+    """履帶車一維運動模型（沿固定方位前進/後退，含一階加速響應）"""
+
+    def __init__(self, lat: float = 25.0330, lon: float = 121.5654, heading: float = 0.0,
+                 max_speed_mps: float = 1.0, response_time: float = 0.3):
+        """
+        Args:
+            lat: 起點緯度
+            lon: 起點經度
+            heading: 車頭方位角（度，0 為北）
+            max_speed_mps: 速度 100 時的車速（公尺/秒）
+            response_time: 速度響應時間常數（秒）
+        """
+        self.lat = lat
+        self.lon = lon
+        self.heading = heading
+        self.max_speed_mps = max_speed_mps
+        self.response_time = response_time
+        self.target_speed = 0.0  # 公尺/秒，後退為負值
+        self.speed = 0.0
+        self.odometer = 0.0
+        self.lock = threading.Lock()
+
+    def set_command(self, direction: str, speed: int):
+        """
+        套用馬達指令
+
+        Args:
+            direction: 'F'、'B' 或 'S'
+            speed: 0-100
+        """
+        speed = max(0, min(100, speed))
+        value = self.max_speed_mps * speed / 100.0
+        with self.lock:
+            if direction == 'F':
+                self.target_speed = value
+            elif direction == 'B':
+                self.target_speed = -value
+            else:
+                self.target_speed = 0.0
+
+    def step(self, dt: float):
+        """
+        積分 dt 秒
+
+        Args:
+            dt: 時間步長（秒）
+        """
+        if dt <= 0:
+            return
+        with self.lock:
+            alpha = min(1.0, dt / self.response_time) if self.response_time > 0 else 1.0
+            self.speed += (self.target_speed - self.speed) * alpha
+            distance = self.speed * dt
+            if distance:
+                self.lat, self.lon = offset_position(self.lat, self.lon, distance, self.heading)
+                self.odometer += abs(distance)
+
+    def position(self) -> Tuple[float, float]:
+        """目前位置 (緯度, 經度)"""
+        with self.lock:
+            return self.lat, self.lon
+
+
+class FakeBMduino(PtyDevice):
+    """pty 假 BMduino，行為依照 bmduino_firmware.ino"""
+
+    # 與韌體相同的阻塞時間
+    SIGN_DELAY = 0.5
+    ALARM_RANGE = (1, 10)
+
+    def __init__(self, kinematics: VehicleKinematics = None, clock=time, physics_hz: float = 50.0):
+        """
+        Args:
+            kinematics: 運動模型，None 則建立預設模型
+            clock: 時鐘（time 模組或 ScaledClock）
+            physics_hz: 運動模型積分頻率（模擬時間）
+        """
+        super().__init__('fake-bmduino')
+        self.kinematics = kinematics if kinematics is not None else VehicleKinematics()
+        self.clock = clock
+        self.physics_hz = physics_hz
+
+        # 韌體狀態
+        self.motor = ('S', 0)
+        self.servo_angles = [0, 0]
+        self.alarm_playing = False
+        self.led = 0
+        self.commands: List[Tuple[float, str]] = []
+        self.busy = False
+        self._last_activity = clock.monotonic()
+
+    def start(self):
+        super().start()
+        self.spawn(self._serial_loop, 'fake-bmduino-serial')
+        self.spawn(self._physics_loop, 'fake-bmduino-physics')
+        self.write_line('BMduino Ready')
+        self.write_line('Commands: M F/B/S <speed>, S U/D, A P <secs>, L S <value>')
+        print(f"假 BMduino 已啟動: {self.port}")
+
+    @property
+    def sign_raised(self) -> bool:
+        """警示牌是否已升起"""
+        return self.servo_angles[0] >= 90 and self.servo_angles[1] >= 90
+
+    def _serial_loop(self):
+        for line in self.read_lines():
+            if line:
+                self.busy = True
+                self.commands.append((self.clock.monotonic(), line))
+                self.process_command(line)
+                self.busy = False
+                self._last_activity = self.clock.monotonic()
+
+    def wait_idle(self, quiet: float = 1.0, timeout: float = 30.0) -> bool:
+        """
+        等待佇列中的指令處理完畢（連續 quiet 秒沒有新指令）
+
+        Args:
+            quiet: 判定閒置所需的無指令秒數（模擬時間）
+            timeout: 最長等待秒數（模擬時間）
+
+        Returns:
+            bool: 是否在逾時前進入閒置
+        """
+        deadline = self.clock.monotonic() + timeout
+        while self.clock.monotonic() < deadline:
+            if not self.busy and self.clock.monotonic() - self._last_activity >= quiet:
+                return True
+            self.clock.sleep(0.05)
+        return False
+
+    def _physics_loop(self):
+        dt = 1.0 / self.physics_hz
+        last = self.clock.monotonic()
+        while self.running:
+            self.clock.sleep(dt)
+            now = self.clock.monotonic()
+            self.kinematics.step(now - last)
+            last = now
+
+    @staticmethod
+    def _to_int(value: str) -> int:
+        # 與 Arduino String.toInt() 相同：無法解析時為 0
+        try:
+            return int(value)
+        except ValueError:
+            return 0
+
+    def process_command(self, cmd: str):
+        """
+        處理一行指令（與韌體 processCommand 相同的解析方式）
+
+        Args:
+            cmd: 不含換行的指令
+        """
+        parts = cmd.strip().upper().split(' ')
+        cmd_type = parts[0] if parts else ''
+        param1 = parts[1] if len(parts) > 1 else ''
+        param2 = parts[2] if len(parts) > 2 else ''
+
+        if cmd_type == 'M':
+            if param1 in ('F', 'B'):
+                speed = max(0, min(100, self._to_int(param2)))
+                self.motor = (param1, speed)
+                self.kinematics.set_command(param1, speed)
+            elif param1 == 'S':
+                self.motor = ('S', 0)
+                self.kinematics.set_command('S', 0)
+        elif cmd_type == 'S':
+            if param1 in ('U', 'D'):
+                angle = 90 if param1 == 'U' else 0
+                self.servo_angles = [angle, angle]
+                # 韌體 delay(500)：期間不處理後續指令，但馬達持續運轉
+                self.clock.sleep(self.SIGN_DELAY)
+        elif cmd_type == 'A':
+            if param1 == 'P':
+                low, high = self.ALARM_RANGE
+                duration = max(low, min(high, self._to_int(param2)))
+                self.alarm_playing = True
+                self.clock.sleep(duration)
+                self.alarm_playing = False
+        elif cmd_type == 'L':
+            if param1 == 'S':
+                self.led = max(0, min(255, self._to_int(param2)))
+
+
+__all__ = ['VehicleKinematics', 'FakeBMduino']
+
+
+def main():
+    """單獨執行假 BMduino（配合 test_motor.py / test_servo.py 使用）"""
+    device = FakeBMduino()
+    device.start()
+    print(f"請設定 BMDUINO_PORT={device.port}")
+    print("按 Ctrl+C 停止")
+    try:
+        last_count = 0
+        while True:
+            time.sleep(0.5)
+            for _, line in device.commands[last_count:]:
+                lat, lon = device.kinematics.position()
+                print(f"收到指令: {line:<10} 馬達={device.motor} 伺服={device.servo_angles} "
+                      f"LED={device.led} 位置=({lat:.6f}, {lon:.6f})")
+            last_count = len(device.commands)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        device.stop()
+
+
+if __name__ == '__main__':
+    main()
+
@@ -0,0 +1,290 @@
+"""
+NMEA GPS 模擬
+產生 $GPRMC / $GPGGA 語句，可重播錄製軌跡、合成直線軌跡，
+或跟隨假 BMduino 的車輛運動模型輸出位置。
+"""
+
+import bisect
+import csv
+import math
+import time
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Tuple
+
+from simulation.pty_device import PtyDevice
+
+EARTH_METERS_PER_DEGREE = 111320.0
+
+
+def _checksum(body: str) -> str:
+    value = 0
+    for ch in body:
+        value ^= ord(ch)
+    return f'{value:02X}'
+
+
+def _format_coordinate(value: float, is_latitude: bool) -> Tuple[str, str]:
+    """將十進位度數轉為 NMEA 的 ddmm.mmmm / dddmm.mmmm 與半球"""
+    hemisphere = ('N' if value >= 0 else 'S') if is_latitude else ('E' if value >= 0 else 'W')
+    value = abs(value)
+    degrees = int(value)
+    minutes = (value - degrees) * 60
+    width = 2 if is_latitude else 3
+    return f'{degrees:0{width}d}{minutes:07.4f}', hemisphere
+
+
+def _parse_coordinate(field: str, hemisphere: str) -> Optional[float]:
+    """將 NMEA 的 ddmm.mmmm 轉為十進位度數"""
+    if not field:
+        return None
+    dot = field.index('.') if '.' in field else len(field)
+    degrees = float(field[:dot - 2])
+    minutes = float(field[dot - 2:])
+    value = degrees + minutes / 60
+    return -value if hemisphere in ('S', 'W') else value
+
+
+def build_rmc(lat: float, lon: float, timestamp: float, speed_mps: float = 0.0,
+              course: float = 0.0, valid: bool = True, talker: str = 'GP') -> str:
+    """
+    產生 RMC 語句
+
+    Args:
+        lat: 緯度
+        lon: 經度
+        timestamp: Unix 時間
+        speed_mps: 速度（公尺/秒）
+        course: 航向（度）
+        valid: 是否為有效定位（A/V）
+        talker: 前綴（GP / GN）
+
+    Returns:
+        str: 含檢查碼的 NMEA 語句
+    """
+    dt = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    lat_s, lat_h = _format_coordinate(lat, True)
+    lon_s, lon_h = _format_coordinate(lon, False)
+    knots = speed_mps * 1.943844
+    body = (f'{talker}RMC,{dt:%H%M%S}.{dt.microsecond // 10000:02d},{"A" if valid else "V"},'
+            f'{lat_s},{lat_h},{lon_s},{lon_h},{knots:.2f},{course:.1f},{dt:%d%m%y},,,A')
+    return f'${body}*{_checksum(body)}'
+
+
+def build_gga(lat: float, lon: float, timestamp: float, satellites: int = 8,
+              altitude: float = 10.0, talker: str = 'GP') -> str:
+    """
+    產生 GGA 語句
+
+    Args:
+        lat: 緯度
+        lon: 經度
+        timestamp: Unix 時間
+        satellites: 衛星數
+        altitude: 海拔（公尺）
+        talker: 前綴（GP / GN）
+
+    Returns:
+        str: 含檢查碼的 NMEA 語句
+    """
+    dt = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    lat_s, lat_h = _format_coordinate(lat, True)
+    lon_s, lon_h = _format_coordinate(lon, False)
+    body = (f'{talker}GGA,{dt:%H%M%S}.{dt.microsecond // 10000:02d},{lat_s},{lat_h},{lon_s},{lon_h},'
+            f'1,{satellites:02d},0.9,{altitude:.1f},M,0.0,M,,')
+    return f'${body}*{_checksum(body)}'
+
+
+def offset_position(lat: float, lon: float, distance: float, bearing: float) -> Tuple[float, float]:
+    """
+    以平面近似計算位移後的座標（短距離模擬足夠精確）
+
+    Args:
+        lat: 起點緯度
+        lon: 起點經度
+        distance: 位移距離（公尺）
+        bearing: 方位角（度，0 為北）
+
+    Returns:
+        Tuple[float, float]: (緯度, 經度)
+    """
+    rad = math.radians(bearing)
+    dlat = distance * math.cos(rad) / EARTH_METERS_PER_DEGREE
+    dlon = distance * math.sin(rad) / (EARTH_METERS_PER_DEGREE * math.cos(math.radians(lat)))
+    return lat + dlat, lon + dlon
+
+
+class SyntheticTrack:
+    """合成直線軌跡（固定速度與方位）"""
+
+    def __init__(self, lat: float = 25.0330, lon: float = 121.5654,
+                 speed_mps: float = 1.0, bearing: float = 180.0):
+        """
+        Args:
+            lat: 起點緯度
+            lon: 起點經度
+            speed_mps: 速度（公尺/秒）
+            bearing: 方位角（度）
+        """
+        self.lat = lat
+        self.lon = lon
+        self.speed_mps = speed_mps
+        self.bearing = bearing
+
+    def position_at(self, elapsed: float) -> Tuple[float, float]:
+        """
+        取得經過 elapsed 秒後的位置
+
+        Args:
+            elapsed: 自軌跡開始的秒數
+
+        Returns:
+            Tuple[float, float]: (緯度, 經度)
+        """
+        return offset_position(self.lat, self.lon, self.speed_mps * elapsed, self.bearing)
+
+
+class RecordedTrack:
+    """錄製軌跡（線性內插），可由 CSV 或 NMEA 記錄檔載入"""
+
+    def __init__(self, points: List[Tuple[float, float, float]]):
+        """
+        Args:
+            points: [(相對秒數, 緯度, 經度), ...]，依時間排序
+        """
+        if not points:
+            raise ValueError('軌跡至少需要一個點')
+        self.points = sorted(points)
+        self.times = [p[0] for p in self.points]
+
+    @classmethod
+    def from_csv(cls, path: str) -> 'RecordedTrack':
+        """
+        由 CSV 載入（欄位：t, latitude, longitude；t 為秒）
+
+        Args:
+            path: CSV 路徑
+        """
+        points = []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                points.append((float(row['t']), float(row['latitude']), float(row['longitude'])))
+        t0 = points[0][0] if points else 0.0
+        return cls([(t - t0, lat, lon) for t, lat, lon in points])
+
+    @classmethod
+    def from_nmea(cls, path: str, interval: float = 1.0) -> 'RecordedTrack':
+        """
+        由 NMEA 記錄檔載入（取有效的 RMC 語句，每筆間隔 interval 秒）
+
+        Args:
+            path: NMEA 記錄檔路徑
+            interval: 每個定位點的間隔秒數
+        """
+        points = []
+        with open(path, errors='ignore') as f:
+            for line in f:
+                fields = line.strip().split('*')[0].split(',')
+                if len(fields) < 7 or not fields[0].endswith('RMC') or fields[2] != 'A':
+                    continue
+                lat = _parse_coordinate(fields[3], fields[4])
+                lon = _parse_coordinate(fields[5], fields[6])
+                if lat is not None and lon is not None:
+                    points.append((len(points) * interval, lat, lon))
+        return cls(points)
+
+    def position_at(self, elapsed: float) -> Tuple[float, float]:
+        """
+        取得經過 elapsed 秒後的位置（超出範圍時停在端點）
+
+        Args:
+            elapsed: 自軌跡開始的秒數
+
+        Returns:
+            Tuple[float, float]: (緯度, 經度)
+        """
+        i = bisect.bisect_right(self.times, elapsed)
+        if i <= 0:
+            return self.points[0][1:]
+        if i >= len(self.points):
+            return self.points[-1][1:]
+        t0, lat0, lon0 = self.points[i - 1]
+        t1, lat1, lon1 = self.points[i]
+        ratio = (elapsed - t0) / (t1 - t0) if t1 > t0 else 0.0
+        return lat0 + (lat1 - lat0) * ratio, lon0 + (lon1 - lon0) * ratio
+
+
+class NMEAGenerator(PtyDevice):
+    """pty 虛擬 GPS：依固定頻率輸出 NMEA 語句"""
+
+    def __init__(self, track=None, position_fn: Optional[Callable[[], Tuple[float, float]]] = None,
+                 rate_hz: float = 1.0, clock=time, include_gga: bool = False,
+                 fix_delay: float = 0.0, talker: str = 'GN'):
+        """
+        Args:
+            track: 具 position_at(elapsed) 的軌跡物件
+            position_fn: 直接回傳目前位置的函式（例如假 BMduino 的運動模型），優先於 track
+            rate_hz: 輸出頻率
+            clock: 時鐘（time 模組或 ScaledClock）
+            include_gga: 是否同時輸出 GGA
+            fix_delay: 開始後多少秒內輸出無效定位（模擬冷啟動）
+            talker: NMEA 前綴
+        """
+        super().__init__('nmea-generator')
+        if track is None and position_fn is None:
+            track = SyntheticTrack(speed_mps=0.0)
+        self.track = track
+        self.position_fn = position_fn
+        self.rate_hz = rate_hz
+        self.clock = clock
+        self.include_gga = include_gga
+        self.fix_delay = fix_delay
+        self.talker = talker
+        self.sentences_sent = 0
+
+    def current_position(self, elapsed: float) -> Tuple[float, float]:
+        """取得目前應輸出的位置"""
+        if self.position_fn is not None:
+            return self.position_fn()
+        return self.track.position_at(elapsed)
+
+    def start(self):
+        super().start()
+        self.spawn(self._run)
+        print(f"模擬 GPS 已啟動: {self.port}")
+
+    def _run(self):
+        start = self.clock.monotonic()
+        interval = 1.0 / self.rate_hz
+        next_fix = start
+        last = None
+        while self.running:
+            now = self.clock.monotonic()
+            elapsed = now - start
+            lat, lon = self.current_position(elapsed)
+            valid = elapsed >= self.fix_delay
+            speed, course = 0.0, 0.0
+            if last is not None:
+                dlat = (lat - last[0]) * EARTH_METERS_PER_DEGREE
+                dlon = (lon - last[1]) * EARTH_METERS_PER_DEGREE * math.cos(math.radians(lat))
+                speed = math.hypot(dlat, dlon) / interval
+                course = math.degrees(math.atan2(dlon, dlat)) % 360
+            last = (lat, lon)
+
+            timestamp = self.clock.time()
+            self.write_line(build_rmc(lat, lon, timestamp, speed, course, valid, self.talker))
+            if self.include_gga and valid:
+                self.write_line(build_gga(lat, lon, timestamp, talker=self.talker))
+            self.sentences_sent += 1
+
+            next_fix += interval
+            self.clock.sleep(max(0.0, next_fix - self.clock.monotonic()))
+
+
+__all__ = [
+    'build_rmc',
+    'build_gga',
+    'offset_position',
+    'SyntheticTrack',
+    'RecordedTrack',
+    'NMEAGenerator',
+]
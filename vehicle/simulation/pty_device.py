@@ -0,0 +1,93 @@
+"""
+pty 虛擬序列裝置
+以 os.openpty() 建立一對虛擬終端，待測程式以 pyserial 開啟 slave 路徑，
+模擬器在 master 端讀寫，行為與真實 UART 裝置相同。
+"""
+
+import os
+import threading
+import tty
+from typing import Optional
+
+
+class PtyDevice:
+    """pty 虛擬序列裝置基底類別"""
+
+    def __init__(self, name: str = 'pty-device'):
+        """
+        建立 pty
+
+        Args:
+            name: 裝置名稱（用於執行緒與日誌）
+        """
+        self.name = name
+        self.master_fd, self.slave_fd = os.openpty()
+        # raw 模式：關閉回顯與換行轉換，避免裝置讀到自己寫出的資料
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+        self.running = False
+        self.threads = []
+        self._write_lock = threading.Lock()
+
+    def write_line(self, line: str):
+        """
+        寫出一行（自動加上 \\r\\n）
+
+        Args:
+            line: 不含換行的字串
+        """
+        data = (line + '\r\n').encode('ascii', errors='ignore')
+        with self._write_lock:
+            try:
+                os.write(self.master_fd, data)
+            except OSError:
+                pass
+
+    def read_lines(self):
+        """
+        逐行讀取待測程式寫入的資料（產生器，裝置關閉時結束）
+
+        Yields:
+            str: 去除換行的一行
+        """
+        buffer = b''
+        while self.running:
+            try:
+                chunk = os.read(self.master_fd, 256)
+            except OSError:
+                return
+            if not chunk:
+                return
+            buffer += chunk
+            while b'\n' in buffer:
+                raw, buffer = buffer.split(b'\n', 1)
+                yield raw.decode('utf-8', errors='ignore').strip()
+
+    def spawn(self, target, name: Optional[str] = None):
+        """
+        以 daemon 執行緒執行裝置迴圈
+
+        Args:
+            target: 執行緒函式
+            name: 執行緒名稱
+        """
+        thread = threading.Thread(target=target, name=name or self.name, daemon=True)
+        self.threads.append(thread)
+        thread.start()
+        return thread
+
+    def start(self):
+        """啟動裝置（子類別覆寫並呼叫 spawn）"""
+        self.running = True
+
+    def stop(self):
+        """停止裝置並關閉 pty"""
+        self.running = False
+        for fd in (self.master_fd, self.slave_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+__all__ = ['PtyDevice']
@@ -0,0 +1,58 @@
+"""
+計時輪測試腳本
+不需硬體，確認 TimerWheel 的排程、取消與閒置停住後的喚醒
+
+使用方式：
+    python test_actuation.py
+"""
+
+import threading
+import sys
+from actuation import TimerWheel
+
+
+def test_cancel_after_fire():
+    """到期後再取消同一事件，之後排程的事件仍須執行"""
+    wheel = TimerWheel()
+    first = threading.Event()
+    second = threading.Event()
+    try:
+        entry = wheel.schedule(0.02, first.set)
+        assert first.wait(1.0), '第一個事件沒有執行'
+        wheel.cancel(entry)
+        assert wheel.pending == 0, f'pending 應為 0，實際為 {wheel.pending}'
+
+        # 計時執行緒此時已停住，必須被新的排程喚醒
+        wheel.schedule(0.02, second.set)
+        assert second.wait(1.0), '到期後取消再排程的事件沒有執行'
+    finally:
+        wheel.stop()
+
+
+def test_cancel_before_fire():
+    """到期前取消的事件不執行，重複取消不影響其他事件"""
+    wheel = TimerWheel()
+    cancelled = threading.Event()
+    kept = threading.Event()
+    try:
+        entry = wheel.schedule(0.05, cancelled.set)
+        wheel.schedule(0.1, kept.set)
+        wheel.cancel(entry)
+        wheel.cancel(entry)
+        assert wheel.pending == 1, f'pending 應為 1，實際為 {wheel.pending}'
+        assert kept.wait(1.0), '未取消的事件沒有執行'
+        assert not cancelled.is_set(), '已取消的事件被執行'
+    finally:
+        wheel.stop()
+
+
+if __name__ == '__main__':
+    ok = True
+    for test in (test_cancel_after_fire, test_cancel_before_fire):
+        try:
+            test()
+            print(f'✓ {test.__name__}')
+        except AssertionError as e:
+            print(f'✗ {test.__name__}: {e}')
+            ok = False
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,541 @@
+"""
+上行傳輸模組
+事故上報與位置回報先寫入 SQLite 磁碟佇列再立即返回，
+由背景執行緒以保持連線的 requests.Session 送到後端，
+失敗時指數退避重試，程式重新啟動後繼續送出未完成的項目。
+
+- 事故：逐筆送出，帶 report_id 讓後端去除重送造成的重複；關鍵幀以 BLOB 存在
+  attachments 資料表，以 multipart/form-data 傳送原始 JPEG（不做 base64）
+- 位置：累積到 UPLINK_BATCH_SIZE 筆或最舊一筆超過 UPLINK_BATCH_INTERVAL 秒時
+  以單次 /api/update_device 請求送出；離線時最多保留 UPLINK_POSITION_BACKLOG 筆
+- 後端回應 400 / 422 表示資料本身有誤，項目標記為 dead 保留在磁碟中；其他錯誤（401、403、408、413、
+  429、5xx、連線失敗）可能來自權杖輪替或代理設定，以退避持續重試
+- dead 的事故在每次啟動時重新排入佇列，也可用 python uplink.py --requeue 手動重送
+- 心跳：每 UPLINK_HEARTBEAT_INTERVAL 秒回報影像串流位址（不寫入磁碟，失敗只等下一次）
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import VehicleConfig
+from metrics import metrics
+
+KIND_ACCIDENT = 'accident'
+KIND_POSITION = 'position'
+
+# 只有這些狀態碼表示資料本身有誤（重送也不會成功）
+DEAD_STATUSES = (400, 422)
+
+
+class UplinkQueue:
+    """SQLite 磁碟佇列（WAL 模式，可由多個執行緒共用）"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 資料庫檔案路徑（':memory:' 僅供測試）
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # WAL + NORMAL：斷電最多遺失最後一次 checkpoint 後的交易，不會損毀資料庫
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS outbox ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' kind TEXT NOT NULL,'
+            ' payload TEXT NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' dead INTEGER NOT NULL DEFAULT 0)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS outbox_kind ON outbox (kind, dead, id)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS attachments ('
+            ' outbox_id INTEGER NOT NULL REFERENCES outbox (id) ON DELETE CASCADE,'
+            ' position INTEGER NOT NULL,'
+            ' content_type TEXT NOT NULL,'
+            ' data BLOB NOT NULL,'
+            ' PRIMARY KEY (outbox_id, position))'
+        )
+
+    def put(self, kind: str, payload: dict, attachments: Optional[List[Tuple[str, bytes]]] = None) -> int:
+        """
+        加入項目（寫入磁碟後才返回）
+
+        Args:
+            kind: 項目類型
+            payload: JSON 可序列化的資料
+            attachments: 附件 [(MIME 類型, 位元組), ...]，與項目在同一交易寫入
+
+        Returns:
+            int: 項目 ID
+        """
+        text = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                cursor = self.conn.execute(
+                    'INSERT INTO outbox (kind, payload, created_at) VALUES (?, ?, ?)',
+                    (kind, text, time.time())
+                )
+                item_id = cursor.lastrowid
+                if attachments:
+                    self.conn.executemany(
+                        'INSERT INTO attachments (outbox_id, position, content_type, data) VALUES (?, ?, ?, ?)',
+                        [(item_id, i, content_type, sqlite3.Binary(data))
+                         for i, (content_type, data) in enumerate(attachments)]
+                    )
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            return item_id
+
+    def attachments(self, item_id: int) -> List[Tuple[str, bytes]]:
+        """
+        取得項目的附件（送出時才讀取）
+
+        Args:
+            item_id: 項目 ID
+
+        Returns:
+            List[Tuple[str, bytes]]: [(MIME 類型, 位元組), ...]
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT content_type, data FROM attachments WHERE outbox_id = ? ORDER BY position',
+                (item_id,)
+            ).fetchall()
+        return [(row[0], bytes(row[1])) for row in rows]
+
+    def peek(self, kind: str, limit: int) -> List[Tuple[int, dict, float]]:
+        """
+        取得最舊的待送項目（不移除）
+
+        Args:
+            kind: 項目類型
+            limit: 最多筆數
+
+        Returns:
+            List[Tuple[int, dict, float]]: (ID, 資料, 加入時間)
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT id, payload, created_at FROM outbox WHERE kind = ? AND dead = 0 ORDER BY id LIMIT ?',
+                (kind, limit)
+            ).fetchall()
+        return [(row[0], json.loads(row[1]), row[2]) for row in rows]
+
+    def delete(self, ids: List[int]):
+        """移除已送出的項目"""
+        if not ids:
+            return
+        with self.lock:
+            self.conn.executemany('DELETE FROM outbox WHERE id = ?', [(i,) for i in ids])
+
+    def mark_failed(self, ids: List[int], dead: bool = False):
+        """
+        記錄一次失敗
+
+        Args:
+            ids: 項目 ID
+            dead: 是否不再重試
+        """
+        with self.lock:
+            self.conn.executemany(
+                'UPDATE outbox SET attempts = attempts + 1, dead = ? WHERE id = ?',
+                [(1 if dead else 0, i) for i in ids]
+            )
+
+    def requeue_dead(self, kind: Optional[str] = None) -> int:
+        """
+        將 dead 項目重新排入佇列（重設重試次數）
+
+        Args:
+            kind: 項目類型，None 表示全部
+
+        Returns:
+            int: 重新排入的筆數
+        """
+        with self.lock:
+            if kind is None:
+                cursor = self.conn.execute('UPDATE outbox SET dead = 0, attempts = 0 WHERE dead = 1')
+            else:
+                cursor = self.conn.execute('UPDATE outbox SET dead = 0, attempts = 0 WHERE kind = ? AND dead = 1',
+                                           (kind,))
+            return cursor.rowcount
+
+    def trim(self, kind: str, keep: int) -> int:
+        """
+        只保留最新的 keep 筆待送項目
+
+        Returns:
+            int: 移除的筆數
+        """
+        with self.lock:
+            cursor = self.conn.execute(
+                'DELETE FROM outbox WHERE kind = ? AND dead = 0 AND id NOT IN '
+                '(SELECT id FROM outbox WHERE kind = ? AND dead = 0 ORDER BY id DESC LIMIT ?)',
+                (kind, kind, keep)
+            )
+            return cursor.rowcount
+
+    def count(self, kind: Optional[str] = None, dead: bool = False) -> int:
+        """待送（或 dead）項目數"""
+        with self.lock:
+            if kind is None:
+                row = self.conn.execute('SELECT COUNT(*) FROM outbox WHERE dead = ?', (int(dead),)).fetchone()
+            else:
+                row = self.conn.execute('SELECT COUNT(*) FROM outbox WHERE kind = ? AND dead = ?',
+                                        (kind, int(dead))).fetchone()
+        return row[0]
+
+    def close(self):
+        """關閉資料庫"""
+        with self.lock:
+            self.conn.close()
+
+
+class Uplink:
+    """上行傳輸：磁碟佇列 + 背景送出執行緒"""
+
+    def __init__(self, backend_url: str, api_token: str, path: str = 'uplink.db',
+                 batch_size: int = 50, batch_interval: float = 2.0, position_backlog: int = 5000,
+                 backoff_min: float = 1.0, backoff_max: float = 60.0, timeout: float = 10.0):
+        """
+        Args:
+            backend_url: 後端 URL
+            api_token: API 權杖
+            path: 佇列資料庫路徑
+            batch_size: 每次送出的位置筆數上限
+            batch_interval: 位置最多延遲幾秒送出
+            position_backlog: 離線時最多保留的位置筆數（事故不受限制）
+            backoff_min: 第一次重試等待秒數
+            backoff_max: 重試等待上限（秒）
+            timeout: 單次請求逾時（秒）
+        """
+        self.backend_url = backend_url.rstrip('/')
+        self.queue = UplinkQueue(path)
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.position_backlog = position_backlog
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {api_token}'
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+        self.failures = 0
+        self.retry_at = 0.0
+        self.sent = {KIND_ACCIDENT: 0, KIND_POSITION: 0}
+        self.positions_since_trim = 0
+        self.wakeup = threading.Event()
+        self.idle = threading.Event()
+        self.flushing = False
+        self.heartbeat_payload: Optional[dict] = None
+        self.heartbeat_interval = 30.0
+        self.next_heartbeat = 0.0
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """啟動送出執行緒（重複呼叫無副作用），並重新排入先前被拒絕的事故"""
+        if self.running:
+            return
+        # 後端設定修正（例如 API_TOKEN）後重新啟動即可補送，事故不會永久遺失
+        requeued = self.queue.requeue_dead(KIND_ACCIDENT)
+        if requeued:
+            print(f"重新排入 {requeued} 筆先前被拒絕的事故")
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='uplink', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 3.0):
+        """
+        停止送出執行緒，最多等待 timeout 秒送完佇列；未送出的項目保留在磁碟
+
+        Args:
+            timeout: 等待秒數
+        """
+        if self.running:
+            self.flush(timeout)
+            self.running = False
+            self.wakeup.set()
+            if self.thread is not None:
+                self.thread.join(timeout=self.timeout + 1)
+                self.thread = None
+        self.session.close()
+
+    def report_accident(self, accident_data: dict, images: Optional[List[bytes]] = None) -> str:
+        """
+        排入事故上報（立即返回）
+
+        Args:
+            accident_data: 事故資料
+            images: JPEG 關鍵幀（依時間順序）
+
+        Returns:
+            str: report_id（重送時後端以此去除重複）
+        """
+        payload = dict(accident_data)
+        payload.setdefault('report_id', uuid.uuid4().hex)
+        self.queue.put(KIND_ACCIDENT, payload, [('image/jpeg', data) for data in images or []])
+        self.wakeup.set()
+        return payload['report_id']
+
+    def update_position(self, device_id: str, latitude: float, longitude: float,
+                        timestamp: Optional[float] = None):
+        """
+        排入位置回報（立即返回，批次送出）
+
+        Args:
+            device_id: 裝置 ID
+            latitude: 緯度
+            longitude: 經度
+            timestamp: 取得位置的時間，預設為現在
+        """
+        self.queue.put(KIND_POSITION, {
+            'device_id': device_id,
+            'latitude': latitude,
+            'longitude': longitude,
+            'timestamp': timestamp if timestamp is not None else time.time()
+        })
+        self.positions_since_trim += 1
+        if self.positions_since_trim >= self.batch_size:
+            self.positions_since_trim = 0
+            dropped = self.queue.trim(KIND_POSITION, self.position_backlog)
+            if dropped:
+                print(f"上行佇列已滿，捨棄最舊的 {dropped} 筆位置")
+            self.wakeup.set()
+
+    def set_heartbeat(self, device_id: str, stream_url: str = '', stream_port: Optional[int] = None,
+                      interval: float = 30.0):
+        """
+        啟用定期心跳（向後端註冊影像串流位址）
+
+        Args:
+            device_id: 裝置 ID
+            stream_url: 後端可連線的車載端位址，空字串則由後端以來源位址與 stream_port 組成
+            stream_port: 車載端 Web API 埠號
+            interval: 心跳間隔（秒）
+        """
+        payload = {'device_id': device_id}
+        if stream_url:
+            payload['stream_url'] = stream_url
+        if stream_port is not None:
+            payload['stream_port'] = stream_port
+        self.heartbeat_payload = payload
+        self.heartbeat_interval = interval
+        self.next_heartbeat = 0.0
+        self.wakeup.set()
+
+    def _send_heartbeat(self):
+        """到期時送出心跳"""
+        if self.heartbeat_payload is None or time.monotonic() < self.next_heartbeat:
+            return
+        status = self._post('/api/device_heartbeat', self.heartbeat_payload)
+        ok = status is not None and 200 <= status < 300
+        # 失敗時較快重試，但不影響佇列的退避
+        self.next_heartbeat = time.monotonic() + (self.heartbeat_interval if ok else min(self.heartbeat_interval, 10.0))
+
+    def flush(self, timeout: float) -> bool:
+        """
+        等待佇列送完（包含未滿一批的位置）
+
+        Args:
+            timeout: 等待秒數
+
+        Returns:
+            bool: 是否已送完
+        """
+        deadline = time.monotonic() + timeout
+        self.flushing = True
+        try:
+            while self.queue.count() > 0:
+                remaining = deadline - time.monotonic()
+                # 退避結束前已到期限時不必等待
+                if remaining <= 0 or not self.running or self.retry_at > deadline:
+                    return False
+                self.idle.clear()
+                self.wakeup.set()
+                self.idle.wait(min(0.1, remaining))
+            return True
+        finally:
+            self.flushing = False
+
+    def stats(self) -> dict:
+        """佇列統計（有 dead 項目時輸出警告）"""
+        dead_accidents = self.queue.count(KIND_ACCIDENT, dead=True)
+        dead = self.queue.count(dead=True)
+        if dead:
+            print(f"警告: 上行佇列有 {dead} 筆被後端拒絕的項目（事故 {dead_accidents} 筆），"
+                  f"修正後可執行 python uplink.py --requeue 重送")
+        return {
+            'pending_accidents': self.queue.count(KIND_ACCIDENT),
+            'pending_positions': self.queue.count(KIND_POSITION),
+            'dead': dead,
+            'dead_accidents': dead_accidents,
+            'sent_accidents': self.sent[KIND_ACCIDENT],
+            'sent_positions': self.sent[KIND_POSITION],
+            'consecutive_failures': self.failures
+        }
+
+    def _backoff(self) -> float:
+        """下次重試前的等待秒數（指數退避加隨機抖動）"""
+        delay = min(self.backoff_max, self.backoff_min * (2 ** min(self.failures - 1, 16)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _post(self, path: str, body: dict, files: Optional[List[Tuple[str, bytes]]] = None) -> Optional[int]:
+        """送出請求（有附件時以 multipart/form-data），連線失敗回傳 None"""
+        start = metrics.now()
+        try:
+            url = f'{self.backend_url}{path}'
+            if files:
+                response = self.session.post(
+                    url,
+                    data={'metadata': json.dumps(body, ensure_ascii=False)},
+                    files=[('image', (f'keyframe_{i}.jpg', data, content_type))
+                           for i, (content_type, data) in enumerate(files)],
+                    timeout=self.timeout
+                )
+            else:
+                response = self.session.post(url, json=body, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f"上行傳輸失敗: {e}")
+            return None
+        finally:
+            metrics.observe('uplink_post', metrics.now() - start)
+        return response.status_code
+
+    def _deliver(self, kind: str, items: List[Tuple[int, dict, float]], status: Optional[int]) -> bool:
+        """依回應狀態移除或標記項目，回傳是否可以繼續送下一批"""
+        ids = [item[0] for item in items]
+        if status is not None and 200 <= status < 300:
+            self.queue.delete(ids)
+            self.sent[kind] += len(ids)
+            self.failures = 0
+            return True
+        if status in DEAD_STATUSES:
+            # 重送也不會成功（例如欄位錯誤），保留在磁碟中供事後檢查
+            print(f"上行項目被後端拒絕（{status}），已標記為 dead: {kind} {ids}")
+            self.queue.mark_failed(ids, dead=True)
+            return True
+        if status is not None:
+            # 401 / 403 可能是權杖輪替或設定錯誤，408 / 413 / 429 / 5xx 多為暫時性，皆退避重試
+            print(f"上行項目送出失敗（{status}），稍後重試: {kind} {ids}")
+        self.queue.mark_failed(ids)
+        self.failures += 1
+        self.retry_at = time.monotonic() + self._backoff()
+        return False
+
+    def _send_once(self) -> bool:
+        """
+        送出一批（事故優先）
+
+        Returns:
+            bool: 是否還有可立即送出的項目
+        """
+        accidents = self.queue.peek(KIND_ACCIDENT, 1)
+        if accidents:
+            item_id, payload, _ = accidents[0]
+            status = self._post('/api/report_accident', payload, self.queue.attachments(item_id))
+            if status is not None and 200 <= status < 300:
+                print("事故資料上報成功")
+            return self._deliver(KIND_ACCIDENT, accidents, status)
+
+        positions = self.queue.peek(KIND_POSITION, self.batch_size)
+        if not positions:
+            return False
+        oldest_age = time.time() - positions[0][2]
+        if len(positions) < self.batch_size and oldest_age < self.batch_interval and not self.flushing:
+            return False
+        status = self._post('/api/update_device', {'positions': [item[1] for item in positions]})
+        return self._deliver(KIND_POSITION, positions, status) and len(positions) == self.batch_size
+
+    def _run(self):
+        while self.running:
+            # 退避期間只等待，不送出（新事故也要等到重試時間）
+            if time.monotonic() >= self.retry_at:
+                try:
+                    self._send_heartbeat()
+                    while self.running and self._send_once():
+                        pass
+                except Exception as e:
+                    print(f"上行傳輸錯誤: {e}")
+                    self.failures += 1
+                    self.retry_at = time.monotonic() + self._backoff()
+            self.idle.set()
+            remaining = self.retry_at - time.monotonic()
+            self.wakeup.wait(remaining if remaining > 0 else self.batch_interval)
+            self.wakeup.clear()
+
+
+def create_uplink(config: VehicleConfig) -> Uplink:
+    """
+    依設定建立上行傳輸
+
+    Args:
+        config: 車載端配置
+
+    Returns:
+        Uplink: 尚未啟動的上行傳輸
+    """
+    uplink = Uplink(
+        config.BACKEND_URL,
+        config.API_TOKEN,
+        path=config.UPLINK_DB_PATH,
+        batch_size=config.UPLINK_BATCH_SIZE,
+        batch_interval=config.UPLINK_BATCH_INTERVAL,
+        position_backlog=config.UPLINK_POSITION_BACKLOG,
+        backoff_min=config.UPLINK_BACKOFF_MIN,
+        backoff_max=config.UPLINK_BACKOFF_MAX
+    )
+    uplink.set_heartbeat(
+        config.DEVICE_ID,
+        stream_url=config.VEHICLE_STREAM_URL,
+        stream_port=config.WEB_API_PORT,
+        interval=config.UPLINK_HEARTBEAT_INTERVAL
+    )
+    return uplink
+
+
+def main(argv=None) -> int:
+    """主函式：檢查上行佇列或重送被拒絕的項目"""
+    parser = argparse.ArgumentParser(description='上行佇列維護')
+    parser.add_argument('--db', default=VehicleConfig.UPLINK_DB_PATH, help='佇列資料庫路徑')
+    parser.add_argument('--requeue', action='store_true', help='將 dead 項目重新排入佇列')
+    parser.add_argument('--kind', choices=[KIND_ACCIDENT, KIND_POSITION], help='只處理指定類型')
+    args = parser.parse_args(argv)
+
+    queue = UplinkQueue(args.db)
+    try:
+        if args.requeue:
+            print(f"已重新排入 {queue.requeue_dead(args.kind)} 筆項目")
+        for kind in (KIND_ACCIDENT, KIND_POSITION):
+            print(f"{kind}: 待送 {queue.count(kind)}，dead {queue.count(kind, dead=True)}")
+    finally:
+        queue.close()
+    return 0
+
+
+__all__ = ['UplinkQueue', 'Uplink', 'create_uplink', 'KIND_ACCIDENT', 'KIND_POSITION', 'DEAD_STATUSES']
+
+
+if __name__ == '__main__':
+    sys.exit(main())
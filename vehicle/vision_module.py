@@ -9,6 +9,8 @@ import numpy as np
 from typing import Tuple, Optional, List
 import time
 
+from metrics import metrics
+
 class VisionModule:
     """視覺辨識模組類別"""
     
@@ -26,6 +28,8 @@ class VisionModule:
         self.confidence_threshold = confidence_threshold
         self.cap = None
         self.show_overlay = False  # 是否顯示偵測框
+        # 攝影機建立函式（模擬時可替換為影片檔或合成影像來源）
+        self.capture_factory = cv2.VideoCapture
         
         # 影像處理參數
         self.blur_kernel_size = 5
@@ -74,7 +78,7 @@ class VisionModule:
             bool: 是否成功開啟
         """
         try:
-            cap = cv2.VideoCapture(index)
+            cap = self.capture_factory(index)
             if not cap.isOpened():
                 return False
             
@@ -206,6 +210,7 @@ class VisionModule:
         
         return obstacles
     
+    @metrics.timed('detect_obstacles')
     def detect_obstacles(self, frame: np.ndarray) -> List[Tuple[int, int, int, int]]:
         """
         偵測障礙物（主要方法，結合多種演算法）
@@ -225,6 +230,7 @@ class VisionModule:
         
         return obstacles
     
+    @metrics.timed('avoidance_path')
     def calculate_avoidance_path(self, frame: np.ndarray, obstacles: List[Tuple[int, int, int, int]]) -> Optional[str]:
         """
         計算避障路徑
@@ -273,6 +279,7 @@ class VisionModule:
         else:
             return 'forward'
     
+    @metrics.timed('detect_people')
     def detect_people(self, frame: np.ndarray) -> List[Tuple[int, int, int, int]]:
         """
         使用 HOG+SVM 偵測畫面中的人形。
@@ -313,6 +320,7 @@ class VisionModule:
 
         return people
     
+    @metrics.timed('draw_overlay')
     def draw_detections(self, frame: np.ndarray, obstacles: List[Tuple[int, int, int, int]]) -> np.ndarray:
         """
         在影像上繪製偵測框
@@ -339,6 +347,7 @@ class VisionModule:
         
         return result_frame
     
+    @metrics.timed('frame_capture')
     def get_frame(self) -> Optional[np.ndarray]:
         """
         取得目前影像幀
@@ -1,19 +1,66 @@
 """
 車載端 Web API 模組
-提供即時影像串流服務（MJPEG）
+提供即時影像串流服務（MJPEG）與單張快照（/snapshot.jpg）
 支援接收參數控制是否顯示偵測框
+
+串流每編碼一幀即保留為該模式的最新快照，快照請求優先使用它，不重複擷取與編碼。
 """
 
-from flask import Flask, Response, request
+import threading
+import time
+import uuid
+from flask import Flask, Response, request, jsonify
+from werkzeug.serving import ThreadedWSGIServer
 import cv2
 from vision_module import VisionModule
 from config import VehicleConfig
+from metrics import metrics
 
 app = Flask(__name__)
 config = VehicleConfig()
 vision = None
 vision_module_instance = None  # 儲存主程式中的 vision 實例
 
+# 最新編碼幀 {overlay: (JPEG 位元組, 序號, time.monotonic())}
+latest_frames = {}
+latest_lock = threading.Lock()
+frame_sequence = 0
+# ETag 前綴（重新啟動後序號歸零，避免與舊的 ETag 相同）
+boot_id = uuid.uuid4().hex[:8]
+
+# 伺服器關閉時結束所有串流
+stopping = threading.Event()
+server = None
+
+class BoundedWSGIServer(ThreadedWSGIServer):
+    """
+    限制同時連線數的多執行緒 WSGI 伺服器
+    
+    每條直接觀看的串流都會在車上擷取並編碼影像，超過上限的連線直接回 503，
+    不讓樹莓派的 CPU 被觀看人數拖垮（一般觀看者經由後端轉送，車上只有一兩條連線）。
+    """
+    
+    def __init__(self, host: str, port: int, app, max_clients: int = 8):
+        super().__init__(host, port, app)
+        self.slots = threading.BoundedSemaphore(max_clients)
+    
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            try:
+                request.sendall(b'HTTP/1.1 503 Service Unavailable\r\n'
+                                b'Content-Length: 0\r\nRetry-After: 5\r\nConnection: close\r\n\r\n')
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        super().process_request(request, client_address)
+    
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.slots.release()
+
 def set_vision_instance(vision_instance):
     """設定視覺辨識模組實例（由主程式傳入）"""
     global vision_module_instance
@@ -36,30 +83,60 @@ def initialize_vision():
         vision.initialize_camera()
     return vision
 
-def generate_frames(show_overlay: bool = False):
+def store_frame(show_overlay: bool, jpeg: bytes):
     """
-    產生 MJPEG 影像串流
+    保留最新編碼幀供快照使用
+    
+    Args:
+        show_overlay: 此幀是否含偵測框
+        jpeg: JPEG 位元組
+    """
+    global frame_sequence
+    with latest_lock:
+        frame_sequence += 1
+        latest_frames[show_overlay] = (jpeg, frame_sequence, time.monotonic())
+
+def encode_frame(show_overlay: bool = False):
+    """
+    擷取並編碼一幀
     
     Args:
         show_overlay: 是否顯示偵測框
+    
+    Returns:
+        Optional[bytes]: JPEG 位元組，無影像或編碼失敗時為 None
     """
     vision_module = initialize_vision()
     vision_module.set_overlay(show_overlay)
     
-    while True:
-        result = vision_module.get_frame_with_detections()
-        if result is None:
-            continue
-        
-        frame, obstacles = result
-        
-        # 編碼為 JPEG
+    result = vision_module.get_frame_with_detections()
+    if result is None:
+        return None
+    
+    frame, obstacles = result
+    
+    # 編碼為 JPEG
+    with metrics.span('jpeg_encode'):
         ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-        if not ret:
+    if not ret:
+        return None
+    
+    frame_bytes = buffer.tobytes()
+    store_frame(show_overlay, frame_bytes)
+    return frame_bytes
+
+def generate_frames(show_overlay: bool = False):
+    """
+    產生 MJPEG 影像串流
+    
+    Args:
+        show_overlay: 是否顯示偵測框
+    """
+    while not stopping.is_set():
+        frame_bytes = encode_frame(show_overlay)
+        if frame_bytes is None:
             continue
         
-        frame_bytes = buffer.tobytes()
-        
         # MJPEG 格式
         yield (b'--frame\r\n'
                b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
@@ -79,17 +156,77 @@ def video_stream():
         mimetype='multipart/x-mixed-replace; boundary=frame'
     )
 
+@app.route('/snapshot.jpg')
+def snapshot():
+    """
+    最新一幀快照
+    
+    串流進行中時直接回傳最近編碼的幀（不超過 SNAPSHOT_MAX_AGE 秒），
+    否則即時擷取一幀。帶 If-None-Match 且仍是同一幀時回傳 304。
+    
+    Query Parameters:
+        overlay: true/false - 是否顯示偵測框
+    """
+    overlay = request.args.get('overlay', 'false').lower() == 'true'
+    
+    with latest_lock:
+        cached = latest_frames.get(overlay)
+    if cached is None or time.monotonic() - cached[2] > config.SNAPSHOT_MAX_AGE:
+        if encode_frame(overlay) is None:
+            return jsonify({'error': '無法取得影像'}), 503
+        with latest_lock:
+            cached = latest_frames[overlay]
+    
+    jpeg, sequence, captured = cached
+    response = Response(jpeg, mimetype='image/jpeg', headers={'Cache-Control': 'no-cache'})
+    response.set_etag(f'{boot_id}-{sequence}')
+    response.headers['X-Frame-Age'] = f'{time.monotonic() - captured:.3f}'
+    return response.make_conditional(request)
+
+@app.route('/metrics')
+def metrics_prometheus():
+    """
+    各階段耗時直方圖（Prometheus 文字格式）
+    """
+    return Response(
+        metrics.render_prometheus(),
+        mimetype='text/plain; version=0.0.4'
+    )
+
+@app.route('/metrics.json')
+def metrics_json():
+    """
+    各階段耗時快照（JSON，含 p50 / p95 / p99 估計值）
+    """
+    return jsonify(metrics.snapshot())
+
 def run_web_api(host='0.0.0.0', port=8080, debug=False):
     """
-    啟動 Web API 伺服器
+    啟動 Web API 伺服器（阻塞直到 stop_web_api）
+    
+    一般模式使用有連線上限的多執行緒伺服器，可在主程式的背景執行緒中執行；
+    debug 模式使用 Flask 開發伺服器。
     
     Args:
         host: 主機地址
         port: 埠號
         debug: 除錯模式
     """
+    global server
     print(f"啟動車載端 Web API 伺服器: http://{host}:{port}")
-    app.run(host=host, port=port, debug=debug, threaded=True)
+    if debug:
+        app.run(host=host, port=port, debug=debug, threaded=True)
+        return
+    stopping.clear()
+    server = BoundedWSGIServer(host, port, app, max_clients=config.WEB_API_MAX_CLIENTS)
+    server.serve_forever()
+
+def stop_web_api():
+    """停止 Web API 伺服器並結束所有串流（釋放攝影機前呼叫）"""
+    stopping.set()
+    if server is not None:
+        server.shutdown()
+        server.server_close()
 
 if __name__ == '__main__':
     run_web_api()